@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+把新快照推送给所有订阅者（Server-Sent Events）
+
+每次更新只序列化一次：完整快照帧和相对上一次更新的 diff 帧都在第一次需要时生成并缓存，
+所有订阅者共享同一份字节串。每个订阅者有一个有界队列，消费太慢时丢弃最旧的更新，
+并在下一次发送完整快照（丢失更新后 diff 无法衔接）。
+发布可以来自任意线程，订阅者在 asyncio 事件循环中读取。
+"""
+import asyncio
+import threading
+from collections import deque
+
+from payload_encoding import encode_json
+from snapshot_diff import diff_snapshots
+
+# 每个订阅者最多积压的更新数
+SUBSCRIBER_QUEUE_SIZE = 8
+
+
+def sse_frame(event: str, data, event_id: str = None) -> bytes:
+    """一个 SSE 事件"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {encode_json(data).decode()}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+class Update:
+    """一次更新，帧按需生成一次"""
+
+    def __init__(self, payload, previous=None):
+        self.payload = payload
+        self.previous = previous
+        self.version = payload.get("version")
+        self._snapshot_frame = None
+        self._diff_frame = None
+
+    @property
+    def snapshot_frame(self) -> bytes:
+        if self._snapshot_frame is None:
+            self._snapshot_frame = sse_frame("snapshot", self.payload, self.version)
+        return self._snapshot_frame
+
+    @property
+    def diff_frame(self) -> bytes:
+        """相对上一次更新的 diff；没有上一次更新时为完整快照"""
+        if self.previous is None:
+            return self.snapshot_frame
+        if self._diff_frame is None:
+            diff = {"version": self.version, "since": self.previous.get("version"),
+                    **diff_snapshots(self.previous, self.payload)}
+            self._diff_frame = sse_frame("diff", diff, self.version)
+        return self._diff_frame
+
+
+class Subscriber:
+    """单个连接的有界更新队列，只在所属事件循环中操作"""
+
+    def __init__(self, loop, max_pending: int = SUBSCRIBER_QUEUE_SIZE):
+        self.loop = loop
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.dropped = 0
+        self.resync = True
+        self._ready = asyncio.Event()
+
+    def push(self, update):
+        if len(self.pending) >= self.max_pending:
+            self.pending.popleft()
+            self.dropped += 1
+            self.resync = True
+        self.pending.append(update)
+        self._ready.set()
+
+    async def next_frame(self, timeout: float = None):
+        """下一帧字节串；timeout 秒内没有更新时返回 None"""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        update = self.pending.popleft()
+        if not self.pending:
+            self._ready.clear()
+        frame = update.snapshot_frame if self.resync else update.diff_frame
+        self.resync = False
+        return frame
+
+
+class Broadcaster:
+    """
+    按 topic（如 (currency, expirations)）把更新推送给订阅者
+    max_pending: 每个订阅者的队列长度
+    """
+
+    def __init__(self, max_pending: int = SUBSCRIBER_QUEUE_SIZE):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._latest = {}
+
+    def subscribe(self, topic):
+        """在事件循环中调用；有最近的更新时先把它作为完整快照放入队列"""
+        subscriber = Subscriber(asyncio.get_running_loop(), self.max_pending)
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscriber)
+            latest = self._latest.get(topic)
+        if latest is not None:
+            subscriber.push(latest)
+        return subscriber
+
+    def unsubscribe(self, topic, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def subscriber_count(self, topic=None):
+        with self._lock:
+            if topic is not None:
+                return len(self._subscribers.get(topic, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def latest(self, topic):
+        with self._lock:
+            return self._latest.get(topic)
+
+    def discard(self, topic):
+        """删除 topic 最近的更新（订阅者之后收到的第一帧为完整快照）"""
+        with self._lock:
+            self._latest.pop(topic, None)
+
+    def publish(self, topic, payload):
+        """发布新的快照（任意线程）；版本与上一次相同时忽略"""
+        with self._lock:
+            previous = self._latest.get(topic)
+            if previous is not None and previous.version == payload.get("version"):
+                return
+            update = self._latest[topic] = Update(payload, previous.payload if previous is not None else None)
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.push, update)
+            except RuntimeError:
+                # 事件循环已关闭
+                self.unsubscribe(topic, subscriber)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+按上游端点（Deribit 方法）和用途（现货 / 批量请求）的熔断器
+
+连续 failure_threshold 次失败（超时、连接错误、5xx）后熔断：reset_timeout 秒内该端点的请求立即失败，
+不再等待超时和重试；之后进入半开状态，只放行一个探测请求，成功则恢复，失败则重新熔断。
+上游有应答的错误（参数错误、限流）说明端点可用，不计为失败。
+"""
+import threading
+import time
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """端点已熔断，请求未发出"""
+
+    def __init__(self, name: str, retry_in: float):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"Circuit open for {name}, retrying upstream in {retry_in:.1f}s")
+
+
+class CircuitBreaker:
+    """
+    failure_threshold: 连续失败多少次后熔断
+    reset_timeout: 熔断后多少秒放行探测请求；探测请求超过该时间没有结果时再放行一个
+    """
+
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return CLOSED
+        return OPEN if now - self.opened_at < self.reset_timeout else HALF_OPEN
+
+    def before_call(self):
+        """请求前调用；熔断中（或半开状态已有探测请求）时抛出 CircuitOpenError"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and (self._probe_started is None or now - self._probe_started >= self.reset_timeout):
+                self._probe_started = now
+                return
+            retry_in = self.opened_at + self.reset_timeout - now
+        raise CircuitOpenError(self.name, max(retry_in, 0))
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"Circuit closed for {self.name}")
+            self.failures = 0
+            self.opened_at = None
+            self._probe_started = None
+
+    def record_failure(self):
+        now = time.monotonic()
+        with self._lock:
+            self.failures += 1
+            if self._probe_started is not None or (self.opened_at is None and self.failures >= self.failure_threshold):
+                # 探测失败或连续失败达到阈值：（重新）熔断
+                if self.opened_at is None:
+                    print(f"Circuit opened for {self.name} after {self.failures} consecutive failures")
+                self.opened_at = now
+                self._probe_started = None
+
+
+class CircuitBreakers:
+    """按 (端点, 用途) 惰性创建的熔断器；用途区分同一端点上的现货请求和批量请求，两者互不影响"""
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, method: str, role: str) -> CircuitBreaker:
+        key = (method, role)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(f"{method} ({role})", self.failure_threshold,
+                                                               self.reset_timeout)
+            return breaker
+
+    def states(self):
+        """{(端点, 用途): 状态}"""
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return {key: breaker.state for key, breaker in breakers}
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Deribit 公共 API 客户端
+
+基于 asyncio + httpx，客户端在自己的后台事件循环线程中持有一个持久连接池，
+同步代码（如 calculate_gex_data）和异步代码都可以复用同一组连接。
+每个请求都有超时，失败时按带抖动的指数退避重试，并发数由信号量限制，
+请求速率由令牌桶限流（见 rate_limiter.py），现货 / 指数价格请求优先。
+每个端点（方法）的现货请求和批量请求各有一个熔断器（见 circuit_breaker.py），上游持续失败时请求立即失败
+而不是等待超时；批量 ticker 请求熔断不影响永续合约现货价格。
+DERIBIT_BASE 可指向本地替身服务器（deribit_stub.py）；设置 DERIBIT_RECORD 时把每个成功的响应
+追加写入该 JSONL 文件，作为替身服务器的回放数据。
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from circuit_breaker import CircuitBreakers, CircuitOpenError
+from metrics import DERIBIT_CIRCUIT_REJECTIONS, DERIBIT_ERRORS, DERIBIT_REQUEST_SECONDS, DERIBIT_RETRIES, registry
+from rate_limiter import PRIORITY_BULK, PRIORITY_NAMES, PRIORITY_SPOT, create_rate_limiter
+
+DERIBIT_BASE = os.environ.get("DERIBIT_BASE", "https://www.deribit.com/api/v2")
+DERIBIT_RECORD = os.environ.get("DERIBIT_RECORD")
+DERIBIT_MAX_CONCURRENCY = int(os.environ.get("DERIBIT_MAX_CONCURRENCY", 16))
+DERIBIT_TIMEOUT = float(os.environ.get("DERIBIT_TIMEOUT", 10))
+DERIBIT_MAX_RETRIES = int(os.environ.get("DERIBIT_MAX_RETRIES", 3))
+DERIBIT_RETRY_BACKOFF = float(os.environ.get("DERIBIT_RETRY_BACKOFF", 0.25))
+# 设为 0 关闭限流
+DERIBIT_RATE_LIMIT = os.environ.get("DERIBIT_RATE_LIMIT", "1") != "0"
+# 连续失败多少次后熔断（0 关闭熔断），熔断多少秒后放行探测请求
+DERIBIT_BREAKER_FAILURES = int(os.environ.get("DERIBIT_BREAKER_FAILURES", 5))
+DERIBIT_BREAKER_RESET_SECONDS = float(os.environ.get("DERIBIT_BREAKER_RESET_SECONDS", 30))
+
+# 可重试的 HTTP 状态码和 Deribit 错误码（10028: too_many_requests）
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_ERROR_CODES = {10028}
+
+
+class DeribitAPIError(Exception):
+    """Deribit 返回了错误（JSON-RPC error 或缺少 result）"""
+
+    def __init__(self, method: str, error):
+        self.method = method
+        self.error = error
+        self.code = error.get("code") if isinstance(error, dict) else None
+        super().__init__(f"Deribit API error on {method}: {error}")
+
+
+class DeribitClient:
+    """
+    Deribit 公共 API 客户端
+
+    base_url: API 根地址
+    max_concurrency: 同时在途的最大请求数
+    timeout: 单次请求（含限流排队和读取响应）的超时秒数
+    max_retries: 失败后的最大重试次数
+    backoff: 退避基数（秒），第 n 次重试前等待 uniform(0, backoff * 2**n)
+    transport: 可选的 httpx 异步 transport（测试用）
+    record_path: 若设置，把每个成功响应追加写入该 JSONL 文件: {"ts", "method", "params", "result"}
+    rate_limit: 是否限流；rate_limiter 为自定义的 RateLimiter，默认按环境变量创建（create_rate_limiter）
+    breaker_failures / breaker_reset: 每个 (方法, 用途) 的熔断阈值和熔断秒数，breaker_failures <= 0 时不熔断
+    """
+
+    def __init__(self, base_url: str = DERIBIT_BASE, max_concurrency: int = DERIBIT_MAX_CONCURRENCY,
+                 timeout: float = DERIBIT_TIMEOUT, max_retries: int = DERIBIT_MAX_RETRIES,
+                 backoff: float = DERIBIT_RETRY_BACKOFF, transport=None, record_path: str = DERIBIT_RECORD,
+                 rate_limit: bool = DERIBIT_RATE_LIMIT, rate_limiter=None,
+                 breaker_failures: int = DERIBIT_BREAKER_FAILURES, breaker_reset: float = DERIBIT_BREAKER_RESET_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self.breakers = CircuitBreakers(breaker_failures, breaker_reset) if breaker_failures > 0 else None
+        self.record_path = record_path
+        self.rate_limit = rate_limit
+        self.rate_limiter = rate_limiter
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._transport = transport
+        self._loop = None
+        self._thread = None
+        self._http = None
+        self._semaphore = None
+        self._start_lock = threading.Lock()
+
+    # --- 事件循环与连接池 ---
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="deribit-client", daemon=True)
+                thread.start()
+                asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+                self._thread = thread
+                self._loop = loop
+        return self._loop
+
+    async def _open(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.rate_limit and self.rate_limiter is None:
+            self.rate_limiter = create_rate_limiter()
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+            transport=self._transport
+        )
+
+    def close(self):
+        """关闭连接池并停止后台事件循环"""
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+            if loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._http.aclose(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join()
+            loop.close()
+            self._thread = None
+            self._http = None
+
+    def run(self, coro):
+        """在客户端事件循环中执行协程并同步等待结果（供同步代码调用）"""
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def arun(self, coro):
+        """在客户端事件循环中执行协程，可在任意其它事件循环中 await"""
+        loop = self._ensure_started()
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    # --- 请求 ---
+
+    async def public(self, method: str, params=None, priority: int = PRIORITY_BULK):
+        """
+        调用 /public/<method>，返回 result 字段；必须在客户端事件循环中执行
+        priority: 限流排队的优先级（PRIORITY_SPOT 先于 PRIORITY_BULK），每次尝试都消耗额度；
+        同时决定使用的熔断器，现货请求不受批量请求熔断的影响
+        熔断时抛出 CircuitOpenError，不重试；限流排队超过 timeout 时抛出 asyncio.TimeoutError，不重试
+        """
+        role = PRIORITY_NAMES.get(priority, str(priority))
+        breaker = self.breakers.get(method, role) if self.breakers is not None else None
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            if breaker is not None:
+                try:
+                    breaker.before_call()
+                except CircuitOpenError:
+                    DERIBIT_CIRCUIT_REJECTIONS.inc(method=method, role=role)
+                    raise
+            # 限流排队和请求共用一个截止时间
+            deadline = loop.time() + self.timeout
+            if self.rate_limit:
+                try:
+                    await asyncio.wait_for(self.rate_limiter.acquire(priority), self.timeout)
+                except asyncio.TimeoutError:
+                    # 请求没有发出，不计为上游失败
+                    DERIBIT_ERRORS.inc(method=method, reason="rate_limit_timeout")
+                    raise
+            try:
+                async with self._semaphore:
+                    started = time.perf_counter()
+                    try:
+                        response = await asyncio.wait_for(
+                            self._http.get(f"/public/{method}", params=params),
+                            deadline - loop.time()
+                        )
+                    finally:
+                        DERIBIT_REQUEST_SECONDS.observe(time.perf_counter() - started, method=method)
+                data = response.json()
+                # 上游有应答（包括参数错误和限流）即视为端点可用
+                upstream_failed = response.status_code >= 500
+                if breaker is not None and not upstream_failed:
+                    breaker.record_success()
+                if "result" in data:
+                    if self.record_path:
+                        self._record(method, params, data["result"])
+                    return data["result"]
+                error = DeribitAPIError(method, data.get("error"))
+                retryable = response.status_code in RETRYABLE_STATUS or error.code in RETRYABLE_ERROR_CODES
+                reason = f"api_{error.code}" if error.code is not None else f"http_{response.status_code}"
+            except (httpx.TransportError, asyncio.TimeoutError, ValueError) as e:
+                error = e
+                retryable = True
+                upstream_failed = True
+                reason = "timeout" if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)) else \
+                    "invalid_response" if isinstance(e, ValueError) else "transport"
+
+            DERIBIT_ERRORS.inc(method=method, reason=reason)
+            if breaker is not None and upstream_failed:
+                breaker.record_failure()
+            if self.rate_limit and reason in ("http_429", "api_10028"):
+                await self.rate_limiter.throttled()
+            if not retryable or attempt >= self.max_retries:
+                raise error
+            DERIBIT_RETRIES.inc(method=method)
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            attempt += 1
+
+    def _record(self, method, params, result):
+        # 只在客户端事件循环线程中调用，写入是顺序的
+        entry = {"ts": int(time.time() * 1000), "method": method, "params": params or {}, "result": result}
+        with open(self.record_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    async def get_instruments(self, currency: str, kind: str = "option"):
+        return await self.public("get_instruments", {
+            "currency": currency.upper(),
+            "kind": kind,
+            "expired": "false"  # API expects a string, not a boolean
+        })
+
+    async def get_book_summary(self, currency: str, kind: str = "option"):
+        return await self.public("get_book_summary_by_currency", {"currency": currency.upper(), "kind": kind})
+
+    async def get_ticker(self, instrument_name: str, priority: int = PRIORITY_BULK):
+        return await self.public("ticker", {"instrument_name": instrument_name}, priority)
+
+    async def get_index_price(self, index_name: str, priority: int = PRIORITY_BULK):
+        return await self.public("get_index_price", {"index_name": index_name}, priority)
+
+    async def get_spot_price(self, currency: str):
+        """BTC/ETH 取永续合约 mark_price，SOL/XRP 取指数价格"""
+        currency = currency.upper()
+        if currency in ['BTC', 'ETH']:
+            result = await self.get_ticker(f"{currency}-PERPETUAL", PRIORITY_SPOT)
+            if "mark_price" not in result:
+                raise Exception(f"Could not fetch spot price for {currency}")
+            return result["mark_price"]
+        elif currency in ['SOL', 'XRP']:
+            result = await self.get_index_price(f"{currency.lower()}_usd", PRIORITY_SPOT)
+            if "index_price" not in result:
+                raise Exception(f"Could not fetch index price for {currency}")
+            return result["index_price"]
+        else:
+            raise Exception(f"Spot price fetch not supported for {currency}")
+
+    async def get_tickers(self, instrument_names):
+        """并发获取多个合约的 ticker，单个合约失败时对应位置为 None"""
+        async def safe_ticker(name):
+            try:
+                return await self.get_ticker(name)
+            except CircuitOpenError:
+                # 熔断时整条链失败，而不是得到一条空的链
+                raise
+            except Exception as e:
+                print(f"Warning: Could not fetch ticker for {name}. Error: {e}")
+                return None
+        return await asyncio.gather(*(safe_ticker(name) for name in instrument_names))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _circuit_states():
+    states = _client.breakers.states() if _client is not None and _client.breakers is not None else {}
+    return [({"method": method, "role": role, "state": state}, 1) for (method, role), state in states.items()]
+
+
+registry.gauge("deribit_circuit_state", "Circuit breaker state per Deribit method and role (closed, open, half_open)",
+               _circuit_states)
+
+
+def get_client() -> DeribitClient:
+    """进程内共享的 Deribit 客户端"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DeribitClient()
+    return _client
+
+
+# --- 同步接口（供 fetcher / gex_calculator 使用） ---
+
+def fetch_spot_price(currency: str):
+    """获取现货价格"""
+    client = get_client()
+    return client.run(client.get_spot_price(currency))
+
+
+def fetch_instruments(currency: str):
+    """获取所有可用的期权合约"""
+    client = get_client()
+    instruments = client.run(client.get_instruments(currency))
+    print(f"fetch_instruments({currency}) count: {len(instruments)}")
+    return instruments
+
+
+def fetch_full_option_book(currency: str):
+    """通过单个高效API调用获取全部期权数据"""
+    client = get_client()
+    return client.run(client.get_book_summary(currency))
+
+
+def fetch_option_data(instrument_name: str):
+    """获取期权数据（价格、隐含波动率等），失败时返回 None"""
+    client = get_client()
+    return client.run(client.get_tickers([instrument_name]))[0]
+
+
+def fetch_option_data_batch(instrument_names):
+    """并发获取多个合约的期权数据，返回与 instrument_names 对齐的列表"""
+    client = get_client()
+    return client.run(client.get_tickers(instrument_names))
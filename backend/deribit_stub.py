@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+本地 Deribit HTTP 替身服务器
+
+按录制（DeribitClient(record_path=...) / DERIBIT_RECORD）或合成的 JSONL 数据应答
+/api/v2/public/<method> 请求，可配置延迟、抖动、错误注入和按信用额度的限流，用于离线、可复现的测试和压测。
+回放时所有时间戳字段按录制时间整体平移到当前时间，录制的期权链不会随时间过期。
+
+用法:
+    python deribit_stub.py record fixtures.jsonl --currencies BTC,ETH    # 从真实 API 录制
+    python deribit_stub.py synthetic fixtures.jsonl --currencies BTC     # 生成合成数据
+    python deribit_stub.py serve fixtures.jsonl --port 8555 --latency 50 --jitter 20 --error-rate 0.05
+    python deribit_stub.py serve fixtures.jsonl --credits 50000 --refill 10000 --cost 500      # 模拟 Deribit 限流
+然后设置 DERIBIT_BASE=http://localhost:8555/api/v2
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import numpy as np
+
+# 回放时平移的时间戳字段（毫秒）
+TIMESTAMP_FIELDS = ("expiration_timestamp", "creation_timestamp", "timestamp")
+
+
+def fixture_key(method: str, params) -> tuple:
+    """按方法和参数（忽略顺序，值统一为字符串）匹配录制的响应"""
+    return method, tuple(sorted((k, str(v)) for k, v in (params or {}).items()))
+
+
+def load_fixtures(path: str):
+    """读取 JSONL 录制文件，返回 [{"ts", "method", "params", "result"}]"""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_fixtures(path: str, entries):
+    with open(path, "w") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+
+def shift_timestamps(value, offset_ms: int):
+    """递归地把 TIMESTAMP_FIELDS 中的毫秒时间戳加上 offset_ms"""
+    if isinstance(value, dict):
+        return {k: (v + offset_ms if k in TIMESTAMP_FIELDS and isinstance(v, (int, float)) else shift_timestamps(v, offset_ms))
+                for k, v in value.items()}
+    if isinstance(value, list):
+        return [shift_timestamps(v, offset_ms) for v in value]
+    return value
+
+
+def synthetic_fixtures(currencies=("BTC",), expiries: int = 4, strikes: int = 40, seed: int = 0, now_ms: int = None):
+    """
+    生成合成的期权链数据：每个币种 expiries 个到期日 × strikes 个行权价 × call/put，
+    包含 get_instruments、book summary、每个合约和永续合约的 ticker、指数价格
+    相同的 seed 生成相同的数据（时间戳相对 now_ms）
+    """
+    rng = np.random.default_rng(seed)
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    spots = {"BTC": 100000.0, "ETH": 3500.0, "SOL": 150.0, "XRP": 0.6}
+    entries = []
+
+    def add(method, params, result):
+        entries.append({"ts": now_ms, "method": method, "params": params, "result": result})
+
+    for currency in currencies:
+        currency = currency.upper()
+        spot = spots.get(currency, 100.0)
+        instruments, book = [], []
+        for e in range(expiries):
+            # 最近的到期日在一天内，之后逐渐拉长
+            expiration_ts = now_ms + int((e * e * 3 + 1) * 86400 * 1000 * 0.9)
+            expiry_code = time.strftime("%d%b%y", time.gmtime(expiration_ts / 1000)).upper()
+            for strike in np.linspace(spot * 0.6, spot * 1.4, strikes):
+                strike = float(np.format_float_positional(strike, precision=3, fractional=False))
+                for option_type in ("call", "put"):
+                    name = f"{currency}-{expiry_code}-{strike:g}-{option_type[0].upper()}"
+                    instruments.append({
+                        "instrument_name": name, "kind": "option", "strike": strike, "option_type": option_type,
+                        "expiration_timestamp": expiration_ts, "creation_timestamp": now_ms - 30 * 86400 * 1000,
+                        "contract_size": 1.0, "base_currency": currency, "is_active": True
+                    })
+                    open_interest = float(rng.integers(0, 2000))
+                    volume = float(rng.integers(0, 300))
+                    mark_iv = float(rng.uniform(35, 90)) if rng.random() > 0.03 else 0.0
+                    book.append({"instrument_name": name, "open_interest": open_interest, "volume": volume,
+                                 "mark_iv": mark_iv, "mark_price": 0.01, "underlying_price": spot})
+                    add("ticker", {"instrument_name": name}, {
+                        "instrument_name": name, "open_interest": open_interest, "stats": {"volume": volume},
+                        "mark_iv": mark_iv, "mark_price": 0.01, "underlying_price": spot, "timestamp": now_ms
+                    })
+        add("get_instruments", {"currency": currency, "kind": "option", "expired": "false"}, instruments)
+        add("get_book_summary_by_currency", {"currency": currency, "kind": "option"}, book)
+        add("ticker", {"instrument_name": f"{currency}-PERPETUAL"},
+            {"instrument_name": f"{currency}-PERPETUAL", "mark_price": spot, "index_price": spot, "timestamp": now_ms})
+        add("get_index_price", {"index_name": f"{currency.lower()}_usd"}, {"index_price": spot, "estimated_delivery_price": spot})
+    return entries
+
+
+def record_fixtures(path: str, currencies, tickers: bool = False):
+    """从真实 API（或 DERIBIT_BASE）录制 GEX 计算需要的全部响应到 path"""
+    from deribit_client import DeribitClient
+    open(path, "w").close()
+    client = DeribitClient(record_path=path)
+    try:
+        for currency in currencies:
+            currency = currency.upper()
+            instruments = client.run(client.get_instruments(currency))
+            client.run(client.get_book_summary(currency))
+            client.run(client.get_spot_price(currency))
+            if tickers:
+                client.run(client.get_tickers([i["instrument_name"] for i in instruments]))
+            print(f"Recorded {currency}: {len(instruments)} instruments")
+    finally:
+        client.close()
+
+
+class StubServer:
+    """
+    entries: load_fixtures / synthetic_fixtures 的结果，同一请求出现多次时使用最后一次
+    latency / jitter: 每个请求的延迟秒数为 latency + uniform(0, jitter)
+    error_rate: 以该概率返回 error_status 和 too_many_requests 错误（可被客户端重试）
+    rebase_time: 把录制时间平移到当前时间
+    credits: 可选的 (容量, 每秒恢复, 每个请求的消耗)，额度不足时返回 429 和 too_many_requests
+    requests: 每个方法收到的请求数；throttled: 因额度不足被拒绝的请求数
+    """
+
+    def __init__(self, entries, host: str = "localhost", port: int = 0, latency: float = 0, jitter: float = 0,
+                 error_rate: float = 0, error_status: int = 429, rebase_time: bool = True, seed: int = None,
+                 credits=None):
+        offset_ms = 0
+        if rebase_time and entries:
+            offset_ms = int(time.time() * 1000) - max(entry.get("ts", 0) for entry in entries)
+        self.responses = {
+            fixture_key(entry["method"], entry.get("params")): shift_timestamps(entry["result"], offset_ms)
+            for entry in entries
+        }
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = Counter()
+        self.credits = credits
+        self.throttled = 0
+        self._tokens = credits[0] if credits else 0
+        self._tokens_updated = time.monotonic()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/api/v2"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和正文分两次写出，关闭 Nagle 避免 keep-alive 连接上的 40ms 延迟确认
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, body = stub.handle(self.path)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                try:
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端已超时放弃
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="deribit-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _spend(self) -> bool:
+        """按信用额度模型扣减一个请求的消耗，不足时返回 False（调用方持有锁）"""
+        capacity, refill_rate, cost = self.credits
+        now = time.monotonic()
+        self._tokens = min(capacity, self._tokens + (now - self._tokens_updated) * refill_rate)
+        self._tokens_updated = now
+        if self._tokens < cost:
+            return False
+        self._tokens -= cost
+        return True
+
+    def handle(self, path: str):
+        """返回 (HTTP 状态码, JSON-RPC 响应)；GET /stats 返回各方法的请求数"""
+        url = urlparse(path)
+        if url.path == "/stats":
+            with self._lock:
+                return 200, {"requests": dict(self.requests), "throttled": self.throttled}
+        method = url.path.rsplit("/public/", 1)[-1]
+        params = dict(parse_qsl(url.query))
+        with self._lock:
+            self.requests[method] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+            if self.credits and not self._spend():
+                self.throttled += 1
+                fail = True
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            return self.error_status, {"jsonrpc": "2.0", "error": {"code": 10028, "message": "too_many_requests"}}
+        result = self.responses.get(fixture_key(method, params))
+        if result is None:
+            return 400, {"jsonrpc": "2.0", "error": {"code": 13020, "message": "not_found", "data": {"method": method, "params": params}}}
+        return 200, {"jsonrpc": "2.0", "result": result, "usIn": int(time.time() * 1e6)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Deribit HTTP stand-in")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="record live API responses to a fixture file")
+    record.add_argument("fixtures")
+    record.add_argument("--currencies", default="BTC,ETH,SOL,XRP")
+    record.add_argument("--tickers", action="store_true", help="also record every option ticker (GEX_CHAIN_SOURCE=ticker)")
+
+    synthetic = commands.add_parser("synthetic", help="write a synthetic option chain fixture file")
+    synthetic.add_argument("fixtures")
+    synthetic.add_argument("--currencies", default="BTC,ETH,SOL,XRP")
+    synthetic.add_argument("--expiries", type=int, default=4)
+    synthetic.add_argument("--strikes", type=int, default=40)
+    synthetic.add_argument("--seed", type=int, default=0)
+
+    serve = commands.add_parser("serve", help="serve a fixture file")
+    serve.add_argument("fixtures")
+    serve.add_argument("--host", default="localhost")
+    serve.add_argument("--port", type=int, default=8555)
+    serve.add_argument("--latency", type=float, default=0, help="milliseconds added to every response")
+    serve.add_argument("--jitter", type=float, default=0, help="extra uniform random milliseconds")
+    serve.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with an error")
+    serve.add_argument("--error-status", type=int, default=429)
+    serve.add_argument("--no-rebase", action="store_true", help="keep recorded timestamps as they are")
+    serve.add_argument("--seed", type=int, default=None)
+    serve.add_argument("--credits", type=float, default=0, help="rate-limit credit capacity (0 = no rate limit)")
+    serve.add_argument("--refill", type=float, default=10000, help="credits restored per second")
+    serve.add_argument("--cost", type=float, default=500, help="credits spent per request")
+    args = parser.parse_args()
+
+    currencies = [c for c in getattr(args, "currencies", "").upper().split(",") if c]
+    if args.command == "record":
+        record_fixtures(args.fixtures, currencies, args.tickers)
+    elif args.command == "synthetic":
+        entries = synthetic_fixtures(currencies, args.expiries, args.strikes, args.seed)
+        write_fixtures(args.fixtures, entries)
+        print(f"Wrote {len(entries)} responses to {args.fixtures}")
+    else:
+        server = StubServer(load_fixtures(args.fixtures), args.host, args.port, args.latency / 1000, args.jitter / 1000,
+                            args.error_rate, args.error_status, not args.no_rebase, args.seed,
+                            (args.credits, args.refill, args.cost) if args.credits > 0 else None)
+        with server:
+            print(f"Serving {len(server.responses)} responses on {server.url}")
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+现货扫描的Gamma曲线（gamma profile）和真正的零Gamma
+
+在一组假设的现货价格上对整条期权链重新定价Gamma，一次 (现货 × 合约) 的数组运算得到每个现货下的净GEX；
+零Gamma是净GEX随现货变号的价格：先在网格上找到离当前现货最近的变号区间，再用 brentq 在区间内求根。
+"""
+import numpy as np
+from scipy.optimize import brentq
+
+from gex_calculator import RISK_FREE_RATE, SQRT_2PI, time_to_expiry
+
+# 默认网格点数和范围（现货上下的比例）
+PROFILE_POINTS = 200
+PROFILE_WIDTH = 0.2
+
+
+def _valid(chain, T):
+    return (T > 0) & (chain.sigma > 0) & (chain.strike > 0)
+
+
+def gamma_matrix(spots, strike, T, sigma, r=RISK_FREE_RATE):
+    """
+    spots: (n,) 现货价格；strike / T / sigma: (m,) 合约参数（需已过滤无效合约）
+    返回 (n, m) 的 Black-Scholes Gamma
+    """
+    S = np.asarray(spots, dtype=float)[:, None]
+    sigma_sqrt_T = sigma * np.sqrt(T)
+    d1 = (np.log(S / strike) + (r + 0.5 * sigma**2) * T) / sigma_sqrt_T
+    return np.exp(-0.5 * d1**2) / (SQRT_2PI * S * sigma_sqrt_T)
+
+
+class ChainPricer:
+    """
+    固定时刻的期权链，可在任意现货价格下计算净GEX（百万美元，口径同 gex_contributions）
+
+    chain: gex_calculator.ChainArrays
+    now_ts: 计算到期时间所用的毫秒时间戳，默认当前时间
+    """
+
+    def __init__(self, chain, now_ts=None):
+        T = time_to_expiry(chain.expiration_ts, now_ts)
+        valid = _valid(chain, T)
+        self.strike = chain.strike[valid]
+        self.T = T[valid]
+        self.sigma = chain.sigma[valid]
+        # 每个合约的权重：符号 × 合约乘数 × 100 / 1e6 × OI 或 Volume
+        scale = np.where(chain.is_call[valid], 1.0, -1.0) * chain.contract_size[valid] * 100 / 1_000_000
+        self.weights = {
+            "oi": scale * chain.open_interest[valid],
+            "vol": scale * chain.volume[valid]
+        }
+
+    def __len__(self):
+        return len(self.strike)
+
+    def net_gex(self, spots, weight="vol", sigma=None):
+        """每个现货下的净GEX，spots 为 (n,) 数组；sigma 可替换隐含波动率"""
+        spots = np.asarray(spots, dtype=float)
+        if not len(self):
+            return np.zeros(len(spots))
+        gamma = gamma_matrix(spots, self.strike, self.T, self.sigma if sigma is None else sigma)
+        return gamma @ self.weights[weight] * spots**2
+
+    def zero_gamma(self, spots, profile, spot_price, weight="vol", sigma=None):
+        """
+        在 profile（net_gex(spots) 的结果）中找到离 spot_price 最近的变号区间，
+        用 brentq 求净GEX为零的现货价格；没有变号（包括曲线全为零，如没有成交量）时返回 None
+        """
+        signs = np.sign(profile)
+        # 网格点恰好为零且相邻点不为零的区间记为 (i, i)
+        zero = signs == 0
+        edge = zero & (np.r_[False, ~zero[:-1]] | np.r_[~zero[1:], False])
+        brackets = [(i, i) for i in np.where(edge)[0]]
+        brackets += [(i, i + 1) for i in np.where(signs[:-1] * signs[1:] < 0)[0]]
+        if not brackets:
+            return None
+        lo, hi = min(brackets, key=lambda b: abs((spots[b[0]] + spots[b[1]]) / 2 - spot_price))
+        if lo == hi:
+            return float(spots[lo])
+        f = lambda s: float(self.net_gex([s], weight, sigma)[0])
+        return float(brentq(f, spots[lo], spots[hi], xtol=1e-6 * spot_price))
+
+
+def spot_grid(spot_price, points=PROFILE_POINTS, width=PROFILE_WIDTH):
+    """以现货为中心、上下 width 比例的等距网格"""
+    return np.linspace(spot_price * (1 - width), spot_price * (1 + width), points)
+
+
+def gamma_profile(chain, spot_price, points=PROFILE_POINTS, width=PROFILE_WIDTH, now_ts=None):
+    """
+    计算整条链在现货网格上的净GEX曲线和零Gamma
+
+    chain: ChainArrays
+    now_ts: 毫秒时间戳，默认当前时间（应与快照时间一致）
+    返回 dict: spots, net_oi_gex, net_vol_gex, zero_gamma（OI口径）, zero_gamma_vol（Volume口径）
+    """
+    pricer = ChainPricer(chain, now_ts)
+    spots = spot_grid(spot_price, points, width)
+    result = {"spot_price": spot_price, "spots": spots.tolist(), "instruments": len(pricer)}
+    if not len(pricer):
+        return {**result, "net_oi_gex": [0.0] * len(spots), "net_vol_gex": [0.0] * len(spots),
+                "zero_gamma": None, "zero_gamma_vol": None}
+    gamma = gamma_matrix(spots, pricer.strike, pricer.T, pricer.sigma)
+    # 一次 (现货 × 合约) 矩阵与两个权重向量相乘得到两种口径
+    net = gamma @ np.column_stack([pricer.weights["oi"], pricer.weights["vol"]]) * (spots**2)[:, None]
+    net_oi, net_vol = net[:, 0], net[:, 1]
+    result["net_oi_gex"] = net_oi.tolist()
+    result["net_vol_gex"] = net_vol.tolist()
+    result["zero_gamma"] = pricer.zero_gamma(spots, net_oi, spot_price, "oi")
+    result["zero_gamma_vol"] = pricer.zero_gamma(spots, net_vol, spot_price, "vol")
+    return result
@@ -1,54 +1,122 @@
 #!/usr/bin/env python3
 import numpy as np
 import math
-from scipy.stats import norm
+from scipy.special import ndtr
 from datetime import datetime
-import requests
-from collections import defaultdict
-import concurrent.futures
+from collections import namedtuple
+import os
+import time
+from deribit_client import fetch_spot_price, fetch_instruments, fetch_full_option_book, fetch_option_data, fetch_option_data_batch
+from instrument_cache import InstrumentCache
+from metrics import GEX_INSTRUMENTS, GEX_STAGE_SECONDS
 
-DERIBIT_BASE = "https://www.deribit.com/api/v2"
+# 无风险利率（可以设置为0或从市场数据获取）
+RISK_FREE_RATE = 0.0
+# 期权链行情来源: "book" 为单次 get_book_summary_by_currency 调用, "ticker" 为逐个合约请求 /public/ticker
+CHAIN_SOURCE = os.environ.get("GEX_CHAIN_SOURCE", "book")
+SQRT_2PI = math.sqrt(2 * math.pi)
 
-def fetch_spot_price(currency: str):
-    """获取现货价格"""
-    currency = currency.upper()
-    if currency in ['BTC', 'ETH']:
-        instrument_name = f"{currency}-PERPETUAL"
-        response = requests.get(f"{DERIBIT_BASE}/public/ticker", params={"instrument_name": instrument_name})
-        response.raise_for_status()
-        data = response.json()
-        if "result" in data and "mark_price" in data["result"]:
-            return data["result"]["mark_price"]
-        else:
-            raise Exception(f"Could not fetch spot price for {currency}")
+def fetch_chain_quotes(currency: str, instrument_names, source: str = CHAIN_SOURCE):
+    """
+    获取期权链行情，返回 {instrument_name: {"open_interest", "volume", "mark_iv"}}
+    
+    source="book": 一次 get_book_summary_by_currency 调用获取该币种全部期权
+    source="ticker": 只对 instrument_names 中的合约逐个请求 /public/ticker（由客户端限制并发）
+    缺少行情的合约不会出现在结果中
+    """
+    if source == "book":
+        return {
+            summary["instrument_name"]: {
+                "open_interest": summary.get("open_interest"),
+                "volume": summary.get("volume"),
+                "mark_iv": summary.get("mark_iv")
+            }
+            for summary in fetch_full_option_book(currency)
+            if "instrument_name" in summary
+        }
+    elif source == "ticker":
+        results = fetch_option_data_batch(instrument_names)
+        return {
+            name: {
+                "open_interest": option_data.get("open_interest"),
+                "volume": option_data.get("stats", {}).get("volume"),
+                "mark_iv": option_data.get("mark_iv")
+            }
+            for name, option_data in zip(instrument_names, results)
+            if option_data is not None
+        }
     else:
-        raise Exception(f"Spot price fetch not supported for {currency}")
+        raise ValueError(f"Unknown chain source: {source}")
 
-def fetch_instruments(currency: str):
-    """获取所有可用的期权合约"""
-    response = requests.get(f"{DERIBIT_BASE}/public/get_instruments", params={
-        "currency": currency.upper(),
-        "kind": "option",
-        "expired": "false"
-    })
-    data = response.json()
-    if "result" in data:
-        return data["result"]
-    else:
-        raise Exception(f"Deribit API error on get_instruments: {data.get('error')}")
+# 合约元数据缓存（按币种），提供 instrument_name -> (strike, option_type, expiration_timestamp, contract_size) 索引
+instrument_cache = InstrumentCache(fetch_instruments)
 
-def fetch_option_data(instrument_name: str):
-    """获取期权数据（价格、隐含波动率等）"""
-    response = requests.get(f"{DERIBIT_BASE}/public/ticker", params={"instrument_name": instrument_name})
-    data = response.json()
-    if "result" in data:
-        return data["result"]
-    else:
-        return None
+# 一次计算所用的期权链输入（每个有效合约一行的NumPy数组），随快照保存，
+# 供 gamma profile 等在不同现货价格下重新定价；expiration_ts 为毫秒时间戳
+ChainArrays = namedtuple("ChainArrays", ["strike", "is_call", "contract_size", "open_interest", "volume", "sigma", "expiration_ts"])
+
+# 按行权价汇总的结果（每个行权价一行的NumPy数组，行权价升序），字段与 strike_aggregate.FIELDS 一致
+StrikeGex = namedtuple("StrikeGex", ["strike", "oi_call_gex", "oi_put_gex", "vol_call_gex", "vol_put_gex",
+                                     "call_oi", "put_oi", "call_volume", "put_volume"])
+# summarize_gex 输出的每行字段
+ROW_FIELDS = ("strike", "call_gex", "put_gex", "open_interest", "volume", "call_oi", "put_oi", "call_volume", "put_volume")
+# 没有行情的合约
+NO_QUOTE = {}
+
+def empty_chain():
+    return ChainArrays(*(np.zeros(0, dtype=bool if field == "is_call" else float) for field in ChainArrays._fields))
+
+def black_scholes_greeks_batch(S, K, T, r, sigma, is_call):
+    """
+    向量化计算整条期权链的Black-Scholes Greeks
+
+    参数（标量或NumPy数组，按广播规则对齐）:
+    S: 现货价格
+    K: 执行价格
+    T: 到期时间（年）
+    r: 无风险利率
+    sigma: 隐含波动率
+    is_call: 布尔值/布尔数组，True 为看涨期权
+
+    返回:
+    dict: delta, gamma, vega, theta 四个数组；T <= 0 或 sigma <= 0 的位置为 0
+    """
+    S, K, T, r, sigma, is_call = np.broadcast_arrays(
+        np.asarray(S, dtype=float), np.asarray(K, dtype=float), np.asarray(T, dtype=float),
+        np.asarray(r, dtype=float), np.asarray(sigma, dtype=float), np.asarray(is_call, dtype=bool)
+    )
+    valid = (T > 0) & (sigma > 0) & (S > 0) & (K > 0)
+
+    # 无效位置替换为安全值，避免除零/log(0)告警，最后统一置零
+    S_ = np.where(valid, S, 1.0)
+    K_ = np.where(valid, K, 1.0)
+    T_ = np.where(valid, T, 1.0)
+    sigma_ = np.where(valid, sigma, 1.0)
+
+    sqrt_T = np.sqrt(T_)
+    sigma_sqrt_T = sigma_ * sqrt_T
+    d1 = (np.log(S_ / K_) + (r + 0.5 * sigma_**2) * T_) / sigma_sqrt_T
+    d2 = d1 - sigma_sqrt_T
+
+    n_d1 = np.exp(-0.5 * d1**2) / SQRT_2PI
+    N_d1 = ndtr(d1)
+    discounted_K = r * K_ * np.exp(-r * T_)
+
+    delta = np.where(is_call, N_d1, N_d1 - 1)
+    gamma = n_d1 / (S_ * sigma_sqrt_T)
+    vega = S_ * n_d1 * sqrt_T
+    theta = -S_ * n_d1 * sigma_ / (2 * sqrt_T) + np.where(is_call, -discounted_K * ndtr(d2), discounted_K * ndtr(-d2))
+
+    return {
+        'delta': np.where(valid, delta, 0.0),
+        'gamma': np.where(valid, gamma, 0.0),
+        'vega': np.where(valid, vega, 0.0),
+        'theta': np.where(valid, theta, 0.0)
+    }
 
 def black_scholes_greeks(S, K, T, r, sigma, option_type='call'):
     """
-    计算Black-Scholes模型的Greeks
+    计算单个期权的Black-Scholes Greeks（black_scholes_greeks_batch 的标量封装）
     
     参数:
     S: 现货价格
@@ -64,226 +132,274 @@ def black_scholes_greeks(S, K, T, r, sigma, option_type='call'):
     if T <= 0 or sigma <= 0:
         return {'delta': 0, 'gamma': 0, 'vega': 0, 'theta': 0}
     
-    # 计算d1和d2
-    d1 = (np.log(S/K) + (r + 0.5*sigma**2)*T) / (sigma*np.sqrt(T))
-    d2 = d1 - sigma*np.sqrt(T)
-    
-    # 计算标准正态分布的PDF和CDF
-    N_d1 = norm.cdf(d1)
-    N_d2 = norm.cdf(d2)
-    n_d1 = norm.pdf(d1)
-    
-    if option_type.lower() == 'call':
-        delta = N_d1
-        gamma = n_d1 / (S * sigma * np.sqrt(T))
-        vega = S * n_d1 * np.sqrt(T)
-        theta = (-S * n_d1 * sigma / (2 * np.sqrt(T)) - r * K * np.exp(-r*T) * N_d2)
-    else:  # put
-        delta = N_d1 - 1
-        gamma = n_d1 / (S * sigma * np.sqrt(T))
-        vega = S * n_d1 * np.sqrt(T)
-        theta = (-S * n_d1 * sigma / (2 * np.sqrt(T)) + r * K * np.exp(-r*T) * norm.cdf(-d2))
+    greeks = black_scholes_greeks_batch(S, K, T, r, sigma, option_type.lower() == 'call')
+    return {name: float(value) for name, value in greeks.items()}
+
+def aggregate_by_strike(strike, is_call, open_interest, volume, gex_oi, gex_vol, group=None, groups: int = 1):
+    """
+    按 (分组, 行权价) 汇总每个合约的GEX、OI和Volume
+    
+    np.unique 排序得到每个合约的行权价序号，再用 np.bincount 按 (分组, 行权价, call/put) 一次求和，
+    不为单个合约创建Python对象；同一个桶内按合约顺序累加
+    group: 每个合约的分组序号（如到期日），None 表示只有一组
     
-    return {
-        'delta': delta,
-        'gamma': gamma,
-        'vega': vega,
-        'theta': theta
-    }
+    返回:
+    长度为 groups 的 StrikeGex 列表，每组只含有合约的行权价
+    """
+    strikes, position = np.unique(strike, return_inverse=True)
+    n = len(strikes)
+    bins = position * 2 + np.asarray(is_call, dtype=int)
+    if group is not None:
+        bins = bins + np.asarray(group, dtype=int) * (2 * n)
+    size = groups * 2 * n
+    
+    def sums(weights):
+        # [..., 0] 为 put，[..., 1] 为 call
+        return np.bincount(bins, weights, minlength=size).reshape(groups, n, 2)
+    
+    counts = np.bincount(bins, minlength=size).reshape(groups, n, 2).sum(axis=2)
+    oi_gex, vol_gex, oi, vol = sums(gex_oi), sums(gex_vol), sums(open_interest), sums(volume)
+    result = []
+    for g in range(groups):
+        present = counts[g] > 0
+        result.append(StrikeGex(
+            strikes[present],
+            oi_gex[g, present, 1], oi_gex[g, present, 0],
+            vol_gex[g, present, 1], vol_gex[g, present, 0],
+            oi[g, present, 1], oi[g, present, 0],
+            vol[g, present, 1], vol[g, present, 0]
+        ))
+    return result
+
+def time_to_expiry(expiration_ts, now_ts=None):
+    """到期时间（年），expiration_ts / now_ts 为毫秒时间戳"""
+    if now_ts is None:
+        now_ts = datetime.now().timestamp() * 1000
+    return (expiration_ts - now_ts) / (1000 * 365 * 24 * 3600)  # 转换为年
+
+def gex_contributions(spot_price, strike, T, r, sigma, is_call, contract_size, oi, volume):
+    """
+    计算每个合约对GEX的贡献（百万美元），参数均可为数组
+    
+    GEX = Gamma × OI/Volume × (Spot Price)² × Contract Size × 100
+    看跌期权取负号
+    
+    返回:
+    (gex_by_oi, gex_by_volume)
+    """
+    gamma = black_scholes_greeks_batch(spot_price, strike, T, r, sigma, is_call)['gamma']
+    scale = gamma * (spot_price**2) * contract_size * 100 / 1_000_000
+    sign = np.where(is_call, 1.0, -1.0)
+    return sign * scale * oi, sign * scale * volume
+
+def expiration_date_str(expiration_ts):
+    """毫秒时间戳 -> 'YYYY-MM-DD'（UTC）"""
+    return datetime.utcfromtimestamp(expiration_ts / 1000).strftime('%Y-%m-%d')
+
+def select_expirations(metadata, expirations=None):
+    """
+    选择要计算的到期日，返回排好序的毫秒时间戳列表
+    
+    expirations: None 为最近到期日；"all" 为全部到期日；
+                 否则为 'YYYY-MM-DD' 字符串列表（或逗号分隔的字符串）
+    """
+    if expirations is None:
+        return metadata.expirations[:1]
+    if expirations == "all":
+        return list(metadata.expirations)
+    if isinstance(expirations, str):
+        expirations = expirations.split(",")
+    by_date = {expiration_date_str(ts): ts for ts in metadata.expirations}
+    wanted = [date.strip() for date in expirations if date.strip()]
+    unknown = [date for date in wanted if date not in by_date]
+    if unknown:
+        raise ValueError(f"Unknown expiration(s) for {metadata.currency}: {', '.join(unknown)}")
+    return sorted({by_date[date] for date in wanted})
 
-def calculate_gex_data(currency: str = "BTC"):
+def calculate_gex_data(currency: str = "BTC", source: str = CHAIN_SOURCE, expirations=None):
     """
     使用完全自定义的Greeks计算GEX数据
+    
+    source: 期权链行情来源，见 fetch_chain_quotes
+    expirations: 要计算的到期日，见 select_expirations。默认只计算最近到期日；
+                 指定后在一次向量化计算中得到所有选中到期日的合并结果，
+                 并在 "expirations" 字段中附上每个到期日各自的结果
     """
+    return calculate_gex_snapshot(currency, source, expirations)[0]
+
+def calculate_gex_snapshot(currency: str = "BTC", source: str = CHAIN_SOURCE, expirations=None):
+    """同 calculate_gex_data，额外返回本次计算使用的 ChainArrays: (result, chain)"""
     print(f"Calculating GEX for {currency} using custom Greeks...")
     
-    # 获取基础数据
-    instruments = fetch_instruments(currency)
+    # 获取基础数据（合约元数据来自缓存）
+    fetch_started = time.perf_counter()
+    metadata = instrument_cache.get(currency)
     spot_price = fetch_spot_price(currency)
     
-    if not instruments:
-        return {"data": [], "zero_gamma": None, "call_wall": None, "put_wall": None, "expiration_date": None}
-    
-    # 获取最近的到期日
-    expirations = sorted(list(set(inst.get("expiration_timestamp") for inst in instruments)))
-    if not expirations:
-        return {"data": [], "zero_gamma": None, "call_wall": None, "put_wall": None, "expiration_date": None}
+    # 选择到期日（默认最近的到期日）
+    if not metadata.expirations:
+        return {"data": [], "zero_gamma": None, "call_wall": None, "put_wall": None, "expiration_date": None,
+                "spot_price": spot_price}, empty_chain()
     
-    closest_expiration_ts = expirations[0]
-    closest_expiration_date = datetime.utcfromtimestamp(closest_expiration_ts / 1000).date()
+    selected_ts = select_expirations(metadata, expirations)
+    closest_expiration_ts = selected_ts[0]
+    closest_expiration_date = expiration_date_str(closest_expiration_ts)
     
     # 计算到期时间（年）
-    now_ts = datetime.now().timestamp() * 1000
-    T = (closest_expiration_ts - now_ts) / (1000 * 365 * 24 * 3600)  # 转换为年
-    
-    # 无风险利率（可以设置为0或从市场数据获取）
-    r = 0.0
+    T = time_to_expiry(closest_expiration_ts)
+    r = RISK_FREE_RATE
     
     print(f"Spot price: {spot_price}, Time to expiry: {T:.4f} years")
     
-    # 过滤指定到期日的期权
-    filtered_instruments = [inst for inst in instruments if inst.get("expiration_timestamp") == closest_expiration_ts]
-    print(f"Processing {len(filtered_instruments)} instruments for {closest_expiration_date}")
+    # 过滤指定到期日的期权（rows 为这些合约在元数据列数组中的位置）
+    filtered_names = [name for ts in selected_ts for name in metadata.by_expiration[ts]]
+    rows = np.concatenate([metadata.rows_by_expiration[ts] for ts in selected_ts])
+    print(f"Processing {len(filtered_names)} instruments for {', '.join(expiration_date_str(ts) for ts in selected_ts)}")
     
-    # 并发获取期权数据
-    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
-        option_data_results = list(executor.map(
-            lambda inst: (inst, fetch_option_data(inst["instrument_name"])),
-            filtered_instruments
-        ))
+    # 获取期权行情（默认单次book summary调用），并顺带检查是否有新上市合约
+    quotes = fetch_chain_quotes(currency, filtered_names, source)
+    if source == "book":
+        instrument_cache.check_new_listings(currency, quotes.keys())
+    GEX_STAGE_SECONDS.observe(time.perf_counter() - fetch_started, stage="fetch")
     
-    # 计算GEX
-    gex_by_strike = defaultdict(lambda: {
-        "oi": {"call_gex": 0, "put_gex": 0}, 
-        "vol": {"call_gex": 0, "put_gex": 0},
-        "open_interest": {"call": 0, "put": 0},
-        "volume": {"call": 0, "put": 0}
-    })
-    
-    processed_count = 0
-    skipped_count = 0
-    
-    for inst, option_data in option_data_results:
-        try:
-            if option_data is None:
-                skipped_count += 1
-                continue
-                
-            strike = inst["strike"]
-            is_call = inst["option_type"] == "call"
-            oi = option_data.get("open_interest", 0)
-            volume = option_data.get("stats", {}).get("volume", 0)
-            
-            # 获取隐含波动率
-            mark_iv = option_data.get("mark_iv", 0)
-            if mark_iv <= 0:
-                skipped_count += 1
-                continue  # 跳过无效的隐含波动率
-            
-            # 使用Black-Scholes计算Greeks（完全自定义）
-            greeks = black_scholes_greeks(
-                S=spot_price,
-                K=strike,
-                T=T,
-                r=r,
-                sigma=mark_iv/100,  # 转换为小数
-                option_type=inst["option_type"]
-            )
-            
-            # 使用自定义计算的Gamma
-            gamma = greeks['gamma']
-            
-            # 计算GEX
-            # GEX = Gamma × OI/Volume × (Spot Price)² × Contract Size × 100
-            contract_size = inst.get("contract_size", 1.0)
-            gex_by_oi_value = gamma * oi * (spot_price**2) * contract_size * 100 / 1_000_000
-            gex_by_volume_value = gamma * volume * (spot_price**2) * contract_size * 100 / 1_000_000
-            
-            if is_call:
-                gex_by_strike[strike]["oi"]["call_gex"] += gex_by_oi_value
-                gex_by_strike[strike]["vol"]["call_gex"] += gex_by_volume_value
-                gex_by_strike[strike]["open_interest"]["call"] += oi
-                gex_by_strike[strike]["volume"]["call"] += volume
-            else:
-                gex_by_strike[strike]["oi"]["put_gex"] += -gex_by_oi_value
-                gex_by_strike[strike]["vol"]["put_gex"] += -gex_by_volume_value
-                gex_by_strike[strike]["open_interest"]["put"] += oi
-                gex_by_strike[strike]["volume"]["put"] += volume
-            
-            processed_count += 1
-                
-        except Exception as e:
-            print(f"Error processing {inst.get('instrument_name', 'N/A')}: {e}")
-            skipped_count += 1
-            continue
+    # 行情按列取出，跳过没有行情或隐含波动率无效的合约，合约元数据直接取自列数组
+    quote_list = [quotes.get(name, NO_QUOTE) for name in filtered_names]
+    open_interest = np.array([quote.get("open_interest") or 0 for quote in quote_list], dtype=float)
+    volume = np.array([quote.get("volume") or 0 for quote in quote_list], dtype=float)
+    mark_iv = np.array([quote.get("mark_iv") or 0 for quote in quote_list], dtype=float)
+    valid = mark_iv > 0
+    selected = rows[valid]
+    columns = metadata.columns
+    chain = ChainArrays(
+        columns.strike[selected], columns.is_call[selected], columns.contract_size[selected],
+        open_interest[valid], volume[valid], mark_iv[valid] / 100,  # 转换为小数
+        columns.expiration_ts[selected]
+    )
+    processed_count = len(selected)
+    skipped_count = len(rows) - processed_count
     
     print(f"Processed: {processed_count}, Skipped: {skipped_count}")
+    GEX_INSTRUMENTS.inc(processed_count, currency=currency, result="processed")
+    GEX_INSTRUMENTS.inc(skipped_count, currency=currency, result="skipped")
     
-    if not gex_by_strike:
-        return {"data": [], "zero_gamma": None, "call_wall": None, "put_wall": None, "expiration_date": closest_expiration_date.strftime('%Y-%m-%d')}
-    
-    # 汇总数据
-    strikes = sorted(gex_by_strike.keys())
-    data = []
-    for s in strikes:
-        strike_data = {
-            "strike": s, 
-            "call_gex": gex_by_strike[s]["vol"]["call_gex"], 
-            "put_gex": gex_by_strike[s]["vol"]["put_gex"],
-            "open_interest": gex_by_strike[s]["open_interest"]["call"] + gex_by_strike[s]["open_interest"]["put"],
-            "volume": gex_by_strike[s]["volume"]["call"] + gex_by_strike[s]["volume"]["put"],
-            "call_oi": gex_by_strike[s]["open_interest"]["call"],
-            "put_oi": gex_by_strike[s]["open_interest"]["put"],
-            "call_volume": gex_by_strike[s]["volume"]["call"],
-            "put_volume": gex_by_strike[s]["volume"]["put"]
-        }
-        data.append(strike_data)
-    
-    # 计算指标
-    total_oi_call_gex = sum(gex_by_strike[s]["oi"]["call_gex"] for s in strikes)
-    total_oi_put_gex = sum(gex_by_strike[s]["oi"]["put_gex"] for s in strikes)
-    net_oi_gex = total_oi_call_gex + total_oi_put_gex
-    
-    # Call Wall 和 Put Wall
-    call_wall = max(data, key=lambda x: x["call_gex"]) if data else None
-    if call_wall:
-        call_wall = call_wall["strike"]
-    
-    put_wall_data = [d for d in data if d["put_gex"] != 0]
-    put_wall = min(put_wall_data, key=lambda x: x["put_gex"])["strike"] if put_wall_data else None
-    
-    # Zero Gamma
-    total_gex_by_strike = np.array([d["call_gex"] + d["put_gex"] for d in data])
-    strike_array = np.array([d["strike"] for d in data])
-    zero_gamma = None
-    
-    try:
-        sign_change_indices = np.where(np.diff(np.sign(total_gex_by_strike)))[0]
-        if len(sign_change_indices) > 0:
-            closest_flip_idx = sign_change_indices[np.argmin(np.abs(strike_array[sign_change_indices] - spot_price))]
-            x1, x2 = strike_array[closest_flip_idx], strike_array[closest_flip_idx + 1]
-            y1, y2 = total_gex_by_strike[closest_flip_idx], total_gex_by_strike[closest_flip_idx + 1]
-            if (y2 - y1) != 0:
-                zero_gamma = x1 - y1 * (x2 - x1) / (y2 - y1)
-    except Exception:
-        pass
+    # 计算GEX（合并结果，指定到期日时附上每个到期日各自的结果）
+    expiration_dates = [expiration_date_str(ts) for ts in selected_ts] if expirations is not None else None
+    return gex_from_chain(chain, spot_price, closest_expiration_date, expiration_dates), chain
+
+def gex_from_chain(chain, spot_price, expiration_date, expiration_dates=None, now_ts=None):
+    """
+    用期权链数组（ChainArrays）按给定现货价格计算GEX，结果格式与 calculate_gex_data 相同
+    
+    只依赖链中的行权价、OI、Volume 和 mark_iv，因此现货变化时可以直接用缓存的链重新计算，
+    不需要重新请求期权链
+    expiration_date: 结果中的 expiration_date（最近的选中到期日）
+    expiration_dates: 'YYYY-MM-DD' 列表；指定时在 "expirations" 字段中附上每个到期日各自的结果
+    now_ts: 计算到期时间所用的毫秒时间戳，默认当前时间
+    """
+    gex_oi = gex_vol = np.zeros(0)
+    if len(chain.strike):
+        # 一次性计算所有到期日的Greeks和GEX（完全自定义）
+        with GEX_STAGE_SECONDS.time(stage="greeks"):
+            T_arr = time_to_expiry(chain.expiration_ts, now_ts)
+            gex_oi, gex_vol = gex_contributions(
+                spot_price, chain.strike, T_arr, RISK_FREE_RATE, chain.sigma, chain.is_call,
+                chain.contract_size, chain.open_interest, chain.volume
+            )
+    
+    with GEX_STAGE_SECONDS.time(stage="aggregation"):
+        columns = (chain.strike, chain.is_call, chain.open_interest, chain.volume, gex_oi, gex_vol)
+        strike_gex = aggregate_by_strike(*columns)[0]
+        if expiration_dates is not None:
+            # 每个合约所属到期日在 expiration_dates 中的序号
+            position = {date: i for i, date in enumerate(expiration_dates)}
+            expiries, expiry_index = np.unique(chain.expiration_ts, return_inverse=True)
+            group = np.array([position[expiration_date_str(ts)] for ts in expiries.tolist()], dtype=int)[expiry_index]
+            by_expiry = aggregate_by_strike(*columns, group, len(expiration_dates))
+    
+    with GEX_STAGE_SECONDS.time(stage="levels"):
+        result = summarize_gex(strike_gex, spot_price, expiration_date)
+        if expiration_dates is not None:
+            result["expiration_dates"] = list(expiration_dates)
+            result["expirations"] = []
+            for date, expiry_gex in zip(expiration_dates, by_expiry):
+                expiry_result = summarize_gex(expiry_gex, spot_price, date)
+                expiry_result.pop("spot_price", None)
+                result["expirations"].append(expiry_result)
+    return result
+
+def reprice_snapshot(currency: str, chain, previous):
+    """
+    现货更新：只重新获取现货价格，用缓存的期权链重新计算上一次快照 previous
+    （保留其 expiration_date / expiration_dates），不重新请求期权链
+    """
+    spot_price = fetch_spot_price(currency)
+    gex_details = gex_from_chain(chain, spot_price, previous.get("expiration_date"), previous.get("expiration_dates"))
+    gex_details["spot_price"] = spot_price
+    return gex_details
+
+def zero_crossing(strikes, net_by_strike, spot_price):
+    """净GEX在相邻行权价间变号的区间中，取离现货最近的一个线性插值得到零Gamma；没有变号时 None"""
+    flips = np.flatnonzero(np.diff(np.sign(net_by_strike)))
+    if not len(flips):
+        return None
+    i = flips[np.argmin(np.abs(strikes[flips] - spot_price))]
+    x1, x2 = strikes[i], strikes[i + 1]
+    y1, y2 = net_by_strike[i], net_by_strike[i + 1]
+    if y2 - y1 == 0:
+        return None
+    return float(x1 - y1 * (x2 - x1) / (y2 - y1))
+
+def summarize_gex(strike_gex, spot_price, expiration_date):
+    """
+    根据按行权价汇总的GEX计算每个行权价的数据和关键指标，全部在数组上完成
+    
+    strike_gex: StrikeGex（aggregate_by_strike 的结果）
+    expiration_date: 'YYYY-MM-DD'
+    """
+    strikes = strike_gex.strike
+    if not len(strikes):
+        return {"data": [], "zero_gamma": None, "call_wall": None, "put_wall": None, "expiration_date": expiration_date,
+                "spot_price": spot_price}
+    
+    # 每个行权价的数据（call_gex / put_gex 为 Volume 口径）
+    call_gex, put_gex = strike_gex.vol_call_gex, strike_gex.vol_put_gex
+    columns = (strikes, call_gex, put_gex, strike_gex.call_oi + strike_gex.put_oi,
+               strike_gex.call_volume + strike_gex.put_volume, strike_gex.call_oi, strike_gex.put_oi,
+               strike_gex.call_volume, strike_gex.put_volume)
+    data = [dict(zip(ROW_FIELDS, row)) for row in zip(*(column.tolist() for column in columns))]
+    
+    # OI指标
+    total_oi_call_gex = float(strike_gex.oi_call_gex.sum())
+    total_oi_put_gex = float(strike_gex.oi_put_gex.sum())
+    
+    # Call Wall 和 Put Wall（相同时取行权价较小的）
+    call_wall = strikes[np.argmax(call_gex)]
+    nonzero_put = np.flatnonzero(put_gex)
+    put_wall = strikes[nonzero_put[np.argmin(put_gex[nonzero_put])]] if len(nonzero_put) else None
+    
+    # Zero Gamma（按行权价的 Volume 口径净GEX，OI 和 Volume 口径的零Gamma相同）
+    zero_gamma = zero_crossing(strikes, call_gex + put_gex, spot_price)
     
     # Volume指标
-    vol_data = [{"strike": s, "call_gex": gex_by_strike[s]["vol"]["call_gex"], "put_gex": gex_by_strike[s]["vol"]["put_gex"]} for s in strikes]
-    total_vol_call_gex = sum(d["call_gex"] for d in vol_data)
-    total_vol_put_gex = sum(d["put_gex"] for d in vol_data)
-    net_vol_gex = total_vol_call_gex + total_vol_put_gex
-    
-    # Volume Zero Gamma
-    total_vol_gex_by_strike = np.array([d["call_gex"] + d["put_gex"] for d in vol_data])
-    zero_gamma_vol = None
-    try:
-        sign_change_indices_vol = np.where(np.diff(np.sign(total_vol_gex_by_strike)))[0]
-        if len(sign_change_indices_vol) > 0:
-            closest_flip_idx_vol = sign_change_indices_vol[np.argmin(np.abs(strike_array[sign_change_indices_vol] - spot_price))]
-            x1_vol, x2_vol = strike_array[closest_flip_idx_vol], strike_array[closest_flip_idx_vol + 1]
-            y1_vol, y2_vol = total_vol_gex_by_strike[closest_flip_idx_vol], total_vol_gex_by_strike[closest_flip_idx_vol + 1]
-            if (y2_vol - y1_vol) != 0:
-                zero_gamma_vol = x1_vol - y1_vol * (x2_vol - x1_vol) / (y2_vol - y1_vol)
-    except Exception:
-        pass
+    total_vol_call_gex = float(call_gex.sum())
+    total_vol_put_gex = float(put_gex.sum())
     
     return {
         "data": data,
-        "expiration_date": closest_expiration_date.strftime('%Y-%m-%d'),
+        "expiration_date": expiration_date,
         "spot_price": spot_price,
         
         # GEX by Open Interest
-        "zero_gamma": float(zero_gamma) if zero_gamma is not None else None,
-        "call_wall": float(call_wall) if call_wall is not None else None,
+        "zero_gamma": zero_gamma,
+        "call_wall": float(call_wall),
         "put_wall": float(put_wall) if put_wall is not None else None,
         "total_oi_call_gex": total_oi_call_gex,
         "total_oi_put_gex": total_oi_put_gex,
-        "net_oi_gex": net_oi_gex,
+        "net_oi_gex": total_oi_call_gex + total_oi_put_gex,
 
         # GEX by Volume
-        "zero_gamma_vol": float(zero_gamma_vol) if zero_gamma_vol is not None else None,
+        "zero_gamma_vol": zero_gamma,
         "total_vol_call_gex": total_vol_call_gex,
         "total_vol_put_gex": total_vol_put_gex,
-        "net_vol_gex": net_vol_gex
-    } 
\ No newline at end of file
+        "net_vol_gex": total_vol_call_gex + total_vol_put_gex
+    }
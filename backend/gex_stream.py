@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+通过 Deribit JSON-RPC WebSocket 实时维护期权链和GEX
+
+启动时用一次 book summary 建立最近到期日期权链的初始状态，之后订阅每个合约的 ticker
+频道和现货价格频道。每条 ticker 消息只更新对应合约及其行权价的GEX贡献，/gex 直接读取当前状态。
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from websockets.asyncio.client import connect
+
+from gex_calculator import (
+    RISK_FREE_RATE,
+    ChainArrays,
+    fetch_chain_quotes,
+    fetch_spot_price,
+    gex_contributions,
+    instrument_cache,
+    time_to_expiry,
+)
+from strike_aggregate import StrikeAggregate
+
+DERIBIT_WS = os.environ.get("DERIBIT_WS", "wss://www.deribit.com/ws/api/v2")
+# ticker 频道推送间隔（"100ms" 或 "agg2"）
+STREAM_INTERVAL = os.environ.get("GEX_STREAM_INTERVAL", "100ms")
+# 整条链按最新现货价格和到期时间重新定价的间隔（秒）
+REPRICE_SECONDS = float(os.environ.get("GEX_STREAM_REPRICE_SECONDS", 1.0))
+# 每次 public/subscribe 请求携带的最大频道数
+SUBSCRIBE_CHUNK = 100
+
+
+def spot_channel(currency: str):
+    """现货价格频道：BTC/ETH 用永续合约 ticker，其余用价格指数"""
+    currency = currency.upper()
+    if currency in ['BTC', 'ETH']:
+        return f"ticker.{currency}-PERPETUAL.{STREAM_INTERVAL}"
+    return f"deribit_price_index.{currency.lower()}_usd"
+
+
+def instrument_currency(instrument_name: str):
+    """合约名对应的币种：BTC-27JUN25-100000-C -> BTC，线性 USDC 合约 SOL_USDC-27JUN25-150-C -> SOL"""
+    return instrument_name.split("-")[0].split("_")[0]
+
+
+class LiveChain:
+    """
+    单个币种最近到期日期权链的实时状态
+
+    每个合约对GEX的贡献单独保存，行情变化时只重算该合约，并用同一行权价上的合约重新汇总该行权价，
+    再 O(log n) 更新 StrikeAggregate 中的总和、Call/Put Wall 和零Gamma变号区间。
+    增量更新使用上一次全量定价时的现货价格；现货价格变化影响所有合约，
+    因此 snapshot() 最多每 REPRICE_SECONDS 秒按最新现货对整条链向量化重新定价一次，
+    其间新的现货价格只用于重新查询离现货最近的零Gamma。
+    """
+
+    def __init__(self, currency: str, metadata, spot_price: float, quotes=None):
+        self.currency = currency.upper()
+        self.expiration_ts = metadata.nearest_expiration
+        self.expiration_date = datetime.utcfromtimestamp(self.expiration_ts / 1000).strftime('%Y-%m-%d')
+        self.names = set(metadata.by_expiration[self.expiration_ts])
+        self.index = metadata.index
+        self.spot_price = spot_price
+        self.updated_at = time.time()
+        self.quotes = {}
+        self.contributions = {}
+        self.strike_names = {}
+        for name in self.names:
+            self.strike_names.setdefault(self.index[name].strike, []).append(name)
+        self.aggregate = StrikeAggregate(self.strike_names)
+        self.lock = threading.Lock()
+        self._priced_spot = spot_price
+        self._priced_at = 0.0
+        for name, quote in (quotes or {}).items():
+            if name in self.names:
+                self.quotes[name] = (quote.get("open_interest") or 0, quote.get("volume") or 0, quote.get("mark_iv") or 0)
+        self.reprice()
+
+    def _refresh_strike(self, strike):
+        """用该行权价上所有合约的贡献重新汇总该行权价"""
+        row = {"count": 0}
+        for name in self.strike_names[strike]:
+            contribution = self.contributions.get(name)
+            if contribution is None:
+                continue
+            side = "call" if self.index[name].option_type == "call" else "put"
+            gex_oi, gex_vol, oi, volume = contribution
+            row["count"] += 1
+            row[f"oi_{side}_gex"] = row.get(f"oi_{side}_gex", 0.0) + gex_oi
+            row[f"vol_{side}_gex"] = row.get(f"vol_{side}_gex", 0.0) + gex_vol
+            row[f"{side}_oi"] = row.get(f"{side}_oi", 0) + oi
+            row[f"{side}_volume"] = row.get(f"{side}_volume", 0) + volume
+        self.aggregate.set_strike(strike, **row)
+
+    def _price(self, name):
+        oi, volume, mark_iv = self.quotes[name]
+        if mark_iv <= 0:
+            self.contributions.pop(name, None)
+            return
+        info = self.index[name]
+        gex_oi, gex_vol = gex_contributions(
+            self._priced_spot, info.strike, time_to_expiry(self.expiration_ts), RISK_FREE_RATE,
+            mark_iv / 100, info.option_type == "call", info.contract_size, oi, volume
+        )
+        self.contributions[name] = (float(gex_oi), float(gex_vol), oi, volume)
+
+    def apply_quote(self, name, open_interest=None, volume=None, mark_iv=None):
+        """应用单个合约的行情更新，只重算该合约及其行权价；未订阅的合约返回 False"""
+        if name not in self.names:
+            return False
+        with self.lock:
+            old_oi, old_volume, old_iv = self.quotes.get(name, (0, 0, 0))
+            self.quotes[name] = (
+                old_oi if open_interest is None else open_interest,
+                old_volume if volume is None else volume,
+                old_iv if mark_iv is None else mark_iv
+            )
+            self._price(name)
+            self._refresh_strike(self.index[name].strike)
+            self.updated_at = time.time()
+        return True
+
+    def set_spot(self, spot_price: float):
+        with self.lock:
+            self.spot_price = spot_price
+            self.updated_at = time.time()
+
+    def reprice(self):
+        """按当前现货价格和到期时间向量化重算整条链"""
+        with self.lock:
+            names = [name for name, quote in self.quotes.items() if quote[2] > 0]
+            self.contributions = {}
+            if names:
+                infos = [self.index[name] for name in names]
+                oi, volume, mark_iv = (np.array(column, dtype=float) for column in zip(*(self.quotes[name] for name in names)))
+                gex_oi, gex_vol = gex_contributions(
+                    self.spot_price,
+                    np.array([info.strike for info in infos], dtype=float),
+                    time_to_expiry(self.expiration_ts),
+                    RISK_FREE_RATE,
+                    mark_iv / 100,
+                    np.array([info.option_type == "call" for info in infos]),
+                    np.array([info.contract_size for info in infos], dtype=float),
+                    oi,
+                    volume
+                )
+                for i, name in enumerate(names):
+                    self.contributions[name] = (float(gex_oi[i]), float(gex_vol[i]), self.quotes[name][0], self.quotes[name][1])
+            for strike in self.strike_names:
+                self._refresh_strike(strike)
+            self._priced_spot = self.spot_price
+            self._priced_at = time.time()
+
+    def chain_arrays(self):
+        """当前有效合约的 ChainArrays（与 calculate_gex_snapshot 返回的格式相同）"""
+        with self.lock:
+            names = [name for name, quote in self.quotes.items() if quote[2] > 0]
+            infos = [self.index[name] for name in names]
+            return ChainArrays(
+                np.array([info.strike for info in infos], dtype=float),
+                np.array([info.option_type == "call" for info in infos], dtype=bool),
+                np.array([info.contract_size for info in infos], dtype=float),
+                np.array([self.quotes[name][0] for name in names], dtype=float),
+                np.array([self.quotes[name][1] for name in names], dtype=float),
+                np.array([self.quotes[name][2] / 100 for name in names], dtype=float),
+                np.full(len(names), float(self.expiration_ts))
+            )
+
+    def snapshot(self):
+        """当前GEX结果，格式与 calculate_gex_data 相同"""
+        if time.time() - self._priced_at >= REPRICE_SECONDS:
+            self.reprice()
+        with self.lock:
+            gex_details = self.aggregate.summary(self.spot_price, self.expiration_date)
+            gex_details["spot_price"] = self.spot_price
+            gex_details["stream_updated_at"] = self.updated_at
+        return gex_details
+
+
+def bootstrap_chain(currency: str):
+    """用 REST 接口（一次 book summary）建立初始期权链状态"""
+    metadata = instrument_cache.get(currency)
+    quotes = fetch_chain_quotes(currency, metadata.by_expiration[metadata.nearest_expiration], "book")
+    return LiveChain(currency, metadata, fetch_spot_price(currency), quotes)
+
+
+class DeribitStream:
+    """
+    订阅 Deribit WebSocket 并维护多个币种的 LiveChain
+
+    url: WebSocket 地址（可指向本地回放服务器）
+    bootstrap: currency -> LiveChain，默认 bootstrap_chain
+    record_path: 若设置，把收到的每条原始消息追加写入该 JSONL 文件，供回放服务器使用
+    """
+
+    def __init__(self, currencies, url: str = DERIBIT_WS, bootstrap=bootstrap_chain, record_path: str = None,
+                 heartbeat: int = 30, reconnect_delay: float = 1.0):
+        self.currencies = [c.upper() for c in currencies]
+        self.url = url
+        self.bootstrap = bootstrap
+        self.record_path = record_path
+        self.heartbeat = heartbeat
+        self.reconnect_delay = reconnect_delay
+        self.chains = {}
+        self.connected = threading.Event()
+        self._loop = None
+        self._thread = None
+        self._task = None
+        self._request_id = 0
+
+    # --- 生命周期 ---
+
+    def start(self):
+        """在后台线程中运行订阅循环"""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="deribit-stream", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_task(), self._loop).result()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._cancel_task(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._thread = None
+
+    async def _start_task(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def _cancel_task(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def snapshot(self, currency: str):
+        """币种的当前GEX，尚未建立状态时返回 None"""
+        chain = self.chains.get(currency.upper())
+        return chain.snapshot() if chain is not None else None
+
+    def chain_arrays(self, currency: str):
+        """币种当前期权链的 ChainArrays，尚未建立状态时返回 None"""
+        chain = self.chains.get(currency.upper())
+        return chain.chain_arrays() if chain is not None else None
+
+    # --- 订阅循环 ---
+
+    async def run(self):
+        """断线或最近到期日过期后重新建立状态并重新订阅"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                for currency in self.currencies:
+                    self.chains[currency] = await loop.run_in_executor(None, self.bootstrap, currency)
+                expires_in = min(chain.expiration_ts for chain in self.chains.values()) / 1000 - time.time()
+                await asyncio.wait_for(self._session(), timeout=max(expires_in, 1.0))
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                print("Nearest expiration passed, re-subscribing stream")
+            except Exception as e:
+                print(f"Stream error: {e}")
+            finally:
+                self.connected.clear()
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _next_id(self):
+        self._request_id += 1
+        return self._request_id
+
+    async def _send(self, ws, method, params):
+        await ws.send(json.dumps({"jsonrpc": "2.0", "id": self._next_id(), "method": method, "params": params}))
+
+    async def _session(self):
+        async with connect(self.url, max_size=None) as ws:
+            await self._send(ws, "public/set_heartbeat", {"interval": self.heartbeat})
+            channels = []
+            for currency, chain in self.chains.items():
+                channels.append(spot_channel(currency))
+                channels.extend(f"ticker.{name}.{STREAM_INTERVAL}" for name in sorted(chain.names))
+            for i in range(0, len(channels), SUBSCRIBE_CHUNK):
+                await self._send(ws, "public/subscribe", {"channels": channels[i:i + SUBSCRIBE_CHUNK]})
+            self.connected.set()
+            print(f"Stream subscribed to {len(channels)} channels")
+
+            record = open(self.record_path, "a") if self.record_path else None
+            try:
+                async for raw in ws:
+                    if record is not None:
+                        record.write(json.dumps({"ts": time.time(), "message": json.loads(raw)}) + "\n")
+                    reply = self.handle_message(json.loads(raw))
+                    if reply is not None:
+                        await self._send(ws, *reply)
+            finally:
+                if record is not None:
+                    record.close()
+
+    def handle_message(self, message):
+        """
+        处理一条 JSON-RPC 消息，更新对应的 LiveChain
+        返回需要回复服务器的 (method, params)，否则返回 None
+        """
+        method = message.get("method")
+        if method == "heartbeat":
+            if message.get("params", {}).get("type") == "test_request":
+                return ("public/test", {})
+            return None
+        if method != "subscription":
+            if "error" in message:
+                print(f"Stream request error: {message['error']}")
+            return None
+
+        channel = message["params"]["channel"]
+        data = message["params"]["data"]
+        kind, _, rest = channel.partition(".")
+        if kind == "deribit_price_index":
+            currency = rest.split("_")[0].upper()
+            if currency in self.chains:
+                self.chains[currency].set_spot(data["price"])
+        elif kind == "ticker":
+            instrument_name = rest.rsplit(".", 1)[0]
+            chain = self.chains.get(instrument_currency(instrument_name))
+            if chain is None:
+                return None
+            if instrument_name.endswith("-PERPETUAL"):
+                chain.set_spot(data["mark_price"])
+            else:
+                chain.apply_quote(
+                    instrument_name,
+                    open_interest=data.get("open_interest"),
+                    volume=data.get("stats", {}).get("volume"),
+                    mark_iv=data.get("mark_iv")
+                )
+        return None
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Redis 中的GEX历史快照
+
+标量指标（net GEX、零Gamma、Call/Put Wall、现货价格）和每个行权价的完整数据分开保存在两个有序集合中，
+都用 msgpack 紧凑编码；每个行权价的数据按列存成 float64 数组。
+标量指标另外按多个分辨率增量降采样成K线（每个层级有固定的保留时间，数量有上限），
+用于长时间范围的查询。
+每次刷新的写入、过期清理、K线更新和所有窗口的变化量查询合并成一次 pipeline 往返。
+K线用 Lua 脚本比较后写入：Redis 中当前区间的K线与本进程上次看到的不同（其它进程写过，
+如租约转移或不共享快照的多个 worker）时不覆盖，而是并入那根K线后重试。
+"""
+import msgpack
+import numpy as np
+
+from gex_calculator import ROW_FIELDS
+from metrics import REDIS_OPERATION_SECONDS
+
+# 完整快照保留时间（秒），需大于最长的变化量窗口
+HISTORY_RETENTION_SECONDS = 35 * 60
+# 原始标量指标保留时间（秒）
+RAW_RETENTION_SECONDS = 3600
+# 降采样层级: (名称, 分辨率秒, 保留秒)
+HISTORY_TIERS = (
+    ("1m", 60, 24 * 3600),
+    ("15m", 15 * 60, 90 * 24 * 3600),
+)
+# 自动选择分辨率时单次查询的最大点数
+MAX_HISTORY_POINTS = 1500
+# max_change_gex 的窗口（分钟）
+CHANGE_WINDOWS = (1, 5, 10, 15, 30)
+# 标量指标的字段顺序
+METRIC_FIELDS = ("timestamp", "net_vol_gex", "net_oi_gex", "zero_gamma", "call_wall", "put_wall", "spot_price")
+# K线字段：open/high/low/close 为 net_vol_gex，其余为该区间最后一次快照的值
+BAR_FIELDS = ("timestamp", "count", "open", "high", "low", "close", "net_oi_gex", "zero_gamma", "call_wall", "put_wall", "spot_price")
+# K线冲突时的最多重试次数
+BAR_WRITE_ATTEMPTS = 5
+
+# 当前区间（分数 ARGV[1]）的K线等于 ARGV[2]（空字符串表示没有）时替换为 ARGV[3] 并清理早于 ARGV[4] 的K线，
+# 返回 {1}；否则不写入，返回 {0, 当前的K线（没有时为空字符串）}
+WRITE_BAR_SCRIPT = """
+local current = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[1])[1] or ''
+if current ~= ARGV[2] then
+    return {0, current}
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[1])
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[4])
+return {1}
+"""
+
+
+def _pack(gex_details):
+    packed = {k: v for k, v in gex_details.items() if k not in ("data", "expirations")}
+    if "data" in gex_details:
+        rows = gex_details["data"]
+        packed["data"] = {
+            field: np.array([row[field] for row in rows], dtype="<f8").tobytes()
+            for field in ROW_FIELDS
+        }
+    if "expirations" in gex_details:
+        packed["expirations"] = [_pack(expiry) for expiry in gex_details["expirations"]]
+    return packed
+
+
+def _unpack(packed):
+    gex_details = dict(packed)
+    if "data" in packed:
+        columns = {field: np.frombuffer(packed["data"][field], dtype="<f8").tolist() for field in ROW_FIELDS}
+        gex_details["data"] = [dict(zip(ROW_FIELDS, values)) for values in zip(*(columns[f] for f in ROW_FIELDS))]
+    if "expirations" in packed:
+        gex_details["expirations"] = [_unpack(expiry) for expiry in packed["expirations"]]
+    return gex_details
+
+
+def encode_snapshot(gex_details) -> bytes:
+    """把 calculate_gex_data 格式的结果编码为紧凑的 msgpack 字节串"""
+    return msgpack.packb(_pack(gex_details), use_bin_type=True)
+
+
+def decode_snapshot(blob: bytes):
+    """encode_snapshot 的逆操作"""
+    return _unpack(msgpack.unpackb(blob, raw=False))
+
+
+def encode_metrics(gex_details) -> bytes:
+    return msgpack.packb([gex_details.get(field) for field in METRIC_FIELDS])
+
+
+def decode_metrics(blob: bytes):
+    return dict(zip(METRIC_FIELDS, msgpack.unpackb(blob)))
+
+
+def encode_bar(bar) -> bytes:
+    return msgpack.packb([bar[field] for field in BAR_FIELDS])
+
+
+def decode_bar(blob: bytes):
+    return dict(zip(BAR_FIELDS, msgpack.unpackb(blob)))
+
+
+def update_bar(bar, bar_start, metrics):
+    """把一条标量指标并入 bar_start 开始的K线，bar 为 None 或属于更早的区间时新建"""
+    value = metrics["net_vol_gex"]
+    if bar is None or bar["timestamp"] != bar_start:
+        bar = {"timestamp": bar_start, "count": 0, "open": value, "high": value, "low": value}
+    if bar["open"] is None:
+        bar["open"] = value
+    if value is not None:
+        bar["high"] = value if bar["high"] is None else max(bar["high"], value)
+        bar["low"] = value if bar["low"] is None else min(bar["low"], value)
+    bar["count"] += 1
+    bar["close"] = value
+    for field in ("net_oi_gex", "zero_gamma", "call_wall", "put_wall", "spot_price"):
+        bar[field] = metrics[field]
+    return bar
+
+
+class GexHistoryStore:
+    """
+    redis_client: redis-py 客户端
+    async_redis: 可选的 redis.asyncio 客户端，供 aquery 在事件循环中查询
+    name: 历史名称，如 "BTC" 或 "BTC:all"（按到期日选择区分）
+    tiers: 降采样层级，见 HISTORY_TIERS
+    """
+
+    def __init__(self, redis_client, retention_seconds: float = HISTORY_RETENTION_SECONDS, windows=CHANGE_WINDOWS,
+                 raw_retention_seconds: float = RAW_RETENTION_SECONDS, tiers=HISTORY_TIERS, async_redis=None):
+        self.redis = redis_client
+        self.async_redis = async_redis
+        self.retention_seconds = retention_seconds
+        self.raw_retention_seconds = max(raw_retention_seconds, windows[-1] * 60 + 60)
+        self.windows = windows
+        self.tiers = tiers
+        # 每个 (name, 层级) 本进程最近写入（或从 Redis 读到）的K线: (bar, 编码后的字节串)
+        self._open_bars = {}
+        self._write_bar = redis_client.register_script(WRITE_BAR_SCRIPT)
+
+    def metrics_key(self, name: str):
+        return f"gex_metrics:{name}"
+
+    def snapshots_key(self, name: str):
+        return f"gex_snapshots:{name}"
+
+    def bars_key(self, name: str, tier: str):
+        return f"gex_bars:{name}:{tier}"
+
+    def _next_bar(self, name: str, tier: str, bar_start: float, metrics, current=None):
+        """
+        并入 metrics 后的K线，返回 (bar, 写入前预期的字节串, 新的字节串)；时间回退时 None
+        current: Redis 中该区间实际的K线字节串（比较失败后），None 时使用本进程上次看到的
+        """
+        if current is None:
+            bar, blob = self._open_bars.get((name, tier)) or (None, b"")
+            if bar is not None and bar["timestamp"] > bar_start:
+                return None
+            if bar is None or bar["timestamp"] != bar_start:
+                blob = b""
+        else:
+            blob = current
+            bar = decode_bar(current) if current else None
+        bar = update_bar(bar, bar_start, metrics)
+        return bar, blob, encode_bar(bar)
+
+    def record(self, name: str, gex_details, snapshot: bool = True):
+        """
+        保存快照、更新各层级K线，并返回 max_change_gex（各窗口 net_vol_gex 的变化量），一次往返完成
+        gex_details 需包含 timestamp
+        snapshot: 是否同时保存每个行权价的完整快照；只更新现货价格时为 False，只写标量指标和K线
+        """
+        now_ts = gex_details["timestamp"]
+        metrics_key = self.metrics_key(name)
+        snapshots_key = self.snapshots_key(name)
+        metrics = dict(zip(METRIC_FIELDS, (gex_details.get(field) for field in METRIC_FIELDS)))
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(metrics_key, {encode_metrics(gex_details): now_ts})
+        pipe.zremrangebyscore(metrics_key, "-inf", now_ts - self.raw_retention_seconds)
+        if snapshot:
+            pipe.zadd(snapshots_key, {encode_snapshot(gex_details): now_ts})
+            pipe.zremrangebyscore(snapshots_key, "-inf", now_ts - self.retention_seconds)
+        bar_writes = []
+        for tier, resolution, retention in self.tiers:
+            bar_start = now_ts - now_ts % resolution
+            update = self._next_bar(name, tier, bar_start, metrics)
+            if update is None:
+                continue  # 时间回退，忽略
+            bar_writes.append((tier, bar_start, now_ts - retention, update))
+            # 用新的K线替换同一区间的旧K线（Redis 中的K线与预期一致时）
+            self._write_bar(keys=[self.bars_key(name, tier)], args=[bar_start, update[1], update[2], now_ts - retention],
+                            client=pipe)
+        for minutes in self.windows:
+            # 目标时间之前最近的一条指标
+            pipe.zrevrangebyscore(metrics_key, now_ts - minutes * 60, "-inf", start=0, num=1)
+        with REDIS_OPERATION_SECONDS.time(operation="record"):
+            results = pipe.execute()
+        bar_results = results[-len(self.windows) - len(bar_writes):len(results) - len(self.windows)]
+        for (tier, bar_start, cutoff, update), result in zip(bar_writes, bar_results):
+            self._settle_bar(name, tier, bar_start, cutoff, metrics, update, result)
+
+        current_net_gex = gex_details.get("net_vol_gex")
+        changes = {}
+        for minutes, past in zip(self.windows, results[-len(self.windows):]):
+            change = None
+            if past and current_net_gex is not None:
+                past_net_gex = decode_metrics(past[0])["net_vol_gex"]
+                if past_net_gex is not None:
+                    change = current_net_gex - past_net_gex
+            changes[f"{minutes}min"] = change
+        return changes
+
+    def _settle_bar(self, name: str, tier: str, bar_start: float, cutoff: float, metrics, update, result):
+        """K线写入的结果：成功时记住它；其它进程写过该区间时并入 Redis 中的K线后重试"""
+        for _ in range(BAR_WRITE_ATTEMPTS):
+            if result[0] == 1:
+                self._open_bars[(name, tier)] = (update[0], update[2])
+                return
+            update = self._next_bar(name, tier, bar_start, metrics, current=result[1])
+            with REDIS_OPERATION_SECONDS.time(operation="write_bar"):
+                result = self._write_bar(keys=[self.bars_key(name, tier)], args=[bar_start, update[1], update[2], cutoff],
+                                         client=self.redis)
+        print(f"Giving up on the {tier} bar of {name} at {bar_start} after {BAR_WRITE_ATTEMPTS} conflicting writes")
+        self._open_bars.pop((name, tier), None)
+
+    def pick_resolution(self, start: float, end: float, now: float, max_points: int = MAX_HISTORY_POINTS):
+        """选择能覆盖 [start, end] 且点数不超过 max_points 的最细分辨率"""
+        if start >= now - self.raw_retention_seconds:
+            return "raw"
+        for tier, resolution, retention in self.tiers:
+            if start >= now - retention and (end - start) / resolution <= max_points:
+                return tier
+        return self.tiers[-1][0]
+
+    def _range(self, name: str, resolution: str):
+        """(有序集合键, 解码函数)"""
+        if resolution == "raw":
+            return self.metrics_key(name), decode_metrics
+        if resolution not in {tier for tier, _, _ in self.tiers}:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        return self.bars_key(name, resolution), decode_bar
+
+    def query(self, name: str, start: float, end: float, resolution: str = "raw"):
+        """
+        查询 [start, end] 内的历史点，不扫描完整快照
+        resolution: "raw" 为原始标量指标，其它为 HISTORY_TIERS 中的层级名（返回K线）
+        """
+        key, decode = self._range(name, resolution)
+        with REDIS_OPERATION_SECONDS.time(operation="query"):
+            blobs = self.redis.zrangebyscore(key, start, end)
+        return [decode(blob) for blob in blobs]
+
+    async def aquery(self, name: str, start: float, end: float, resolution: str = "raw"):
+        """query 的异步版本，使用 async_redis"""
+        key, decode = self._range(name, resolution)
+        with REDIS_OPERATION_SECONDS.time(operation="query"):
+            blobs = await self.async_redis.zrangebyscore(key, start, end)
+        return [decode(blob) for blob in blobs]
+
+    def latest_snapshot(self, name: str):
+        """最近一次保存的完整快照，没有则 None"""
+        with REDIS_OPERATION_SECONDS.time(operation="latest_snapshot"):
+            blobs = self.redis.zrevrange(self.snapshots_key(name), 0, 0)
+        return decode_snapshot(blobs[0]) if blobs else None
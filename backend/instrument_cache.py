@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+期权合约元数据缓存
+
+行权价、合约大小、到期日在一天内几乎不变，因此按币种缓存 get_instruments 的结果，
+在最近到期日过去、出现新上市合约或超过最大缓存时间时才重新下载。
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from scheduler import SingleFlight
+
+# 元数据最长缓存时间（秒），兜底发现新上市合约
+INSTRUMENT_CACHE_MAX_AGE = float(os.environ.get("INSTRUMENT_CACHE_MAX_AGE", 3600))
+
+InstrumentInfo = namedtuple("InstrumentInfo", ["strike", "option_type", "expiration_timestamp", "contract_size"])
+# 全部合约的元数据列数组（按 instruments 顺序），expiration_ts 为毫秒时间戳
+InstrumentColumns = namedtuple("InstrumentColumns", ["strike", "is_call", "contract_size", "expiration_ts"])
+
+
+class InstrumentMetadata:
+    """
+    单个币种的合约元数据快照，含 instrument_name -> InstrumentInfo 索引，
+    以及列数组 columns 和每个到期日的合约在列数组中的位置 rows_by_expiration（与 by_expiration 顺序一致）
+    """
+
+    def __init__(self, currency: str, instruments, fetched_at: float):
+        self.currency = currency
+        self.instruments = instruments
+        self.fetched_at = fetched_at
+        self.index = {
+            inst["instrument_name"]: InstrumentInfo(
+                inst["strike"],
+                inst["option_type"],
+                inst["expiration_timestamp"],
+                inst.get("contract_size", 1.0)
+            )
+            for inst in instruments
+        }
+        self.by_expiration = {}
+        rows_by_expiration = {}
+        for row, inst in enumerate(instruments):
+            self.by_expiration.setdefault(inst["expiration_timestamp"], []).append(inst["instrument_name"])
+            rows_by_expiration.setdefault(inst["expiration_timestamp"], []).append(row)
+        self.rows_by_expiration = {ts: np.array(rows, dtype=int) for ts, rows in rows_by_expiration.items()}
+        self.columns = InstrumentColumns(
+            np.array([inst["strike"] for inst in instruments], dtype=float),
+            np.array([inst["option_type"] == "call" for inst in instruments], dtype=bool),
+            np.array([inst.get("contract_size", 1.0) for inst in instruments], dtype=float),
+            np.array([inst["expiration_timestamp"] for inst in instruments], dtype=float)
+        )
+        self.expirations = sorted(self.by_expiration)
+        self.nearest_expiration = self.expirations[0] if self.expirations else None
+
+    def is_stale(self, now: float = None, max_age: float = INSTRUMENT_CACHE_MAX_AGE):
+        """最近到期日已过或缓存超时则视为过期"""
+        now = time.time() if now is None else now
+        if now - self.fetched_at >= max_age:
+            return True
+        return self.nearest_expiration is not None and now * 1000 >= self.nearest_expiration
+
+    def has_new_listings(self, instrument_names):
+        """给定的合约名中是否有索引里不存在的（即新上市合约）"""
+        return any(name not in self.index for name in instrument_names)
+
+
+class InstrumentCache:
+    """
+    按币种缓存合约元数据；fetch 为 currency -> get_instruments 结果列表 的函数
+    下载在锁外进行，同一币种的并发调用通过 single-flight 共享一次下载，不阻塞其它币种
+    """
+
+    def __init__(self, fetch, max_age: float = INSTRUMENT_CACHE_MAX_AGE):
+        self.fetch = fetch
+        self.max_age = max_age
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._loads = SingleFlight()
+
+    def get(self, currency: str) -> InstrumentMetadata:
+        """获取币种的元数据，必要时重新下载"""
+        currency = currency.upper()
+        with self._lock:
+            metadata = self._entries.get(currency)
+        if metadata is not None and not metadata.is_stale(max_age=self.max_age):
+            return metadata
+        return self._loads.do(currency, lambda: self._load(currency))
+
+    def _load(self, currency: str) -> InstrumentMetadata:
+        metadata = InstrumentMetadata(currency, self.fetch(currency), time.time())
+        with self._lock:
+            self._entries[currency] = metadata
+        return metadata
+
+    def invalidate(self, currency: str = None):
+        """使某个币种（或全部）的缓存失效"""
+        with self._lock:
+            if currency is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(currency.upper(), None)
+
+    def check_new_listings(self, currency: str, instrument_names):
+        """
+        用已经拿到的合约名列表（如 book summary 结果）低成本检查新上市合约，
+        发现新合约时使缓存失效并返回 True，下次 get 时重新下载
+        """
+        with self._lock:
+            metadata = self._entries.get(currency.upper())
+        if metadata is not None and metadata.has_new_listings(instrument_names):
+            print(f"New {currency} listings detected, invalidating instrument cache")
+            self.invalidate(currency)
+            return True
+        return False
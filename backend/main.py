@@ -1,16 +1,56 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fetcher import get_gex_data, fetch_spot_price
-from cachetools import cached, TTLCache
-import json # Import json for pretty printing
+from fetcher import get_gex_snapshot
+from gex_calculator import ChainArrays, instrument_cache, reprice_snapshot, select_expirations
+from deribit_client import get_client
+from gex_stream import DeribitStream
+from scheduler import SnapshotScheduler, STALE_AFTER_TICKS
+from history_store import GexHistoryStore
+from gamma_profile import gamma_profile, PROFILE_POINTS, PROFILE_WIDTH
+from scenarios import run_scenarios, DEFAULT_SPOT_SHOCKS, DEFAULT_VOL_SHOCKS
+from snapshot_diff import VersionLog, diff_snapshots, etag_matches, snapshot_version
+from broadcaster import Broadcaster
+from payload_encoding import EncodedCache, FORMATS, choose_encoding, choose_media_type, variant_tag
+from metrics import GEX_CACHE_REQUESTS, registry
+from shared_snapshots import SharedSnapshots, key_name, pack_snapshot, unpack_snapshot
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
 import os
 import redis
+import redis.asyncio
+import threading
 import time
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    """Runs the live stream and the snapshot scheduler while the app is up"""
+    if stream is not None:
+        stream.start()
+    scheduler.start()
+    try:
+        yield
+    finally:
+        scheduler.stop()
+        if stream is not None:
+            stream.stop()
+        get_client().close()
+        for executor in compute_executors.values():
+            executor.shutdown(wait=False)
+        await async_redis_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Redis aclient
-redis_client = redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
+redis_client = redis.from_url(REDIS_URL)
+# Async client with a bounded connection pool for reads on the event loop
+async_redis_client = redis.asyncio.Redis(connection_pool=redis.asyncio.BlockingConnectionPool.from_url(
+    REDIS_URL, max_connections=int(os.environ.get("REDIS_MAX_CONNECTIONS", 32))
+))
+history_store = GexHistoryStore(redis_client, async_redis=async_redis_client)
 
 # ✅ 允许跨域访问，解决前端（Vercel）访问后端（Railway）被拒问题
 app.add_middleware(
@@ -19,21 +59,149 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Cache", "Age"],
 )
 
-# Cache for 60 seconds
-cache = TTLCache(maxsize=10, ttl=60)
+# Currencies refreshed in the background, each on its own cadence (seconds).
+# GEX_REFRESH_SECONDS sets the default, GEX_REFRESH_SECONDS_<CURRENCY> overrides it.
+SCHEDULED_CURRENCIES = [c for c in os.environ.get("GEX_SCHEDULE_CURRENCIES", "BTC,ETH,SOL,XRP").upper().split(",") if c]
+REFRESH_SECONDS = float(os.environ.get("GEX_REFRESH_SECONDS", 60))
+# Between full refreshes, scheduled currencies re-read only the spot price this
+# often (seconds) and reprice the cached chain. 0 disables the fast path.
+SPOT_REFRESH_SECONDS = float(os.environ.get("GEX_SPOT_REFRESH_SECONDS", 5))
+
+# Anything a request may have to compute (a missing snapshot, the live chain's
+# repricing, serializing a new version) runs on dedicated threads per currency,
+# never on the event loop or FastAPI's shared threadpool, so a slow refresh of
+# one currency cannot delay requests for another. Other currencies share "*".
+COMPUTE_THREADS = int(os.environ.get("GEX_COMPUTE_THREADS", 2))
+compute_executors = {
+    currency: ThreadPoolExecutor(COMPUTE_THREADS, thread_name_prefix=f"gex-compute-{currency}")
+    for currency in dict.fromkeys(SCHEDULED_CURRENCIES + ["BTC", "ETH", "SOL", "XRP", "*"])
+}
+
+async def run_compute(currency: str, fn, *args):
+    """Runs fn(*args) on the currency's compute executor"""
+    executor = compute_executors.get(currency, compute_executors["*"])
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+# Currencies kept live over the Deribit WebSocket, e.g. GEX_STREAM_CURRENCIES=BTC,ETH
+STREAM_CURRENCIES = [c for c in os.environ.get("GEX_STREAM_CURRENCIES", "").upper().split(",") if c]
+stream = DeribitStream(STREAM_CURRENCIES) if STREAM_CURRENCIES else None
+
+# Option chain arrays behind the latest snapshot of each (currency, expirations)
+# key, kept so derived views (gamma profile) can reprice without refetching.
+# key -> (snapshot timestamp, spot price, ChainArrays)
+chains = {}
+# Derived views cached per snapshot: key -> (snapshot timestamp, OrderedDict {params: result}),
+# keeping only the DERIVED_VIEWS_PER_KEY most recently used parameter sets
+derived_cache = {}
+derived_lock = threading.Lock()
+DERIVED_VIEWS_PER_KEY = 8
+# Upper bound on scenario grid cells per request
+MAX_SCENARIO_CELLS = 10000
+# Recent /gex payloads per key, by version, for /gex/diff
+versions = VersionLog()
+# Pushes each new /gex payload to /gex/stream subscribers of its key
+broadcaster = Broadcaster()
+# Serialized (and compressed) /gex bodies of the latest version per key
+encoded_payloads = EncodedCache()
+# Seconds between SSE keep-alive comments when no update arrives
+STREAM_KEEPALIVE_SECONDS = 15
+
+def normalize_expirations(expiration: str = None, expirations: str = None):
+    """
+    Turns the /gex expiry query parameters into a cache key: None for the
+    nearest expiry, "all", or a sorted comma-separated list of dates.
+    """
+    selection = expirations or expiration
+    if not selection:
+        return None
+    if selection.strip().lower() == "all":
+        return "all"
+    return ",".join(sorted({date.strip() for date in selection.split(",") if date.strip()})) or None
+
+def parse_time(value: str):
+    """Accepts unix seconds or an ISO-8601 timestamp (naive values are UTC)."""
+    from datetime import datetime, timezone
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+def parse_floats(value: str, default):
+    """Comma-separated numbers, or `default` when empty."""
+    if not value:
+        return [float(x) for x in default]
+    return [float(x) for x in value.split(",") if x.strip()]
+
+def get_snapshot(key):
+    """
+    scheduler.get(key), rejecting expiry dates the currency does not list
+    before they reach the scheduler, so arbitrary selections never become
+    cached keys or cost a Redis fallback lookup.
+    """
+    if key[1] not in (None, "all") and scheduler.latest(key) is None:
+        select_expirations(instrument_cache.get(key[0]), key[1])
+    return scheduler.get(key)
+
+def cached_view(key, params, compute):
+    """
+    Computes a derived view from the chain behind the latest snapshot of
+    `key`, at most once per snapshot and set of params.
+    compute(snapshot timestamp, spot price, chain) -> dict
+    The chain is missing when the snapshot was adopted without one (a
+    shared snapshot published without chain columns, or the last good
+    snapshot loaded from history during an outage); that raises ValueError
+    until the next successful refresh.
+    """
+    get_snapshot(key)
+    entry = chains.get(key)
+    if entry is None:
+        raise ValueError(f"Option chain for {key[0]} not available yet, retry after the next refresh")
+    snapshot_ts, spot_price, chain = entry
+    with derived_lock:
+        cached_ts, results = derived_cache.get(key, (None, None))
+        if cached_ts != snapshot_ts:
+            results = OrderedDict()
+            derived_cache[key] = (snapshot_ts, results)
+        if params in results:
+            results.move_to_end(params)
+            return results[params]
+    result = {"currency": key[0], "timestamp": snapshot_ts, **compute(snapshot_ts, spot_price, chain)}
+    with derived_lock:
+        results[params] = result
+        while len(results) > DERIVED_VIEWS_PER_KEY:
+            results.popitem(last=False)
+    return result
 
-@cached(cache)
-def get_processed_gex_data(currency: str):
+def get_processed_gex_data(currency: str, expirations: str = None, previous=None):
     """
     Fetches and processes GEX data, using Redis for history snapshots.
+    `expirations` comes from normalize_expirations (None = nearest expiry).
+    With `previous` (the last snapshot's value) only the spot price is
+    fetched and the cached chain behind that snapshot is repriced.
+    Called by the snapshot scheduler; requests read the stored result.
     """
-    print(f"Fetching fresh GEX data for {currency}...")
-    gex_details = get_gex_data(currency)
-    
-    spot_price = fetch_spot_price(currency)
-    gex_details["spot_price"] = spot_price
+    key = (currency, expirations)
+    live_details = stream.snapshot(currency) if stream is not None and expirations is None else None
+    if live_details is not None:
+        gex_details = live_details
+        chain = stream.chain_arrays(currency)
+        chain_updated_at = time.time()
+    elif previous is not None and key in chains:
+        chain = chains[key][2]
+        gex_details = reprice_snapshot(currency, chain, previous)
+        chain_updated_at = previous.get("chain_updated_at")
+    else:
+        print(f"Fetching fresh GEX data for {currency}...")
+        # spot_price is the one the chain was priced at; fetching it again would
+        # pair the gamma levels with a different spot and spend another request
+        gex_details, chain = get_gex_snapshot(currency, expirations)
+        chain_updated_at = time.time()
     
     from datetime import datetime
     now_iso = datetime.utcnow().isoformat() + "Z"
@@ -43,52 +211,323 @@ def get_processed_gex_data(currency: str):
     now_ts = time.time()
     gex_details['timestamp'] = now_ts
     gex_details['currency'] = currency # Add currency to data
+    gex_details['chain_updated_at'] = chain_updated_at # When OI/volume/IV were last fetched
 
-    # Store current snapshot in a Redis sorted set
-    history_key = f"gex_history:{currency}"
-    redis_client.zadd(history_key, {json.dumps(gex_details): now_ts})
-    
-    # Prune snapshots older than 35 minutes
-    redis_client.zremrangebyscore(history_key, "-inf", now_ts - (35 * 60))
+    # Store the snapshot and read back every max-change window in one round trip
+    # (one history per expiry selection). Spot-only updates write the scalar
+    # metrics and bars; the full per-strike snapshot is written once per chain refresh.
+    history_name = currency if expirations is None else f"{currency}:{expirations}"
+    gex_details['max_change_gex'] = history_store.record(history_name, gex_details, snapshot=previous is None)
+    chains[key] = (now_ts, gex_details['spot_price'], chain)
     
-    # --- Calculate Max Change GEX from Redis ---
-    def get_change(minutes_ago):
-        target_ts = now_ts - (minutes_ago * 60)
-        # Find the latest snapshot before the target time
-        past_data_list = redis_client.zrevrangebyscore(history_key, target_ts, "-inf", start=0, num=1)
-        
-        if past_data_list:
-            past_gex = json.loads(past_data_list[0])
-            current_net_gex = gex_details.get('net_vol_gex')
-            past_net_gex = past_gex.get('net_vol_gex')
-
-            if current_net_gex is not None and past_net_gex is not None:
-                return current_net_gex - past_net_gex
-        return None
+    return gex_details
 
-    gex_details['max_change_gex'] = {
-        '1min': get_change(1),
-        '5min': get_change(5),
-        '10min': get_change(10),
-        '15min': get_change(15),
-        '30min': get_change(30),
-    }
-    
+def decode_shared_snapshot(key, blob):
+    """Adopts a snapshot published by another worker, including its chain"""
+    gex_details, chain_entry = unpack_snapshot(blob, ChainArrays)
+    if chain_entry is not None:
+        chains[key] = chain_entry
     return gex_details
 
+# Snapshots shared across workers/replicas through Redis: only the worker holding
+# a key's lease refreshes it (and writes its history); the others adopt the
+# published result. GEX_SHARED_SNAPSHOTS=0 makes every worker refresh on its own.
+shared_snapshots = SharedSnapshots(
+    redis_client,
+    encode=lambda key, gex_details: pack_snapshot(gex_details, chains.get(key)),
+    decode=decode_shared_snapshot
+) if os.environ.get("GEX_SHARED_SNAPSHOTS", "1") != "0" else None
+
+def load_last_good_snapshot(key):
+    """
+    The last good snapshot of `key` kept in Redis, as (created_at, gex_details):
+    the one published for other workers (with its chain), else the latest
+    history entry. None when Redis has neither.
+    """
+    if shared_snapshots is not None:
+        loaded = shared_snapshots.load(key)
+        if loaded is not None:
+            return loaded
+    gex_details = history_store.latest_snapshot(key_name(key))
+    if gex_details is None:
+        return None
+    return gex_details["timestamp"], gex_details
+
+def forget_key(key):
+    """Drops everything cached for a key the scheduler evicted"""
+    chains.pop(key, None)
+    with derived_lock:
+        derived_cache.pop(key, None)
+    versions.discard(key)
+    encoded_payloads.discard(key)
+    broadcaster.discard(key)
+
+def broadcast_snapshot(key):
+    """Pushes the current /gex payload of `key` to /gex/stream subscribers"""
+    if scheduler.latest(key) is not None:
+        broadcaster.publish(key, current_gex_payload(*key))
+
+# Latest completed snapshot per (currency, expirations) key. Scheduled keys are
+# refreshed in the background (with spot-only updates in between); other keys are
+# computed on demand, at most one computation per key at a time, and revalidated
+# in the background once stale. When a refresh fails the last good snapshot
+# (from memory, or from Redis after a restart) keeps being served, marked stale.
+scheduler = SnapshotScheduler(
+    lambda key: get_processed_gex_data(*key),
+    schedule={
+        (currency, None): float(os.environ.get(f"GEX_REFRESH_SECONDS_{currency}", REFRESH_SECONDS))
+        for currency in SCHEDULED_CURRENCIES
+    },
+    max_age=REFRESH_SECONDS,
+    update=lambda key, snapshot: get_processed_gex_data(*key, previous=snapshot.value),
+    update_interval=SPOT_REFRESH_SECONDS,
+    on_store=lambda snapshot: broadcast_snapshot(snapshot.key),
+    shared=shared_snapshots,
+    fallback=load_last_good_snapshot,
+    on_failure=lambda key, error: broadcast_snapshot(key),
+    on_evict=forget_key
+)
+
+# Age of the latest snapshot per key, read at scrape time
+registry.gauge(
+    "gex_snapshot_age_seconds", "Seconds since the latest snapshot of each currency/expiry selection",
+    lambda: [({"currency": snapshot.key[0], "expirations": snapshot.key[1] or "nearest"}, snapshot.age)
+             for snapshot in scheduler.snapshots()]
+)
+
 @app.get("/")
 def home():
     return {"message": "GEX API is operational"}
 
+def stale_reason(key, gex_details):
+    """
+    Why the snapshot of `key` is stale: its last refresh failed, it has not
+    been refreshed for several intervals, or only the spot price has been
+    updated since the option chain was last fetched. None when fresh.
+    """
+    reason = scheduler.stale_reason(key)
+    chain_updated_at = gex_details.get("chain_updated_at")
+    if reason is None and chain_updated_at is not None and key in scheduler.schedule:
+        limit = STALE_AFTER_TICKS * scheduler.schedule[key]
+        if time.time() - chain_updated_at > limit:
+            reason = f"Option chain not refreshed for over {limit:.0f}s"
+    return reason
+
+def current_gex_payload(currency: str, selection: str = None):
+    """
+    The /gex payload for (currency, selection): the latest snapshot, served
+    from the live chain state for the default view when streaming, tagged
+    with its version and remembered for /gex/diff. `stale` (with
+    `stale_reason`) flags a last good snapshot served while upstream fails.
+    """
+    gex_details = get_snapshot((currency, selection)).value
+    live_details = stream.snapshot(currency) if stream is not None and selection is None else None
+    if live_details is not None:
+        # Serve the live chain state; history fields come from the cached snapshot
+        from datetime import datetime
+        last_update_time = datetime.utcfromtimestamp(live_details["stream_updated_at"]).isoformat() + "Z"
+        payload = {**gex_details, **live_details, "last_update_time": last_update_time}
+    else:
+        payload = dict(gex_details)
+    # The live chain state is current even when REST refreshes fail
+    reason = stale_reason((currency, selection), gex_details) if live_details is None else None
+    payload["stale"] = reason is not None
+    if reason is not None:
+        payload["stale_reason"] = reason
+    payload["version"] = snapshot_version(payload)
+    versions.publish((currency, selection), payload["version"], payload)
+    return payload
+
+def snapshot_cache_status(key):
+    """HIT, STALE or MISS for a request about to read the snapshot of `key`"""
+    snapshot = scheduler.latest(key)
+    if snapshot is None:
+        return "MISS"
+    if key not in scheduler.schedule and snapshot.age >= scheduler.max_age:
+        return "STALE"
+    return "HIT"
+
+async def load_gex_payload(key, cache_status: str):
+    """
+    current_gex_payload for `key`: on the event loop when the snapshot is
+    ready, on the currency's compute executor when it must be computed (or
+    the live chain repriced).
+    """
+    if cache_status == "MISS" or (stream is not None and key[1] is None):
+        return await run_compute(key[0], current_gex_payload, *key)
+    return current_gex_payload(*key)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of upstream, compute, cache and Redis metrics"""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/gex")
-def gex(currency: str = "BTC"):
+async def gex(request: Request, currency: str = "BTC", expiration: str = None, expirations: str = None, format: str = "rows"):
     """
     Returns calculated GEX data for a given currency.
+    By default only the nearest expiry is used. `expiration=YYYY-MM-DD` selects
+    another expiry, and `expirations=all` (or a comma-separated list of dates)
+    combines several expiries and adds a per-expiry breakdown.
+    The ETag is the snapshot version plus the variant (format, media type,
+    compression); `If-None-Match` with it returns 304.
+    `format=columnar` returns `data` as one array per field. The body is JSON,
+    or msgpack with `Accept: application/msgpack`, and is compressed per
+    `Accept-Encoding`; each variant is serialized once per snapshot.
+    X-Cache tells whether the snapshot was ready (HIT), served stale while
+    revalidating (STALE) or computed for this request (MISS). While Deribit
+    fails, the last good snapshot is served with `stale: true`; `Age` is the
+    snapshot's age in seconds.
+    Ready snapshots and cached bodies are served on the event loop; computing
+    and serializing run on the currency's compute executor.
     """
     try:
-        return get_processed_gex_data(currency.upper())
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format: {format}")
+        key = (currency.upper(), normalize_expirations(expiration, expirations))
+        cache_status = snapshot_cache_status(key)
+        GEX_CACHE_REQUESTS.inc(result=cache_status.lower())
+        payload = await load_gex_payload(key, cache_status)
+        updated_at = payload.get("stream_updated_at") or payload["timestamp"]
+        media_type = choose_media_type(request.headers.get("accept"))
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+        etag = variant_tag(payload["version"], format, media_type, encoding)
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache", "Vary": "Accept, Accept-Encoding",
+                   "X-Cache": cache_status, "Age": str(max(int(time.time() - updated_at), 0))}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        cached = encoded_payloads.peek(key, payload["version"], format, media_type, encoding)
+        if cached is None:
+            cached = await run_compute(key[0], encoded_payloads.get, key, payload["version"], payload, format, media_type, encoding)
+        body, content_encoding = cached
+        if content_encoding is not None:
+            headers["Content-Encoding"] = content_encoding
+        return Response(body, media_type=media_type, headers=headers)
     except Exception as e:
         # Log the error for debugging
         print(f"Error processing /gex request for {currency}: {e}")
         # 在真实错误发生时返回一个包含错误信息的JSON
         return {"error": str(e), "data": [], "last_update_time": None}
+
+@app.get("/gex/diff")
+async def gex_diff(currency: str = "BTC", since: str = None, expiration: str = None, expirations: str = None):
+    """
+    Returns what changed in /gex since version `since`: changed scalar fields,
+    and only the strikes (and fields within them) that changed, per expiry
+    for multi-expiry selections. When `since`
+    is unknown or too old, the full payload is returned with `full: true`.
+    Computing and diffing run on the currency's compute executor.
+    """
+    try:
+        key = (currency.upper(), normalize_expirations(expiration, expirations))
+        payload = await load_gex_payload(key, snapshot_cache_status(key))
+        previous = versions.get(key, since) if since else None
+        if previous is None:
+            return {**payload, "since": since, "full": True}
+        changes = await run_compute(key[0], diff_snapshots, previous, payload)
+        return {"version": payload["version"], "since": since, "full": False, **changes}
+    except Exception as e:
+        print(f"Error processing /gex/diff request for {currency}: {e}")
+        return {"error": str(e), "data": [], "last_update_time": None}
+
+@app.get("/gex/stream")
+async def gex_stream(request: Request, currency: str = "BTC", expiration: str = None, expirations: str = None):
+    """
+    Server-Sent Events feed of /gex for one currency/expiry selection.
+    The first event is a full `snapshot`; after that each new snapshot is
+    pushed as a `diff` against the previous one (same format as /gex/diff).
+    A client that falls behind loses the oldest queued updates and gets a
+    full `snapshot` again.
+    """
+    key = (currency.upper(), normalize_expirations(expiration, expirations))
+    subscriber = broadcaster.subscribe(key)
+    if broadcaster.latest(key) is None:
+        # First subscriber of a key nobody has published yet: compute it now
+        try:
+            await run_compute(key[0], lambda: broadcaster.publish(key, current_gex_payload(*key)))
+        except Exception as e:
+            broadcaster.unsubscribe(key, subscriber)
+            print(f"Error processing /gex/stream request for {currency}: {e}")
+            return {"error": str(e), "data": [], "last_update_time": None}
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                frame = await subscriber.next_frame(STREAM_KEEPALIVE_SECONDS)
+                if frame is None:
+                    # Keep proxies from closing the connection, and let
+                    # unscheduled keys revalidate once stale
+                    if key not in scheduler.schedule:
+                        await run_compute(key[0], get_snapshot, key)
+                    yield b": keep-alive\n\n"
+                    continue
+                yield frame
+        finally:
+            broadcaster.unsubscribe(key, subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/gex/history")
+async def gex_history(currency: str = "BTC", start: str = Query(None, alias="from"), end: str = Query(None, alias="to"),
+                resolution: str = None, expiration: str = None, expirations: str = None):
+    """
+    Returns net GEX, zero gamma, walls and spot between `from` and `to`
+    (unix seconds or ISO-8601; default: the last hour).
+    `resolution` is "raw", "1m" or "15m" (bars with open/high/low/close of
+    net GEX); when omitted the finest resolution covering the range is used.
+    """
+    try:
+        now_ts = time.time()
+        end_ts = parse_time(end) if end else now_ts
+        start_ts = parse_time(start) if start else end_ts - 3600
+        selection = normalize_expirations(expiration, expirations)
+        history_name = currency.upper() if selection is None else f"{currency.upper()}:{selection}"
+        resolution = resolution or history_store.pick_resolution(start_ts, end_ts, now_ts)
+        points = await history_store.aquery(history_name, start_ts, end_ts, resolution)
+        return {"currency": currency.upper(), "from": start_ts, "to": end_ts, "resolution": resolution, "points": points}
+    except Exception as e:
+        print(f"Error processing /gex/history request for {currency}: {e}")
+        return {"error": str(e), "points": []}
+
+@app.get("/gex/profile")
+async def gex_profile(currency: str = "BTC", points: int = PROFILE_POINTS, width: float = PROFILE_WIDTH,
+                expiration: str = None, expirations: str = None):
+    """
+    Returns net GEX repriced over a grid of `points` hypothetical spots within
+    +/- `width` of the current spot, and the zero gamma level where that curve
+    crosses zero. Computed from the latest snapshot's chain on the currency's
+    compute executor and cached until the next snapshot.
+    """
+    try:
+        points = min(max(points, 3), 2000)
+        width = min(max(width, 0.01), 0.9)
+        key = (currency.upper(), normalize_expirations(expiration, expirations))
+        return await run_compute(key[0], cached_view, key, ("profile", points, width), lambda snapshot_ts, spot_price, chain:
+                                 gamma_profile(chain, spot_price, points, width, now_ts=snapshot_ts * 1000))
+    except Exception as e:
+        print(f"Error processing /gex/profile request for {currency}: {e}")
+        return {"error": str(e), "spots": [], "net_oi_gex": [], "net_vol_gex": []}
+
+@app.get("/gex/scenarios")
+async def gex_scenarios(currency: str = "BTC", spot_shocks: str = None, vol_shocks: str = None,
+                  expiration: str = None, expirations: str = None):
+    """
+    Reprices the latest snapshot's chain over a spot x implied-vol shock grid.
+    `spot_shocks` are relative moves (default -0.1..0.1 in 21 steps) and
+    `vol_shocks` are vol points added to every IV (default -20..20 in 9 steps),
+    both comma-separated. Net GEX, walls and zero gamma are returned as
+    [spot shock][vol shock] grids. Computed on the currency's compute executor.
+    """
+    try:
+        spot_values = parse_floats(spot_shocks, DEFAULT_SPOT_SHOCKS)
+        vol_values = parse_floats(vol_shocks, DEFAULT_VOL_SHOCKS)
+        if len(spot_values) * len(vol_values) > MAX_SCENARIO_CELLS:
+            raise ValueError(f"Scenario grid too large (max {MAX_SCENARIO_CELLS} cells)")
+        key = (currency.upper(), normalize_expirations(expiration, expirations))
+        params = ("scenarios", tuple(spot_values), tuple(vol_values))
+        return await run_compute(key[0], cached_view, key, params, lambda snapshot_ts, spot_price, chain:
+                                 run_scenarios(chain, spot_price, spot_values, vol_values, now_ts=snapshot_ts * 1000))
+    except Exception as e:
+        print(f"Error processing /gex/scenarios request for {currency}: {e}")
+        return {"error": str(e), "net_oi_gex": [], "net_vol_gex": []}
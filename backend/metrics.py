@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+进程内指标（Prometheus 文本格式，由 /metrics 输出）
+
+只依赖标准库：计数器、直方图和按需采集的 gauge。热路径上每次记录只是一次加锁的加法
+（直方图多一次 bisect），采集时才格式化文本。各模块在导入时注册自己的指标:
+    DERIBIT_REQUEST_SECONDS.observe(0.12, method="ticker")
+    with GEX_STAGE_SECONDS.time(stage="greeks"):
+        ...
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = ((name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """单调递增的计数，按标签区分"""
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, labels, value) for labels, value in items]
+
+
+class Histogram:
+    """分桶累计的耗时（秒），按标签区分"""
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [每个桶（含 +Inf）的计数, 总和, 总数]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            entry = self._values.get(tuple(sorted(labels.items())))
+            return entry[2] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        samples = []
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", labels + (("le", format_value(bound)),), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class Gauge:
+    """采集时调用 collect() 得到的当前值: [(labels dict, value)]"""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, collect):
+        self.name = name
+        self.help = help
+        self.collect = collect
+
+    def samples(self):
+        return [(self.name, tuple(sorted(labels.items())), value) for labels, value in self.collect()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """同名指标只注册一次（模块重复导入时返回已有的）"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.register(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def gauge(self, name: str, help: str, collect) -> Gauge:
+        """collect 可以在之后通过 metric.collect = ... 替换"""
+        gauge = self.register(Gauge(name, help, collect))
+        gauge.collect = collect
+        return gauge
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                print(f"Metric collection failed for {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- Deribit 上游请求（deribit_client） ---
+DERIBIT_REQUEST_SECONDS = registry.histogram(
+    "deribit_request_seconds", "Latency of Deribit public API requests, per attempt")
+DERIBIT_ERRORS = registry.counter(
+    "deribit_errors_total", "Failed Deribit request attempts by reason")
+DERIBIT_RETRIES = registry.counter(
+    "deribit_retries_total", "Retried Deribit requests")
+DERIBIT_CIRCUIT_REJECTIONS = registry.counter(
+    "deribit_circuit_rejections_total", "Deribit requests failed fast because the method's circuit was open")
+DERIBIT_RATE_LIMIT_WAIT_SECONDS = registry.histogram(
+    "deribit_rate_limit_wait_seconds", "Time Deribit requests waited for rate-limit credits, by priority")
+
+# --- GEX 计算（gex_calculator） ---
+GEX_STAGE_SECONDS = registry.histogram(
+    "gex_stage_seconds", "Time spent in each GEX computation stage (fetch, greeks, aggregation, levels)")
+GEX_INSTRUMENTS = registry.counter(
+    "gex_instruments_total", "Instruments seen by GEX computations, processed or skipped")
+
+# --- 缓存和 Redis（main / history_store） ---
+GEX_CACHE_REQUESTS = registry.counter(
+    "gex_cache_requests_total", "/gex requests by snapshot cache result (hit, stale, miss)")
+REDIS_OPERATION_SECONDS = registry.histogram(
+    "redis_operation_seconds", "Latency of Redis history operations")
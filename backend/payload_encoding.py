@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+/gex 响应的编码和缓存
+
+- format: "rows"（默认，每个行权价一个对象）或 "columnar"（每个字段一个并行数组）
+- 媒体类型: JSON（有 orjson 时使用 orjson）或 msgpack（Accept: application/msgpack）
+- 压缩: brotli（安装了 brotli 时）或 gzip，按 Accept-Encoding 选择
+同一版本的快照每种组合只编码和压缩一次，之后的请求直接返回缓存的字节串。
+每种组合有自己的强 ETag（variant_tag），响应同时带 Vary: Accept, Accept-Encoding。
+"""
+import gzip
+import json
+import threading
+
+import msgpack
+
+from gex_calculator import ROW_FIELDS
+from snapshot_diff import version_order
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FORMATS = ("rows", "columnar")
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+# 小于该字节数的响应不压缩
+MIN_COMPRESS_BYTES = 1024
+
+
+def to_columnar(payload):
+    """把 data 从逐行对象转成 {字段: 数组}，每个到期日的结果同样转换"""
+    columnar = dict(payload)
+    if "data" in payload:
+        rows = payload["data"]
+        columnar["data"] = {field: [row.get(field) for row in rows] for field in ROW_FIELDS}
+    if "expirations" in payload:
+        columnar["expirations"] = [to_columnar(expiry) for expiry in payload["expirations"]]
+    columnar["format"] = "columnar"
+    return columnar
+
+
+def encode_json(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def encode_payload(payload, format: str = "rows", media_type: str = JSON_MEDIA_TYPE) -> bytes:
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format: {format}")
+    if format == "columnar":
+        payload = to_columnar(payload)
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return msgpack.packb(payload, use_bin_type=True)
+    return encode_json(payload)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def choose_media_type(accept: str) -> str:
+    if accept and ("application/msgpack" in accept or "application/x-msgpack" in accept):
+        return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def choose_encoding(accept_encoding: str):
+    """按 Accept-Encoding 选择 br / gzip，不支持压缩时返回 None"""
+    accepted = {item.split(";")[0].strip() for item in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def variant_tag(version: str, format: str, media_type: str, encoding) -> str:
+    """ETag 的值：快照版本加上格式、媒体类型和压缩，不同的表示不共用同一个强 ETag"""
+    parts = [version, format, "msgpack" if media_type == MSGPACK_MEDIA_TYPE else "json"]
+    if encoding is not None:
+        parts.append(encoding)
+    return ".".join(parts)
+
+
+class EncodedCache:
+    """每个 key 只保留最新版本的编码结果: key -> (version, {(format, media_type, encoding): bytes})"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def peek(self, key, version: str, format: str, media_type: str, encoding):
+        """已缓存的 (body, content_encoding)，没有则 None（不编码，可在事件循环中调用）"""
+        with self._lock:
+            cached_version, variants = self._entries.get(key, (None, {}))
+            if cached_version == version:
+                result = variants.get((format, media_type, encoding))
+                if result is not None:
+                    self.hits += 1
+                return result
+        return None
+
+    def get(self, key, version: str, payload, format: str, media_type: str, encoding):
+        """
+        返回 (body, content_encoding)；content_encoding 为 None 表示未压缩
+        （响应太小时即使客户端支持也不压缩）
+        编码在锁外进行；比缓存中更旧的版本照常编码返回，但不替换缓存
+        """
+        variant = (format, media_type, encoding)
+        with self._lock:
+            cached_version, variants = self._entries.get(key, (None, {}))
+            if cached_version == version and variant in variants:
+                self.hits += 1
+                return variants[variant]
+            self.misses += 1
+        body = encode_payload(payload, format, media_type)
+        content_encoding = encoding if encoding is not None and len(body) >= MIN_COMPRESS_BYTES else None
+        result = (compress(body, content_encoding), content_encoding)
+        with self._lock:
+            cached_version, variants = self._entries.get(key, (None, {}))
+            if cached_version == version:
+                variants[variant] = result
+            elif cached_version is None or version_order(version) > version_order(cached_version):
+                self._entries[key] = (version, {variant: result})
+        return result
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Deribit 请求的令牌桶限流（按 Deribit 的信用额度模型）
+
+每个请求消耗 DERIBIT_REQUEST_COST 个信用，桶容量 DERIBIT_RATE_CREDITS，每秒恢复 DERIBIT_RATE_REFILL，
+默认取 Deribit 默认额度（容量 50000、每秒 10000、每个请求 500）的 90%，即 18 个请求/秒、突发 90 个，
+留出的余量吸收请求到达服务器时的抖动。同一进程的所有线程经由 DeribitClient 的事件循环共享一个桶；
+设置 DERIBIT_RATE_LIMIT_REDIS_URL 时桶保存在 Redis 中（Lua 脚本原子地补充和扣减），多个进程共享额度。
+等待中的请求按优先级放行：现货 / 指数价格请求排在整条期权链的批量请求之前。
+收到 429 / too_many_requests 时清空桶，所有请求一起退避。
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from metrics import DERIBIT_RATE_LIMIT_WAIT_SECONDS
+
+DERIBIT_RATE_CREDITS = float(os.environ.get("DERIBIT_RATE_CREDITS", 45000))
+DERIBIT_RATE_REFILL = float(os.environ.get("DERIBIT_RATE_REFILL", 9000))
+DERIBIT_REQUEST_COST = float(os.environ.get("DERIBIT_REQUEST_COST", 500))
+DERIBIT_RATE_LIMIT_REDIS_URL = os.environ.get("DERIBIT_RATE_LIMIT_REDIS_URL")
+DERIBIT_RATE_LIMIT_KEY = os.environ.get("DERIBIT_RATE_LIMIT_KEY", "deribit_rate_limit")
+
+# 优先级（数值小的先放行）
+PRIORITY_SPOT = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = {PRIORITY_SPOT: "spot", PRIORITY_BULK: "bulk"}
+
+# 补充并尝试扣减 cost 个信用，返回需要等待的秒数（字符串，0 表示已扣减）
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+# 清空桶（收到上游限流错误时）
+DRAIN_SCRIPT = """
+local now = redis.call('TIME')
+redis.call('HSET', KEYS[1], 'tokens', '0', 'ts', tostring(tonumber(now[1]) + tonumber(now[2]) / 1000000))
+return 1
+"""
+
+
+class LocalTokenBucket:
+    """进程内的令牌桶"""
+
+    def __init__(self, capacity: float = DERIBIT_RATE_CREDITS, refill_rate: float = DERIBIT_RATE_REFILL):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    async def take(self, cost: float) -> float:
+        """扣减 cost 个信用并返回 0；不够时不扣减，返回需要等待的秒数"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= cost:
+                self.tokens -= cost
+                return 0
+            return (cost - self.tokens) / self.refill_rate
+
+    async def drain(self):
+        with self._lock:
+            self._refill()
+            self.tokens = 0
+
+
+class RedisTokenBucket:
+    """
+    保存在 Redis 中、多个进程共享的令牌桶；使用 Redis 服务器时间，各进程的时钟偏差不影响补充速度
+    Redis 不可用时退回进程内的桶，不阻塞 Deribit 请求
+    """
+
+    def __init__(self, url: str, key: str = DERIBIT_RATE_LIMIT_KEY, capacity: float = DERIBIT_RATE_CREDITS,
+                 refill_rate: float = DERIBIT_RATE_REFILL, client=None):
+        self.url = url
+        self.key = key
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.fallback = LocalTokenBucket(capacity, refill_rate)
+        self._redis = client
+        self._scripts = None
+        self._available = True
+
+    def _client(self):
+        # redis.asyncio 的连接绑定在创建它的事件循环上，在第一次使用时（客户端事件循环中）创建
+        if self._redis is None:
+            import redis.asyncio
+            self._redis = redis.asyncio.from_url(self.url)
+        if self._scripts is None:
+            self._scripts = (self._redis.register_script(TOKEN_BUCKET_SCRIPT), self._redis.register_script(DRAIN_SCRIPT))
+        return self._scripts
+
+    def _unavailable(self, e):
+        if self._available:
+            print(f"Redis rate limiter unavailable ({e}), using the local bucket")
+        self._available = False
+
+    async def take(self, cost: float) -> float:
+        try:
+            take_script, _ = self._client()
+            wait = float(await take_script(keys=[self.key], args=[self.capacity, self.refill_rate, cost]))
+            self._available = True
+            return wait
+        except Exception as e:
+            self._unavailable(e)
+            return await self.fallback.take(cost)
+
+    async def drain(self):
+        await self.fallback.drain()
+        try:
+            _, drain_script = self._client()
+            await drain_script(keys=[self.key])
+        except Exception as e:
+            self._unavailable(e)
+
+
+class RateLimiter:
+    """
+    按优先级排队的限流器，只在一个事件循环中使用（DeribitClient 的后台循环）
+    bucket: LocalTokenBucket 或 RedisTokenBucket
+    cost: 每个请求消耗的信用
+    """
+
+    def __init__(self, bucket, cost: float = DERIBIT_REQUEST_COST):
+        self.bucket = bucket
+        self.cost = cost
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._dispatcher = None
+
+    async def acquire(self, priority: int = PRIORITY_BULK):
+        """等待直到放行；同一优先级先到先得"""
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+        DERIBIT_RATE_LIMIT_WAIT_SECONDS.observe(time.perf_counter() - started,
+                                                priority=PRIORITY_NAMES.get(priority, str(priority)))
+
+    async def _dispatch(self):
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            wait = await self.bucket.take(self.cost)
+            if wait <= 0:
+                heapq.heappop(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+            else:
+                # 等待期间到达的高优先级请求会排到最前面
+                await asyncio.sleep(wait)
+
+    async def throttled(self):
+        """上游返回限流错误时调用：清空桶，之后的请求按恢复速度放行"""
+        await self.bucket.drain()
+
+
+def create_rate_limiter(redis_url: str = DERIBIT_RATE_LIMIT_REDIS_URL):
+    """按环境变量创建限流器：设置了 Redis 地址时跨进程共享，否则进程内共享"""
+    bucket = RedisTokenBucket(redis_url) if redis_url else LocalTokenBucket()
+    return RateLimiter(bucket)
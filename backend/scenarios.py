@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+现货 × 隐含波动率冲击的情景分析
+
+对缓存的期权链（ChainArrays）在整个冲击网格上批量重新定价Gamma：每个情景格是一行，
+一次 (情景 × 合约) 的数组运算得到所有情景的GEX，再按 (情景, 行权价, call/put) 用 np.bincount 汇总到行权价，
+向量化求出每个情景的净GEX、Call/Put Wall 和零Gamma。
+每个情景格的结果与用冲击后的现货和隐含波动率运行 calculate_gex_data 的结果口径一致。
+情景按块计算，每块最多 SCENARIO_CHUNK_ELEMENTS 个 (情景, 合约) 元素，内存占用与网格大小和行权价数量无关。
+"""
+import numpy as np
+
+from gex_calculator import time_to_expiry
+from gamma_profile import gamma_matrix
+
+# 默认冲击网格：现货 ±10%（21档），隐含波动率 ±20 个波动率点（9档）
+DEFAULT_SPOT_SHOCKS = np.linspace(-0.1, 0.1, 21)
+DEFAULT_VOL_SHOCKS = np.linspace(-20, 20, 9)
+# 每块最多的 (情景, 合约) 元素数
+SCENARIO_CHUNK_ELEMENTS = 1_000_000
+
+
+def _zero_gamma(strikes, net_by_strike, spots):
+    """
+    每行（情景）按行权价净GEX变号插值的零Gamma，取离该情景现货最近的变号区间，
+    与 summarize_gex 的计算方式相同；没有变号的情景为 NaN
+    """
+    flips = np.diff(np.sign(net_by_strike), axis=1) != 0
+    distance = np.where(flips, np.abs(strikes[:-1] - spots[:, None]), np.inf)
+    i = np.argmin(distance, axis=1) if strikes.size > 1 else np.zeros(len(spots), dtype=int)
+    rows = np.arange(len(spots))
+    has_flip = flips.any(axis=1) if strikes.size > 1 else np.zeros(len(spots), dtype=bool)
+    i_next = np.minimum(i + 1, strikes.size - 1)
+    x1, x2 = strikes[i], strikes[i_next]
+    y1, y2 = net_by_strike[rows, i], net_by_strike[rows, i_next]
+    slope = y2 - y1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zero_gamma = x1 - y1 * (x2 - x1) / slope
+    return np.where(has_flip & (slope != 0), zero_gamma, np.nan)
+
+
+def run_scenarios(chain, spot_price, spot_shocks=DEFAULT_SPOT_SHOCKS, vol_shocks=DEFAULT_VOL_SHOCKS, now_ts=None,
+                  chunk_elements: int = SCENARIO_CHUNK_ELEMENTS):
+    """
+    chain: ChainArrays
+    spot_shocks: 现货的相对变化，如 -0.1 表示下跌10%
+    vol_shocks: 隐含波动率的变化（波动率点），如 5 表示 IV + 5%
+    now_ts: 毫秒时间戳，默认当前时间（应与快照时间一致）
+
+    返回 dict，网格指标为 [len(spot_shocks)][len(vol_shocks)] 的嵌套列表:
+    net_oi_gex, net_vol_gex, call_wall, put_wall, zero_gamma（Volume口径，与 /gex 相同）
+    """
+    spot_shocks = np.asarray(spot_shocks, dtype=float)
+    vol_shocks = np.asarray(vol_shocks, dtype=float)
+    shape = (len(spot_shocks), len(vol_shocks))
+    # 情景格按 (现货, 波动率) 展开成行
+    cell_spots = np.repeat(spot_price * (1 + spot_shocks), len(vol_shocks))
+    cell_vol_shocks = np.tile(vol_shocks / 100, len(spot_shocks))
+
+    T = time_to_expiry(chain.expiration_ts, now_ts)
+    valid = (T > 0) & (chain.sigma > 0) & (chain.strike > 0)
+    strike, T, sigma = chain.strike[valid], T[valid], chain.sigma[valid]
+    is_call = chain.is_call[valid]
+    scale = np.where(is_call, 1.0, -1.0) * chain.contract_size[valid] * 100 / 1_000_000
+    weight_oi = scale * chain.open_interest[valid]
+    weight_vol = scale * chain.volume[valid]
+
+    # 行权价与 calculate_gex_data 相同：链中所有有效行情合约的行权价
+    strikes, position = np.unique(chain.strike, return_inverse=True)
+    position = position[valid]
+    # 每个合约的 (行权价, call/put) 桶序号，与 aggregate_by_strike 相同
+    bins = position * 2 + is_call
+    n = len(strikes)
+
+    cells = len(cell_spots)
+    net_oi = np.zeros(cells)
+    net_vol = np.zeros(cells)
+    call_wall = np.full(cells, np.nan)
+    put_wall = np.full(cells, np.nan)
+    zero_gamma = np.full(cells, np.nan)
+    rows_per_chunk = max(1, chunk_elements // max(len(strike), 1))
+
+    for start in range(0, cells, rows_per_chunk):
+        end = min(start + rows_per_chunk, cells)
+        spots = cell_spots[start:end]
+        if len(strike):
+            shocked_sigma = sigma + cell_vol_shocks[start:end, None]
+            # 冲击后 IV <= 0 的合约不贡献GEX（与 calculate_gex_data 跳过无效IV一致）
+            positive = shocked_sigma > 0
+            gamma = gamma_matrix(spots, strike, T, np.where(positive, shocked_sigma, 1.0))
+            gamma = np.where(positive, gamma, 0.0) * (spots**2)[:, None]
+        else:
+            gamma = np.zeros((len(spots), 0))
+        net_oi[start:end] = gamma @ weight_oi
+        gex_vol = gamma * weight_vol
+        net_vol[start:end] = gex_vol.sum(axis=1)
+        if not len(strikes):
+            continue
+
+        # 每个情景的桶序号错开 2n，一次 bincount 得到 (情景, 行权价, call/put) 之和
+        rows = end - start
+        chunk_bins = (np.arange(rows) * (2 * n))[:, None] + bins
+        by_strike = np.bincount(chunk_bins.ravel(), gex_vol.ravel(), minlength=rows * 2 * n).reshape(rows, n, 2)
+        put_by_strike, call_by_strike = by_strike[:, :, 0], by_strike[:, :, 1]
+        call_wall[start:end] = strikes[np.argmax(call_by_strike, axis=1)]
+        nonzero_put = put_by_strike != 0
+        put_index = np.argmin(np.where(nonzero_put, put_by_strike, np.inf), axis=1)
+        put_wall[start:end] = np.where(nonzero_put.any(axis=1), strikes[put_index], np.nan)
+        zero_gamma[start:end] = _zero_gamma(strikes, call_by_strike + put_by_strike, spots)
+
+    def grid(values):
+        return [[None if np.isnan(v) else float(v) for v in row] for row in values.reshape(shape)]
+
+    return {
+        "spot_price": spot_price,
+        "spot_shocks": spot_shocks.tolist(),
+        "vol_shocks": vol_shocks.tolist(),
+        "spots": (spot_price * (1 + spot_shocks)).tolist(),
+        "instruments": int(len(strike)),
+        "net_oi_gex": grid(net_oi),
+        "net_vol_gex": grid(net_vol),
+        "call_wall": grid(call_wall),
+        "put_wall": grid(put_wall),
+        "zero_gamma": grid(zero_gamma)
+    }
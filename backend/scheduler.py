@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+后台预计算调度器
+
+每个预定的 key（如币种）在自己的线程里按固定间隔刷新，请求总是立即拿到最近一次完成的结果。
+按需计算（未预定的 key、或还没有结果时）通过 single-flight 合并：同一个 key 同时只有一次计算在执行，
+其它并发调用者等待并共享同一个结果。结果过期后先返回旧结果，再在后台刷新（stale-while-revalidate）。
+预定的 key 还可以在两次完整计算之间用更便宜的 update 按更短的间隔更新结果（如只更新现货价格）。
+多个 worker 共享 Redis 时（shared，见 shared_snapshots.py），每个 key 只有持有租约的 worker 计算，
+其它 worker 采用它发布的结果。
+刷新失败时继续提供最近一次完成的结果并标记为过期（stale_reason）；还没有结果时可以从 fallback
+（如 Redis 中保存的最近结果）取得最后一次成功的结果。
+"""
+import threading
+import time
+from concurrent.futures import Future
+
+# 没有本地结果时轮询共享快照的间隔（秒）
+SHARED_POLL_SECONDS = 0.1
+# 结果超过多少个刷新周期没有更新时视为过期（共享时其它 worker 看不到持有者的刷新失败）
+STALE_AFTER_TICKS = 3
+
+
+class SingleFlight:
+    """同一个 key 同时只执行一次 fn，并发调用者共享结果或异常"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class Snapshot:
+    """一次完成的计算结果"""
+
+    def __init__(self, key, value, created_at: float):
+        self.key = key
+        self.value = value
+        self.created_at = created_at
+
+    @property
+    def age(self):
+        return time.time() - self.created_at
+
+
+class SnapshotScheduler:
+    """
+    compute: key -> value，执行一次完整计算
+    schedule: {key: 刷新间隔秒数}，这些 key 由后台线程定期刷新
+    max_age: 未预定 key 的结果超过该秒数后在后台刷新
+    max_entries: 最多保留的未预定 key 数量，超过时淘汰最久未刷新的
+    update: (key, 最近的 Snapshot) -> value，可选的增量更新，预定的 key 在两次完整计算之间
+            每 update_interval 秒执行一次；update_interval <= 0 时不启用
+    on_store: Snapshot -> None，每次保存新结果后调用（如推送给订阅者）
+    shared: 可选的 SharedSnapshots；只有持有 key 租约的 worker 执行 compute / update 并发布结果，
+            其它 worker 采用发布的结果
+    shared_lease: 租约的最短秒数；预定的 key 的租约至少为两个刷新周期，由持有者每个周期续约
+    shared_wait: 没有本地结果且租约被占用时，等待持有者发布的最长秒数，超时后自己计算
+    fallback: key -> (created_at, value) 或 None，没有本地结果且计算失败时取得最后一次成功的结果
+    on_failure: (key, 异常) -> None，刷新失败后调用（此时 stale_reason(key) 已更新）
+    on_evict: key -> None，未预定的 key 因超过 max_entries 被淘汰后调用（如清理按 key 缓存的数据）
+    """
+
+    def __init__(self, compute, schedule=None, max_age: float = 60, max_entries: int = 64,
+                 update=None, update_interval: float = 0, on_store=None, shared=None,
+                 shared_lease: float = 15, shared_wait: float = 30, fallback=None, on_failure=None, on_evict=None):
+        self.compute = compute
+        self.on_store = on_store
+        self.on_evict = on_evict
+        self.fallback = fallback
+        self.on_failure = on_failure
+        self.shared = shared
+        self.shared_lease = shared_lease
+        self.shared_wait = shared_wait
+        self.update = update if update_interval > 0 else None
+        self.update_interval = update_interval
+        self.schedule = dict(schedule or {})
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._snapshots = {}
+        # 最近一次结果之后的刷新失败: key -> 错误信息（只记录预定的 key 和有结果的 key）
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._stop = threading.Event()
+        self._threads = []
+
+    # --- 生命周期 ---
+
+    def start(self):
+        """为每个预定的 key 启动刷新线程"""
+        self._stop.clear()
+        for key, interval in self.schedule.items():
+            thread = threading.Thread(target=self._run, args=(key, interval), name=f"refresh-{key}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run(self, key, interval):
+        next_refresh = 0
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                if self.update is None or started >= next_refresh or self.latest(key) is None:
+                    next_refresh = started + interval
+                    self.refresh(key)
+                else:
+                    self.refresh_update(key)
+            except Exception as e:
+                print(f"Scheduled refresh failed for {key}: {e}")
+                self._recover(key, e)
+            wait = next_refresh - time.time()
+            if self.update is not None:
+                wait = min(wait, self.update_interval - (time.time() - started))
+            self._stop.wait(max(wait, 0))
+
+    # --- 读取与刷新 ---
+
+    def latest(self, key):
+        """最近一次完成的 Snapshot，没有则 None"""
+        with self._lock:
+            return self._snapshots.get(key)
+
+    def snapshots(self):
+        """所有 key 最近一次完成的 Snapshot"""
+        with self._lock:
+            return list(self._snapshots.values())
+
+    def stale_reason(self, key):
+        """最近的结果过期的原因（刷新失败的错误信息，或太久没有更新），未过期时 None"""
+        snapshot = self.latest(key)
+        with self._lock:
+            failure = self._failures.get(key)
+        if failure is not None:
+            return failure
+        limit = STALE_AFTER_TICKS * self._tick(key)
+        if snapshot is not None and snapshot.age > limit:
+            return f"Not refreshed for over {limit:.0f}s"
+        return None
+
+    def refresh(self, key):
+        """重新计算 key（与其它并发刷新合并），返回新的 Snapshot"""
+        return self._flight.do(key, lambda: self._attempt(key, lambda: self._produce(key, lambda: self.compute(key))))
+
+    def refresh_update(self, key):
+        """用 update 在最近的 Snapshot 基础上更新 key（与其它刷新合并），返回新的 Snapshot"""
+        return self._flight.do(key, lambda: self._attempt(
+            key, lambda: self._produce(key, lambda: self.update(key, self.latest(key)))))
+
+    def _attempt(self, key, fn):
+        """
+        执行一次刷新，失败时记录错误并通知 on_failure 后重新抛出；
+        没有结果的未预定 key 不记录（如请求了不存在的到期日），避免失败的 key 无限累积
+        """
+        try:
+            return fn()
+        except Exception as e:
+            with self._lock:
+                if key in self.schedule or key in self._snapshots:
+                    self._failures[key] = str(e) or type(e).__name__
+            if self.on_failure is not None:
+                try:
+                    self.on_failure(key, e)
+                except Exception as listener_error:
+                    print(f"Failure listener failed for {key}: {listener_error}")
+            raise
+
+    def _recover(self, key, error):
+        """
+        没有本地结果且计算失败时，从 fallback 取得最后一次成功的结果并标记为过期；
+        返回 Snapshot，fallback 也没有结果时 None
+        """
+        snapshot = self.latest(key)
+        if snapshot is not None:
+            return snapshot
+        try:
+            loaded = self.fallback(key) if self.fallback is not None else None
+        except Exception as e:
+            print(f"Fallback failed for {key}: {e}")
+            loaded = None
+        if loaded is None:
+            return None
+        print(f"Serving the last good snapshot of {key} after a failed refresh: {error}")
+        return self._store(key, loaded[1], loaded[0], failure=str(error) or type(error).__name__)
+
+    def _tick(self, key):
+        """key 的结果预期多久更新一次（秒）"""
+        if key not in self.schedule:
+            return self.max_age
+        return self.update_interval if self.update is not None else self.schedule[key]
+
+    def _lease_seconds(self, key):
+        if key not in self.schedule:
+            return self.shared_lease
+        return max(2 * self._tick(key), self.shared_lease)
+
+    def _adopt(self, key, local):
+        """共享快照比本地的新（未预定的 key 还需未过期）时保存并返回它，否则 None"""
+        created_at = self.shared.created_at(key)
+        if created_at is None or (local is not None and created_at <= local.created_at):
+            return None
+        if key not in self.schedule and time.time() - created_at >= self.max_age:
+            return None
+        loaded = self.shared.load(key)
+        if loaded is None:
+            return None
+        return self._store(key, loaded[1], loaded[0])
+
+    def _produce(self, key, fn):
+        """执行 fn 并保存结果；共享时只有租约持有者执行并发布，其它 worker 采用发布的结果"""
+        if self.shared is None:
+            return self._store(key, fn())
+        local = self.latest(key)
+        adopted = self._adopt(key, local)
+        if adopted is not None:
+            return adopted
+        if self.shared.acquire(key, self._lease_seconds(key)):
+            try:
+                snapshot = self._store(key, fn())
+                self.shared.publish(key, snapshot.value, snapshot.created_at)
+            finally:
+                if key not in self.schedule:
+                    self.shared.release(key)
+            return snapshot
+        if local is not None:
+            # 其它 worker 正在刷新，继续使用本地结果
+            return local
+        deadline = time.time() + self.shared_wait
+        while time.time() < deadline:
+            time.sleep(SHARED_POLL_SECONDS)
+            adopted = self._adopt(key, None)
+            if adopted is not None:
+                return adopted
+        print(f"No shared snapshot for {key} within {self.shared_wait}s, computing locally")
+        return self._store(key, fn())
+
+    def _store(self, key, value, created_at: float = None, failure: str = None):
+        """保存结果；failure 为取得它之前刷新失败的错误信息（最后一次成功的结果），新计算的结果为 None"""
+        snapshot = Snapshot(key, value, time.time() if created_at is None else created_at)
+        evicted = None
+        with self._lock:
+            self._snapshots[key] = snapshot
+            if failure is None:
+                self._failures.pop(key, None)
+            else:
+                self._failures[key] = failure
+            unscheduled = [k for k in self._snapshots if k not in self.schedule]
+            if len(unscheduled) > self.max_entries:
+                evicted = min(unscheduled, key=lambda k: self._snapshots[k].created_at)
+                del self._snapshots[evicted]
+                self._failures.pop(evicted, None)
+        if evicted is not None and self.on_evict is not None:
+            try:
+                self.on_evict(evicted)
+            except Exception as e:
+                print(f"Eviction listener failed for {evicted}: {e}")
+        if self.on_store is not None:
+            try:
+                self.on_store(snapshot)
+            except Exception as e:
+                print(f"Snapshot listener failed for {key}: {e}")
+        return snapshot
+
+    def _refresh_in_background(self, key):
+        if self._flight.in_flight(key):
+            return
+
+        def run():
+            try:
+                self.refresh(key)
+            except Exception as e:
+                print(f"Background refresh failed for {key}: {e}")
+        threading.Thread(target=run, name=f"revalidate-{key}", daemon=True).start()
+
+    def get(self, key):
+        """
+        立即返回最近的 Snapshot；没有时同步计算（single-flight），计算失败时使用 fallback。
+        未预定 key 的结果过期时先返回旧结果并在后台刷新。
+        """
+        snapshot = self.latest(key)
+        if snapshot is None:
+            try:
+                return self.refresh(key)
+            except Exception as e:
+                snapshot = self._recover(key, e)
+                if snapshot is None:
+                    raise
+                return snapshot
+        if key not in self.schedule and snapshot.age >= self.max_age:
+            self._refresh_in_background(key)
+        return snapshot
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+多个 worker / 副本之间共享的快照缓存（Redis）
+
+每个 key 有一个租约（SET NX PX）：持有租约的 worker 负责刷新并把结果发布到 Redis，
+其它 worker 只读取发布的快照，不请求 Deribit、也不写历史，因此上游负载不随 worker 数增加。
+预定的 key 由持有者在每次刷新时续约（粘性 leader），持有者退出后租约过期，由其它 worker 接管；
+按需计算的 key 在计算完成后释放租约。
+快照以 msgpack 保存：{"created_at", "worker", "payload"}，payload 由调用方编码（见 pack_snapshot）。
+"""
+import os
+import socket
+import uuid
+
+import msgpack
+import numpy as np
+
+from metrics import REDIS_OPERATION_SECONDS
+
+# 获取租约，已由自己持有时续约
+ACQUIRE_SCRIPT = """
+local holder = redis.call('get', KEYS[1])
+if holder == ARGV[1] then
+    redis.call('pexpire', KEYS[1], ARGV[2])
+    return 1
+end
+if holder then
+    return 0
+end
+redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+# 只释放自己持有的租约
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+# 共享快照在 Redis 中的保留时间（秒）
+SHARED_SNAPSHOT_TTL = 15 * 60
+
+
+def key_name(key) -> str:
+    """(currency, expirations) -> "BTC" / "BTC:all"，与历史名称一致"""
+    currency, selection = key
+    return currency if selection is None else f"{currency}:{selection}"
+
+
+def pack_snapshot(details, chain_entry=None) -> bytes:
+    """
+    GEX 结果和其背后的期权链（main.chains 的值: (快照时间, 现货价格, ChainArrays)）一起编码，
+    使读取方也能计算 profile / scenarios 等派生视图
+    """
+    chain = None
+    if chain_entry is not None:
+        snapshot_ts, spot_price, arrays = chain_entry
+        chain = {"timestamp": snapshot_ts, "spot_price": spot_price,
+                 "columns": {field: (column.dtype.str, column.tobytes()) for field, column in zip(arrays._fields, arrays)}}
+    return msgpack.packb({"details": details, "chain": chain}, use_bin_type=True)
+
+
+def unpack_snapshot(blob: bytes, chain_type):
+    """返回 (details, chain_entry 或 None)；chain_type 为 ChainArrays"""
+    packed = msgpack.unpackb(blob, raw=False, strict_map_key=False)
+    chain = packed["chain"]
+    if chain is None:
+        return packed["details"], None
+    arrays = chain_type(*(np.frombuffer(data, dtype=np.dtype(dtype)).copy()
+                          for dtype, data in (chain["columns"][field] for field in chain_type._fields)))
+    return packed["details"], (chain["timestamp"], chain["spot_price"], arrays)
+
+
+class SharedSnapshots:
+    """
+    redis_client: redis-py 客户端
+    encode: (key, value) -> bytes；decode: (key, bytes) -> value
+    worker_id: 租约持有者标识，默认 主机名:进程号:随机后缀
+    """
+
+    def __init__(self, redis_client, encode, decode, prefix: str = "gex_shared", worker_id: str = None,
+                 ttl: float = SHARED_SNAPSHOT_TTL):
+        self.redis = redis_client
+        self.encode = encode
+        self.decode = decode
+        self.prefix = prefix
+        self.ttl = ttl
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._acquire = redis_client.register_script(ACQUIRE_SCRIPT)
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+
+    def snapshot_key(self, key):
+        return f"{self.prefix}:snapshot:{key_name(key)}"
+
+    def lease_key(self, key):
+        return f"{self.prefix}:lease:{key_name(key)}"
+
+    def acquire(self, key, lease_seconds: float) -> bool:
+        """获取或续约 key 的租约"""
+        with REDIS_OPERATION_SECONDS.time(operation="lease"):
+            return bool(self._acquire(keys=[self.lease_key(key)], args=[self.worker_id, max(int(lease_seconds * 1000), 1)]))
+
+    def release(self, key):
+        with REDIS_OPERATION_SECONDS.time(operation="lease"):
+            self._release(keys=[self.lease_key(key)], args=[self.worker_id])
+
+    def publish(self, key, value, created_at: float):
+        blob = msgpack.packb({"created_at": created_at, "worker": self.worker_id, "payload": self.encode(key, value)},
+                             use_bin_type=True)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(self.snapshot_key(key), mapping={"created_at": repr(created_at), "blob": blob})
+        pipe.expire(self.snapshot_key(key), int(self.ttl))
+        with REDIS_OPERATION_SECONDS.time(operation="shared_publish"):
+            pipe.execute()
+
+    def created_at(self, key):
+        """发布的快照的创建时间，没有则 None（只读一个小字段）"""
+        with REDIS_OPERATION_SECONDS.time(operation="shared_check"):
+            created_at = self.redis.hget(self.snapshot_key(key), "created_at")
+        return float(created_at) if created_at is not None else None
+
+    def load(self, key):
+        """(created_at, value)，没有则 None"""
+        with REDIS_OPERATION_SECONDS.time(operation="shared_load"):
+            blob = self.redis.hget(self.snapshot_key(key), "blob")
+        if blob is None:
+            return None
+        packed = msgpack.unpackb(blob, raw=False)
+        return packed["created_at"], self.decode(key, packed["payload"])
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+GEX快照的版本和增量 diff
+
+每个快照有一个版本号（由快照时间戳和实时数据时间戳生成），用作 /gex 的 ETag。
+VersionLog 为每个 key 保留最近几个版本的结果，diff_snapshots 只返回自某个版本以来变化的
+标量字段和行权价（行内只包含变化的字段），多个到期日的结果按到期日分别 diff。
+"""
+import threading
+from collections import OrderedDict
+
+# 每个 key 保留的历史版本数
+MAX_VERSIONS = 32
+# 不参与 diff 的字段
+IGNORED_FIELDS = ("version",)
+# 不作为标量比较的字段：data 按行权价、expirations 按到期日分别 diff
+NESTED_FIELDS = ("data", "expirations")
+
+
+def snapshot_version(gex_details) -> str:
+    """快照版本号：毫秒时间戳，实时数据再附上推送时间，标记为过期时再加 -stale"""
+    version = str(int(gex_details["timestamp"] * 1000))
+    if gex_details.get("stream_updated_at") is not None:
+        version += f"-{int(gex_details['stream_updated_at'] * 1000)}"
+    if gex_details.get("stale"):
+        version += "-stale"
+    return version
+
+
+def version_order(version: str):
+    """比较版本新旧的键: (快照时间戳, 实时数据时间戳, 是否过期)；同一快照标记为过期的版本更新"""
+    parts = version.split("-")
+    stale = parts[-1] == "stale"
+    if stale:
+        parts = parts[:-1]
+    return int(parts[0]), int(parts[1]) if len(parts) > 1 else 0, stale
+
+
+def etag_matches(if_none_match: str, version: str) -> bool:
+    """If-None-Match 请求头是否包含该版本（支持 W/ 前缀、多个值和 *）"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"') == version:
+            return True
+    return False
+
+
+def diff_snapshots(old, new):
+    """
+    old -> new 的变化
+    返回 dict: changed（变化或新增的标量字段）、removed（删除的字段）、
+    data（变化或新增的行权价，每行只含 strike 和变化的字段）、removed_strikes、
+    expirations（有变化或新增的到期日，每项为 expiration_date 加上该到期日结果的同格式 diff）、
+    removed_expirations（删除的到期日）
+    """
+    changes = _diff_fields(old, new)
+    old_expiries = {expiry["expiration_date"]: expiry for expiry in old.get("expirations", [])}
+    new_dates = set()
+    expirations = []
+    for expiry in new.get("expirations", []):
+        date = expiry["expiration_date"]
+        new_dates.add(date)
+        expiry_changes = _diff_fields(old_expiries.get(date, {}), expiry)
+        if any(expiry_changes.values()):
+            expirations.append({"expiration_date": date, **expiry_changes})
+    changes["expirations"] = expirations
+    changes["removed_expirations"] = [date for date in old_expiries if date not in new_dates]
+    return changes
+
+
+def _diff_fields(old, new):
+    """一个结果（整体或单个到期日）的标量字段和按行权价的变化"""
+    changed = {}
+    for field, value in new.items():
+        if field in IGNORED_FIELDS or field in NESTED_FIELDS:
+            continue
+        if field not in old or old[field] != value:
+            changed[field] = value
+    removed = [field for field in old if field not in new and field not in IGNORED_FIELDS]
+
+    old_rows = {row["strike"]: row for row in old.get("data", [])}
+    new_strikes = set()
+    data = []
+    for row in new.get("data", []):
+        new_strikes.add(row["strike"])
+        old_row = old_rows.get(row["strike"])
+        if old_row is None:
+            data.append(row)
+            continue
+        row_changes = {field: value for field, value in row.items() if old_row.get(field) != value}
+        if row_changes:
+            data.append({"strike": row["strike"], **row_changes})
+    removed_strikes = [strike for strike in old_rows if strike not in new_strikes]
+    return {"changed": changed, "removed": removed, "data": data, "removed_strikes": removed_strikes}
+
+
+class VersionLog:
+    """每个 key 最近 max_versions 个版本的结果"""
+
+    def __init__(self, max_versions: int = MAX_VERSIONS):
+        self.max_versions = max_versions
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def publish(self, key, version: str, payload):
+        with self._lock:
+            versions = self._versions.setdefault(key, OrderedDict())
+            if version in versions:
+                return
+            versions[version] = payload
+            while len(versions) > self.max_versions:
+                versions.popitem(last=False)
+
+    def get(self, key, version: str):
+        """该版本的结果，已淘汰或不存在时返回 None"""
+        with self._lock:
+            return self._versions.get(key, {}).get(version)
+
+    def discard(self, key):
+        """删除 key 的所有版本"""
+        with self._lock:
+            self._versions.pop(key, None)
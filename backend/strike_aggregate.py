@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+按行权价索引的增量GEX汇总结构
+
+行权价集合固定（来自合约元数据），单个行权价的数据变化时 O(log n) 更新：
+- 运行总和（OI / Volume 口径的 call、put GEX）
+- Call Wall / Put Wall（线段树维护最大 call_gex、最小非零 put_gex）
+- 零Gamma：用树状数组维护"有效行权价"和"相邻有效行权价净GEX变号"标记，
+  查询离现货最近的变号区间并线性插值，现货价格变化只需重新查询
+计算口径与 gex_calculator.summarize_gex 完全一致。
+"""
+import bisect
+import math
+
+import numpy as np
+
+# 每个行权价保存的字段
+FIELDS = ("oi_call_gex", "oi_put_gex", "vol_call_gex", "vol_put_gex", "call_oi", "put_oi", "call_volume", "put_volume")
+
+
+def _sign(x):
+    return int(x > 0) - int(x < 0)
+
+
+class _Fenwick:
+    """0/1 标记的树状数组，支持前缀计数和按序号查找"""
+
+    def __init__(self, n):
+        self.n = n
+        self.tree = [0] * (n + 1)
+        self.flags = [0] * n
+        self.total = 0
+        self._top = 1 << max(n.bit_length() - 1, 0) if n else 0
+
+    def set(self, i, flag):
+        flag = 1 if flag else 0
+        delta = flag - self.flags[i]
+        if delta == 0:
+            return
+        self.flags[i] = flag
+        self.total += delta
+        i += 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        """下标 0..i（含）中的标记数"""
+        count = 0
+        i += 1
+        while i > 0:
+            count += self.tree[i]
+            i -= i & -i
+        return count
+
+    def find(self, k):
+        """第 k 个（从1开始）标记的下标"""
+        pos = 0
+        step = self._top
+        while step:
+            if pos + step <= self.n and self.tree[pos + step] < k:
+                pos += step
+                k -= self.tree[pos]
+            step >>= 1
+        return pos
+
+    def prev(self, i):
+        """下标 < i 的最后一个标记，没有则 None"""
+        count = self.prefix(i - 1) if i > 0 else 0
+        return self.find(count) if count else None
+
+    def last_at_or_before(self, i):
+        count = self.prefix(i) if i >= 0 else 0
+        return self.find(count) if count else None
+
+    def next(self, i):
+        """下标 > i 的第一个标记，没有则 None"""
+        count = self.prefix(i) if i >= 0 else 0
+        return self.find(count + 1) if count < self.total else None
+
+
+class _ArgTree:
+    """线段树，维护最优值及其下标（并列时取较小下标）"""
+
+    def __init__(self, n, prefer_max):
+        self.size = 1
+        while self.size < max(n, 1):
+            self.size <<= 1
+        self.worst = -math.inf if prefer_max else math.inf
+        self.prefer_max = prefer_max
+        self.value = [self.worst] * (2 * self.size)
+        self.index = [-1] * (2 * self.size)
+
+    def _better(self, a, b):
+        return a > b if self.prefer_max else a < b
+
+    def set(self, i, value):
+        pos = i + self.size
+        self.value[pos] = value
+        self.index[pos] = i if value != self.worst else -1
+        pos >>= 1
+        while pos:
+            left, right = 2 * pos, 2 * pos + 1
+            # 并列时保留左子树（较小下标）
+            if self._better(self.value[right], self.value[left]):
+                self.value[pos], self.index[pos] = self.value[right], self.index[right]
+            else:
+                self.value[pos], self.index[pos] = self.value[left], self.index[left]
+            pos >>= 1
+
+    def best(self):
+        """(值, 下标)；没有有效值时下标为 -1"""
+        return self.value[1], self.index[1]
+
+
+class StrikeAggregate:
+    """
+    strikes: 行权价列表（会排序去重）
+
+    通过 set_strike 设置某个行权价的全部字段，count 为该行权价上有效合约数，
+    count == 0 的行权价不参与输出和指标计算（与 summarize_gex 只统计有数据的行权价一致）。
+    """
+
+    def __init__(self, strikes):
+        self.strikes = sorted(set(float(s) for s in strikes))
+        self.position = {s: i for i, s in enumerate(self.strikes)}
+        n = len(self.strikes)
+        self.values = np.zeros((n, len(FIELDS)))
+        self.counts = [0] * n
+        self.totals = dict.fromkeys(FIELDS[:4], 0.0)
+        self._active = _Fenwick(n)
+        self._flips = _Fenwick(n)
+        self._call_wall = _ArgTree(n, prefer_max=True)
+        self._put_wall = _ArgTree(n, prefer_max=False)
+
+    def __contains__(self, strike):
+        return float(strike) in self.position
+
+    def _net(self, i):
+        return self.values[i, 2] + self.values[i, 3]
+
+    def _update_flip(self, i, next_i):
+        self._flips.set(i, next_i is not None and _sign(self._net(i)) != _sign(self._net(next_i)))
+
+    def set_strike(self, strike, count, oi_call_gex=0.0, oi_put_gex=0.0, vol_call_gex=0.0, vol_put_gex=0.0,
+                   call_oi=0, put_oi=0, call_volume=0, put_volume=0):
+        """设置一个行权价的汇总数据，O(log n)"""
+        i = self.position[float(strike)]
+        row = (oi_call_gex, oi_put_gex, vol_call_gex, vol_put_gex, call_oi, put_oi, call_volume, put_volume)
+        for k, field in enumerate(FIELDS[:4]):
+            self.totals[field] += row[k] - self.values[i, k]
+        self.values[i] = row
+        self.counts[i] = count
+
+        prev_i = self._active.prev(i)
+        next_i = self._active.next(i)
+        active = count > 0
+        self._active.set(i, active)
+        if active:
+            self._update_flip(i, next_i)
+        else:
+            self._flips.set(i, False)
+        if prev_i is not None:
+            self._update_flip(prev_i, i if active else next_i)
+
+        self._call_wall.set(i, vol_call_gex if active else self._call_wall.worst)
+        self._put_wall.set(i, vol_put_gex if active and vol_put_gex != 0 else self._put_wall.worst)
+
+    # --- 查询 ---
+
+    def call_wall(self):
+        _, i = self._call_wall.best()
+        return self.strikes[i] if i >= 0 else None
+
+    def put_wall(self):
+        _, i = self._put_wall.best()
+        return self.strikes[i] if i >= 0 else None
+
+    def zero_gamma(self, spot_price):
+        """离现货最近的净GEX变号区间内线性插值得到的零Gamma，O(log n)"""
+        k = bisect.bisect_right(self.strikes, spot_price) - 1
+        below = self._flips.last_at_or_before(k)
+        above = self._flips.next(k)
+        candidates = [i for i in (below, above) if i is not None]
+        if not candidates:
+            return None
+        i = min(candidates, key=lambda c: (abs(self.strikes[c] - spot_price), c))
+        j = self._active.next(i)
+        x1, x2 = self.strikes[i], self.strikes[j]
+        y1, y2 = self._net(i), self._net(j)
+        if y2 - y1 == 0:
+            return None
+        return float(x1 - y1 * (x2 - x1) / (y2 - y1))
+
+    def summary(self, spot_price, expiration_date):
+        """生成与 summarize_gex 相同格式的结果"""
+        active = [i for i, count in enumerate(self.counts) if count > 0]
+        if not active:
+            return {"data": [], "zero_gamma": None, "call_wall": None, "put_wall": None, "expiration_date": expiration_date}
+        data = []
+        for i in active:
+            _, _, vol_call_gex, vol_put_gex, call_oi, put_oi, call_volume, put_volume = self.values[i].tolist()
+            data.append({
+                "strike": self.strikes[i],
+                "call_gex": vol_call_gex,
+                "put_gex": vol_put_gex,
+                "open_interest": call_oi + put_oi,
+                "volume": call_volume + put_volume,
+                "call_oi": call_oi,
+                "put_oi": put_oi,
+                "call_volume": call_volume,
+                "put_volume": put_volume
+            })
+        zero_gamma = self.zero_gamma(spot_price)
+        call_wall = self.call_wall()
+        put_wall = self.put_wall()
+        totals = self.totals
+        return {
+            "data": data,
+            "expiration_date": expiration_date,
+            "spot_price": spot_price,
+
+            # GEX by Open Interest
+            "zero_gamma": zero_gamma,
+            "call_wall": call_wall,
+            "put_wall": put_wall,
+            "total_oi_call_gex": totals["oi_call_gex"],
+            "total_oi_put_gex": totals["oi_put_gex"],
+            "net_oi_gex": totals["oi_call_gex"] + totals["oi_put_gex"],
+
+            # GEX by Volume
+            "zero_gamma_vol": zero_gamma,
+            "total_vol_call_gex": totals["vol_call_gex"],
+            "total_vol_put_gex": totals["vol_put_gex"],
+            "net_vol_gex": totals["vol_call_gex"] + totals["vol_put_gex"]
+        }
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+本地 Deribit WebSocket 回放服务器
+
+读取 DeribitStream(record_path=...) 录制的 JSONL 消息，像 Deribit 一样应答
+public/subscribe、public/set_heartbeat、public/test，并把已订阅频道的通知按录制顺序推送给客户端。
+
+用法:
+    python ws_replay.py recorded.jsonl --port 8765 --speed 1.0
+然后设置 DERIBIT_WS=ws://localhost:8765
+"""
+import argparse
+import asyncio
+import json
+
+from websockets.asyncio.server import serve
+
+
+def load_recording(path: str):
+    """读取录制文件，返回 [(ts, message)]"""
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return [(entry["ts"], entry["message"]) for entry in entries]
+
+
+class ReplayServer:
+    """
+    messages: [(ts, message)]，只回放其中 method == "subscription" 的通知
+    speed: 回放速度倍数，0 表示不等待、尽快推送
+    """
+
+    def __init__(self, messages, host: str = "localhost", port: int = 0, speed: float = 0):
+        self.notifications = [(ts, m) for ts, m in messages if m.get("method") == "subscription"]
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.replayed = asyncio.Event()
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await serve(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    async def _handle(self, ws):
+        subscribed = set()
+        replay_task = None
+        try:
+            async for raw in ws:
+                request = json.loads(raw)
+                method = request.get("method")
+                if method == "public/subscribe":
+                    channels = request["params"]["channels"]
+                    subscribed.update(channels)
+                    result = channels
+                elif method in ("public/set_heartbeat", "public/test"):
+                    result = "ok"
+                else:
+                    await ws.send(json.dumps({"jsonrpc": "2.0", "id": request.get("id"),
+                                              "error": {"code": -32601, "message": "Method not found"}}))
+                    continue
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": request.get("id"), "result": result}))
+                if method == "public/subscribe" and replay_task is None:
+                    replay_task = asyncio.create_task(self._replay(ws, subscribed))
+        finally:
+            if replay_task is not None:
+                replay_task.cancel()
+
+    async def _replay(self, ws, subscribed):
+        # 等客户端发完所有订阅请求
+        await asyncio.sleep(0.05)
+        previous_ts = None
+        for ts, message in self.notifications:
+            if message["params"]["channel"] not in subscribed:
+                continue
+            if self.speed > 0 and previous_ts is not None:
+                await asyncio.sleep(max(ts - previous_ts, 0) / self.speed)
+            previous_ts = ts
+            await ws.send(json.dumps(message))
+        self.replayed.set()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Deribit WebSocket messages")
+    parser.add_argument("recording", help="JSONL file written by DeribitStream(record_path=...)")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier, 0 = as fast as possible")
+    args = parser.parse_args()
+
+    async with ReplayServer(load_recording(args.recording), args.host, args.port, args.speed) as server:
+        print(f"Replaying {len(server.notifications)} messages on {server.url}")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+GEX 计算流水线各阶段的基准测试
+
+在 100 ~ 2000 个合约规模的期权链上分别计时：
+- bs_greeks_scalar: 逐个合约调用 black_scholes_greeks
+- bs_greeks_batch: 整条链一次 black_scholes_greeks_batch
+- gex_from_chain: 按行权价汇总（calculate_gex_data 的汇总部分，含 summarize_gex）
+- summarize_gex: zero gamma / call wall / put wall 等指标
+- json_encode: /gex 响应的 JSON 序列化（encode_payload）
+- history_record: GexHistoryStore.record 的 Redis 往返
+- spot_update: 现货更新路径（reprice_snapshot 从本地替身服务器取现货、重新定价，再把标量指标写入 Redis 历史）
+后两项需要可用的 Redis（--redis-url，默认使用 15 号库），不可用时跳过；只写入 "benchmark:<币种>" 名下的历史，
+结束后只删除这些键，不影响真实币种的历史。
+
+期权链来自 deribit_stub.py 录制的 fixtures（--fixtures），否则使用合成数据；每个规模取最近到期的 N 个合约。
+结果写入 JSON（--output），--baseline 与之前的结果比较，中位数变慢超过 --threshold 时标记为回退并以状态码 1 退出。
+
+用法:
+    python benchmark_gex.py --output baseline.json
+    python benchmark_gex.py --fixtures backend/fixtures.jsonl --baseline baseline.json --output current.json
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import argparse
+import json
+import platform
+import statistics
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+DEFAULT_SIZES = (100, 250, 500, 1000, 2000)
+# 比较时忽略绝对差异小于该毫秒数的变化（计时噪声）
+NOISE_FLOOR_MS = 0.05
+
+
+def chain_from_fixtures(entries, currency: str):
+    """从录制/合成的响应构造按到期日、行权价排序的 ChainArrays 和现货价格，时间戳平移到当前时间"""
+    from deribit_stub import shift_timestamps
+    from gex_calculator import ChainArrays
+
+    offset_ms = int(time.time() * 1000) - max(entry.get("ts", 0) for entry in entries)
+    responses = {}
+    for entry in entries:
+        responses[(entry["method"], entry["params"].get("currency") or entry["params"].get("instrument_name")
+                   or entry["params"].get("index_name"))] = shift_timestamps(entry["result"], offset_ms)
+    instruments = responses[("get_instruments", currency)]
+    book = {quote["instrument_name"]: quote for quote in responses[("get_book_summary_by_currency", currency)]}
+    spot_result = responses.get(("ticker", f"{currency}-PERPETUAL")) or responses[("get_index_price", f"{currency.lower()}_usd")]
+    spot_price = spot_result.get("mark_price") or spot_result["index_price"]
+
+    rows = []
+    for info in instruments:
+        quote = book.get(info["instrument_name"])
+        if quote is None or not quote.get("mark_iv"):
+            continue
+        rows.append((info["expiration_timestamp"], info["strike"], info["option_type"] == "call", info.get("contract_size", 1.0),
+                     quote.get("open_interest") or 0, quote.get("volume") or 0, quote["mark_iv"] / 100))
+    rows.sort()
+    expiration_ts, strike, is_call, contract_size, oi, volume, sigma = (np.array(column, dtype=float) for column in zip(*rows))
+    return ChainArrays(strike, is_call.astype(bool), contract_size, oi, volume, sigma, expiration_ts), spot_price
+
+
+def take(chain, n: int):
+    """链中最近到期的前 n 个合约"""
+    return type(chain)(*(column[:n] for column in chain))
+
+
+def aggregate_by_strike(chain, spot_price):
+    """按行权价汇总的 StrikeGex（summarize_gex 的输入）"""
+    from gex_calculator import RISK_FREE_RATE, aggregate_by_strike as aggregate, gex_contributions, time_to_expiry
+    gex_oi, gex_vol = gex_contributions(spot_price, chain.strike, time_to_expiry(chain.expiration_ts), RISK_FREE_RATE,
+                                        chain.sigma, chain.is_call, chain.contract_size, chain.open_interest, chain.volume)
+    return aggregate(chain.strike, chain.is_call, chain.open_interest, chain.volume, gex_oi, gex_vol)[0]
+
+
+def measure(fn, repeat: int, min_time: float = 0.05):
+    """每轮循环足够多次（至少 min_time 秒）后取每次调用的平均耗时，返回 repeat 轮的统计（毫秒）"""
+    fn()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1 << 16:
+            break
+        loops *= 2
+    samples = [elapsed / loops * 1000]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops * 1000)
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples), "max_ms": max(samples),
+            "loops": loops, "repeat": repeat}
+
+
+def open_redis(url: str):
+    import redis
+    client = redis.from_url(url)
+    try:
+        client.ping()
+    except Exception as e:
+        print(f"Redis unavailable at {url} ({e}), skipping Redis stages")
+        return None
+    return client
+
+
+def compute_stages(chain, spot_price, currency: str, repeat: int):
+    from gex_calculator import RISK_FREE_RATE, black_scholes_greeks, black_scholes_greeks_batch, gex_from_chain, \
+        summarize_gex, time_to_expiry
+    from payload_encoding import encode_payload
+
+    T = time_to_expiry(chain.expiration_ts)
+    contracts = list(zip(chain.strike.tolist(), T.tolist(), chain.sigma.tolist(),
+                         ["call" if c else "put" for c in chain.is_call.tolist()]))
+    expiration_date = "bench"
+    result = gex_from_chain(chain, spot_price, expiration_date)
+    result["currency"] = currency
+    gex_by_strike = aggregate_by_strike(chain, spot_price)
+
+    return {
+        "bs_greeks_scalar": measure(lambda: [black_scholes_greeks(spot_price, K, t, RISK_FREE_RATE, s, kind)
+                                             for K, t, s, kind in contracts], repeat),
+        "bs_greeks_batch": measure(lambda: black_scholes_greeks_batch(spot_price, chain.strike, T, RISK_FREE_RATE,
+                                                                      chain.sigma, chain.is_call), repeat),
+        "gex_from_chain": measure(lambda: gex_from_chain(chain, spot_price, expiration_date), repeat),
+        "summarize_gex": measure(lambda: summarize_gex(gex_by_strike, spot_price, expiration_date), repeat),
+        "json_encode": measure(lambda: encode_payload(result), repeat),
+    }, result
+
+
+def redis_stages(chain, spot_price, result, currency: str, redis_client, stub_url: str, repeat: int):
+    """history_record 和 spot_update，都写入 "benchmark:<币种>" 名下的历史；结束后只删除这些键"""
+    import deribit_client
+    from deribit_client import DeribitClient
+    from gex_calculator import reprice_snapshot
+    from history_store import GexHistoryStore
+
+    store = GexHistoryStore(redis_client)
+    name = f"benchmark:{currency}"
+    clock = [time.time()]
+
+    def record(gex_details, snapshot=True):
+        clock[0] += 1
+        return store.record(name, {**gex_details, "timestamp": clock[0]}, snapshot=snapshot)
+
+    def spot_update():
+        gex_details = reprice_snapshot(currency, chain, snapshot)
+        gex_details["chain_updated_at"] = snapshot["chain_updated_at"]
+        gex_details["max_change_gex"] = record(gex_details, snapshot=False)
+
+    previous_client = deribit_client._client
+    # 只测量请求路径本身的耗时，不受限流影响
+    deribit_client._client = DeribitClient(base_url=stub_url, rate_limit=False)
+    snapshot = {"expiration_date": result["expiration_date"], "expiration_dates": None, "chain_updated_at": time.time()}
+    try:
+        stages = {
+            "history_record": measure(lambda: record(result), repeat),
+            "spot_update": measure(spot_update, repeat),
+        }
+    finally:
+        deribit_client._client.close()
+        deribit_client._client = previous_client
+        redis_client.delete(store.metrics_key(name), store.snapshots_key(name),
+                            *(store.bars_key(name, tier) for tier, _, _ in store.tiers))
+    return stages
+
+
+def run_benchmarks(entries, currency: str = "BTC", sizes=DEFAULT_SIZES, repeat: int = 5, redis_client=None):
+    """返回 {"meta": ..., "results": {"<stage>@<n>": {...}}}"""
+    from deribit_stub import StubServer
+
+    chain, spot_price = chain_from_fixtures(entries, currency)
+    results = {}
+    with StubServer(entries) if redis_client is not None else nullcontext() as stub:
+        for n in sizes:
+            if n > len(chain.strike):
+                print(f"Chain has only {len(chain.strike)} valid contracts, skipping size {n}")
+                continue
+            sub_chain = take(chain, n)
+            stages, result = compute_stages(sub_chain, spot_price, currency, repeat)
+            if redis_client is not None:
+                stages.update(redis_stages(sub_chain, spot_price, result, currency, redis_client, stub.url, repeat))
+            for stage, stats in stages.items():
+                results[f"{stage}@{n}"] = {"stage": stage, "n": n, **stats}
+                print(f"{stage:>18} n={n:<5} median {stats['median_ms']:9.3f} ms  min {stats['min_ms']:9.3f} ms")
+    return {
+        "meta": {
+            "timestamp": time.time(), "currency": currency, "python": platform.python_version(),
+            "numpy": np.__version__, "machine": platform.machine(), "platform": platform.platform()
+        },
+        "results": results
+    }
+
+
+def compare(current, baseline, threshold: float = 0.25, noise_floor_ms: float = NOISE_FLOOR_MS):
+    """
+    按 "<stage>@<n>" 比较中位数，返回 [{"key", "baseline_ms", "current_ms", "ratio", "regression"}]
+    中位数超过基线 (1 + threshold) 倍且绝对差异超过 noise_floor_ms 时为回退
+    """
+    rows = []
+    for key, stats in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        ratio = stats["median_ms"] / base["median_ms"] if base["median_ms"] > 0 else float("inf")
+        regression = ratio > 1 + threshold and stats["median_ms"] - base["median_ms"] > noise_floor_ms
+        rows.append({"key": key, "baseline_ms": base["median_ms"], "current_ms": stats["median_ms"],
+                     "ratio": ratio, "regression": regression})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GEX pipeline stages")
+    parser.add_argument("--fixtures", help="fixture file recorded with deribit_stub.py (default: synthetic chain)")
+    parser.add_argument("--currency", default="BTC")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma-separated chain sizes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--redis-url", default=os.environ.get("BENCHMARK_REDIS_URL", "redis://localhost:6379/15"))
+    parser.add_argument("--no-redis", action="store_true", help="skip the Redis stages")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a previous results file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    sizes = [int(n) for n in args.sizes.split(",") if n]
+    if args.fixtures:
+        from deribit_stub import load_fixtures
+        entries = load_fixtures(args.fixtures)
+    else:
+        from deribit_stub import synthetic_fixtures
+        # 8 个到期日 × 130 个行权价 × call/put，足够覆盖最大规模
+        entries = synthetic_fixtures([args.currency], expiries=8, strikes=max(130, max(sizes) // 15 + 1), seed=0)
+    redis_client = None if args.no_redis else open_redis(args.redis_url)
+
+    report = run_benchmarks(entries, args.currency.upper(), sizes, args.repeat, redis_client)
+    report["meta"]["source"] = args.fixtures or "synthetic"
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        print(f"\nComparison with {args.baseline} (threshold {args.threshold:.0%}):")
+        for row in rows:
+            flag = "REGRESSION" if row["regression"] else ""
+            print(f"{row['key']:>24} {row['baseline_ms']:9.3f} -> {row['current_ms']:9.3f} ms  x{row['ratio']:.2f} {flag}")
+        regressions = [row for row in rows if row["regression"]]
+        if regressions:
+            print(f"{len(regressions)} regression(s)")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
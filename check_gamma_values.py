@@ -2,23 +2,14 @@
 """
 详细检查Gamma值的分布
 """
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
 import requests
 from datetime import datetime
+from gex_calculator import instrument_cache
 
-DERIBIT_BASE = "https://www.deribit.com/api/v2"
-
-def fetch_instruments(currency: str):
-    """获取所有可用的期权合约"""
-    response = requests.get(f"{DERIBIT_BASE}/public/get_instruments", params={
-        "currency": currency.upper(),
-        "kind": "option",
-        "expired": "false"
-    })
-    data = response.json()
-    if "result" in data:
-        return data["result"]
-    else:
-        raise Exception(f"Deribit API error on get_instruments: {data.get('error')}")
+DERIBIT_BASE = os.environ.get("DERIBIT_BASE", "https://www.deribit.com/api/v2")
 
 def fetch_option_data(instrument_name: str):
     """获取期权数据"""
@@ -33,25 +24,24 @@ def analyze_gamma_distribution(currency: str = "BTC"):
     """分析Gamma值的分布"""
     print(f"=== 分析{currency}期权Gamma值分布 ===")
     
-    # 获取所有期权
-    instruments = fetch_instruments(currency)
+    # 获取所有期权（来自合约元数据缓存）
+    metadata = instrument_cache.get(currency)
     
     # 获取最近的到期日
-    expirations = sorted(list(set(inst.get("expiration_timestamp") for inst in instruments)))
-    closest_expiration_ts = expirations[0]
+    closest_expiration_ts = metadata.nearest_expiration
     closest_expiration_date = datetime.utcfromtimestamp(closest_expiration_ts / 1000).date()
     
     # 过滤指定到期日的期权
-    filtered_instruments = [inst for inst in instruments if inst.get("expiration_timestamp") == closest_expiration_ts]
-    print(f"分析 {closest_expiration_date} 到期的 {len(filtered_instruments)} 个期权")
+    filtered_names = metadata.by_expiration[closest_expiration_ts]
+    print(f"分析 {closest_expiration_date} 到期的 {len(filtered_names)} 个期权")
     
     gamma_values = []
     zero_gamma_count = 0
     very_small_gamma_count = 0
     normal_gamma_count = 0
     
-    for inst in filtered_instruments:
-        option_data = fetch_option_data(inst["instrument_name"])
+    for name in filtered_names:
+        option_data = fetch_option_data(name)
         if option_data is None:
             continue
             
@@ -82,17 +72,17 @@ def analyze_gamma_distribution(currency: str = "BTC"):
     
     # 显示一些具体的Gamma值
     print(f"\nGamma值示例:")
-    for i, inst in enumerate(filtered_instruments[:10]):
-        option_data = fetch_option_data(inst["instrument_name"])
+    for i, name in enumerate(filtered_names[:10]):
+        option_data = fetch_option_data(name)
         if option_data:
             greeks = option_data.get("greeks", {})
             gamma = greeks.get("gamma")
             delta = greeks.get("delta")
-            print(f"  {i+1}. {inst['instrument_name']}: Gamma={gamma}, Delta={delta}")
+            print(f"  {i+1}. {name}: Gamma={gamma}, Delta={delta}")
     
     # 检查是否有期权完全没有Gamma字段
     print(f"\n检查API响应结构:")
-    sample_option = fetch_option_data(filtered_instruments[0]["instrument_name"])
+    sample_option = fetch_option_data(filtered_names[0])
     if sample_option:
         greeks = sample_option.get("greeks", {})
         print(f"  Greeks字段包含: {list(greeks.keys())}")
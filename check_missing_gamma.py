@@ -2,10 +2,11 @@
 """
 检查Deribit API中缺少Gamma的期权
 """
+import os
 import requests
 from datetime import datetime
 
-DERIBIT_BASE = "https://www.deribit.com/api/v2"
+DERIBIT_BASE = os.environ.get("DERIBIT_BASE", "https://www.deribit.com/api/v2")
 
 def fetch_instruments(currency: str):
     """获取所有可用的期权合约"""
@@ -2,11 +2,14 @@
 """
 调试GEX计算中的过滤逻辑
 """
-from backend.gex_calculator import fetch_instruments, fetch_option_data, black_scholes_greeks
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from gex_calculator import instrument_cache, fetch_option_data, black_scholes_greeks
 from datetime import datetime
 import requests
 
-DERIBIT_BASE = "https://www.deribit.com/api/v2"
+DERIBIT_BASE = os.environ.get("DERIBIT_BASE", "https://www.deribit.com/api/v2")
 
 def fetch_spot_price(currency: str):
     """获取现货价格"""
@@ -27,13 +30,12 @@ def debug_gex_filtering(currency: str = "BTC"):
     """调试GEX计算中的过滤逻辑"""
     print(f"=== 调试{currency} GEX过滤逻辑 ===")
     
-    # 获取基础数据
-    instruments = fetch_instruments(currency)
+    # 获取基础数据（合约元数据来自缓存）
+    metadata = instrument_cache.get(currency)
     spot_price = fetch_spot_price(currency)
     
     # 获取最近的到期日
-    expirations = sorted(list(set(inst.get("expiration_timestamp") for inst in instruments)))
-    closest_expiration_ts = expirations[0]
+    closest_expiration_ts = metadata.nearest_expiration
     closest_expiration_date = datetime.utcfromtimestamp(closest_expiration_ts / 1000).date()
     
     # 计算到期时间（年）
@@ -45,17 +47,18 @@ def debug_gex_filtering(currency: str = "BTC"):
     print(f"到期日: {closest_expiration_date}")
     
     # 过滤指定到期日的期权
-    filtered_instruments = [inst for inst in instruments if inst.get("expiration_timestamp") == closest_expiration_ts]
-    print(f"\n过滤后的期权数量: {len(filtered_instruments)}")
+    filtered_names = metadata.by_expiration[closest_expiration_ts]
+    print(f"\n过滤后的期权数量: {len(filtered_names)}")
     
     # 分析每个期权的处理情况
     processed_count = 0
     skipped_count = 0
     skipped_reasons = {}
     
-    for inst in filtered_instruments:
+    for name in filtered_names:
+        info = metadata.index[name]
         try:
-            option_data = fetch_option_data(inst["instrument_name"])
+            option_data = fetch_option_data(name)
             if option_data is None:
                 skipped_count += 1
                 reason = "API返回空数据"
@@ -74,11 +77,11 @@ def debug_gex_filtering(currency: str = "BTC"):
             try:
                 greeks = black_scholes_greeks(
                     S=spot_price,
-                    K=inst["strike"],
+                    K=info.strike,
                     T=T,
                     r=0.0,
                     sigma=mark_iv/100,
-                    option_type=inst["option_type"]
+                    option_type=info.option_type
                 )
                 processed_count += 1
             except Exception as e:
@@ -102,14 +105,14 @@ def debug_gex_filtering(currency: str = "BTC"):
     
     # 按执行价格分组统计
     strikes = {}
-    for inst in filtered_instruments:
-        strike = inst["strike"]
-        if strike not in strikes:
-            strikes[strike] = {"call": None, "put": None}
+    for name in filtered_names:
+        info = metadata.index[name]
+        if info.strike not in strikes:
+            strikes[info.strike] = {"call": None, "put": None}
         
-        option_data = fetch_option_data(inst["instrument_name"])
+        option_data = fetch_option_data(name)
         if option_data and option_data.get("mark_iv", 0) > 0:
-            strikes[strike][inst["option_type"]] = option_data.get("mark_iv", 0)
+            strikes[info.strike][info.option_type] = option_data.get("mark_iv", 0)
     
     print(f"\n执行价格隐含波动率分布:")
     for strike in sorted(strikes.keys()):
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { BarChart, Bar, XAxis, YAxis, Tooltip, ReferenceLine, ResponsiveContainer, Legend, CartesianGrid } from "recharts";
 import axios from "axios";
 import DataPanel from "./DataPanel"; // Import the new panel component
@@ -6,6 +6,32 @@ import DataPanel from "./DataPanel"; // Import the new panel component
 // API基础URL配置
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
 
+// 合并一个结果（整体或单个到期日）的字段和行权价变化
+const mergeChanges = (current, diff) => {
+  const next = { ...current, ...diff.changed };
+  diff.removed.forEach(field => { delete next[field]; });
+  const rows = new Map((current.data || []).map(row => [row.strike, row]));
+  diff.removed_strikes.forEach(strike => rows.delete(strike));
+  diff.data.forEach(row => rows.set(row.strike, { ...rows.get(row.strike), ...row }));
+  next.data = [...rows.values()].sort((a, b) => a.strike - b.strike);
+  return next;
+};
+
+// 把 /gex/stream 的 diff 合并到当前数据；版本不衔接时返回 null
+const applyDiff = (current, diff) => {
+  if (!current || current.version !== diff.since) return null;
+  const next = { ...mergeChanges(current, diff), version: diff.version };
+  const expiries = new Map((current.expirations || []).map(expiry => [expiry.expiration_date, expiry]));
+  diff.removed_expirations.forEach(date => expiries.delete(date));
+  diff.expirations.forEach(change => {
+    expiries.set(change.expiration_date, mergeChanges(expiries.get(change.expiration_date) || {}, change));
+  });
+  if (!diff.removed.includes("expirations") && (current.expirations || diff.expirations.length)) {
+    next.expirations = (next.expiration_dates || [...expiries.keys()]).map(date => expiries.get(date));
+  }
+  return next;
+};
+
 // 自定义Tooltip组件
 const CustomTooltip = ({ active, payload, label }) => {
   if (active && payload && payload.length) {
@@ -52,6 +78,7 @@ const CustomTooltip = ({ active, payload, label }) => {
 
 const App = () => {
   const [apiData, setApiData] = useState(null);
+  const streamDataRef = useRef(null); // 推送得到的最新数据，diff 在此基础上合并
   const [currency, setCurrency] = useState("BTC");
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
@@ -88,8 +115,32 @@ const App = () => {
 
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchData, 60000); // 1分钟刷新
-    return () => clearInterval(interval);
+    if (!window.EventSource) {
+      const interval = setInterval(fetchData, 60000); // 1分钟刷新
+      return () => clearInterval(interval);
+    }
+    // 服务器推送新快照（首次为完整数据，之后为 diff），断线后浏览器自动重连
+    streamDataRef.current = null;
+    const source = new EventSource(`${API_BASE_URL}/gex/stream?currency=${currency}`);
+    source.addEventListener('snapshot', (event) => {
+      const snapshot = JSON.parse(event.data);
+      streamDataRef.current = snapshot;
+      if (snapshot.data && snapshot.data.length > 0) {
+        setApiData(snapshot);
+      }
+    });
+    source.addEventListener('diff', (event) => {
+      const next = applyDiff(streamDataRef.current, JSON.parse(event.data));
+      if (next === null) {
+        fetchData(); // 版本不衔接（不应发生，服务器丢弃更新后会重发完整快照），改用完整数据
+        return;
+      }
+      streamDataRef.current = next;
+      if (next.data && next.data.length > 0) {
+        setApiData(next);
+      }
+    });
+    return () => source.close();
   }, [currency]);
 
   const { data, spot_price, zero_gamma, call_wall, put_wall, expiration_date } = apiData || {};
@@ -43,6 +43,9 @@ const DataPanel = ({ apiData }) => {
     spot_price,
     expiration_date,
     last_update_time,
+    timestamp,
+    stale,
+    stale_reason,
     // OI GEX
     net_oi_gex,
     // Volume GEX
@@ -54,6 +57,8 @@ const DataPanel = ({ apiData }) => {
   } = apiData;
 
   const updateTime = new Date(last_update_time).toLocaleTimeString();
+  // 上游故障时服务器返回最后一次成功的快照并标记 stale
+  const staleAge = stale && timestamp ? Math.max(0, Math.round(Date.now() / 1000 - timestamp)) : null;
 
   return (
     <div className="w-full md:w-1/3 lg:w-1/4 p-2 md:p-4 bg-gray-900 text-white overflow-y-auto">
@@ -62,6 +67,11 @@ const DataPanel = ({ apiData }) => {
         <div>
           <h3 className="font-bold text-base md:text-lg mb-2 border-b border-gray-700 pb-1">Update</h3>
           <DataRow label="Time" value={updateTime} />
+          {stale && (
+            <div title={stale_reason}>
+              <DataRow label="Stale" value={staleAge !== null ? `${staleAge}s old` : 'yes'} color="text-yellow-400" />
+            </div>
+          )}
           <DataRow label="Spot" value={spot_price} unit="USD" />
         </div>
 
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+/gex 的端到端压测
+
+默认在本地启动完整环境：Deribit 替身服务器（deribit_stub.py，合成或录制的数据，可加延迟）
+和一个指向它的后端（uvicorn 子进程，使用 --redis-url 的本地 Redis），然后以给定并发数和请求速率
+混合请求多个币种的 /gex，报告 p50/p95/p99 延迟、吞吐量、上游（替身服务器）请求数和缓存命中率
+（按 X-Cache 响应头：HIT / STALE / MISS）。
+指定 --url 时压测已在运行的后端；同时指定 --deribit-url 时从该替身服务器的 /stats 读取上游请求数。
+
+--rate > 0 时为开环压测：按固定间隔发出请求，延迟从计划发出时刻算起（不会因为服务变慢而少发请求）；
+--rate 0 时每个并发连接收到响应后立即发出下一个请求。
+缩短 --refresh-seconds 并用 --unscheduled 让请求走按需计算路径，可以复现缓存过期窗口的尾延迟。
+
+用法:
+    python loadtest_gex.py --duration 30 --concurrency 32 --rate 200
+    python loadtest_gex.py --unscheduled --refresh-seconds 5 --stub-latency 200 --output result.json
+    python loadtest_gex.py --url http://localhost:8000 --deribit-url http://localhost:8555/api/v2
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import argparse
+import asyncio
+import json
+import socket
+import subprocess
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def upstream_stats(deribit_url: str):
+    """替身服务器 /stats 中各方法的请求数；没有替身服务器时为 None"""
+    if not deribit_url:
+        return None
+    root = deribit_url.rstrip("/")
+    if root.endswith("/api/v2"):
+        root = root[:-len("/api/v2")]
+    try:
+        return httpx.get(f"{root}/stats", timeout=5).json()["requests"]
+    except Exception as e:
+        print(f"Could not read upstream stats from {root}: {e}")
+        return None
+
+
+def start_backend(deribit_url: str, redis_url: str, port: int, refresh_seconds: float, scheduled: bool, currencies):
+    """启动指向替身服务器的后端子进程，等待其可用"""
+    env = {
+        **os.environ,
+        "DERIBIT_BASE": deribit_url,
+        "REDIS_URL": redis_url,
+        "GEX_REFRESH_SECONDS": str(refresh_seconds),
+        "GEX_SCHEDULE_CURRENCIES": ",".join(currencies) if scheduled else "",
+    }
+    env.pop("GEX_STREAM_CURRENCIES", None)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    url = f"http://localhost:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise Exception(f"Backend exited with status {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise Exception("Backend did not start within 30 seconds")
+
+
+async def run_load(url: str, currencies, duration: float, concurrency: int = 16, rate: float = 0,
+                   selections=(None,), timeout: float = 30):
+    """
+    对 url 的 /gex 压测 duration 秒，请求按币种和到期日选择轮流分配
+    返回每个请求的 {"currency", "selection", "latency", "status", "cache", "error"}
+    """
+    targets = [(currency, selection) for selection in selections for currency in currencies]
+    records = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    started = time.perf_counter()
+    end = started + duration
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def request(i, scheduled_at):
+            currency, selection = targets[i % len(targets)]
+            params = {"currency": currency}
+            if selection:
+                params["expirations"] = selection
+            record = {"currency": currency, "selection": selection, "status": None, "cache": None, "error": None}
+            try:
+                response = await client.get("/gex", params=params)
+                record["status"] = response.status_code
+                record["cache"] = response.headers.get("x-cache")
+                if response.status_code != 200:
+                    record["error"] = f"HTTP {response.status_code}"
+                elif record["cache"] is None:
+                    # 出错时返回不带 X-Cache 头的 JSON
+                    record["error"] = response.json().get("error", "missing X-Cache header")
+            except httpx.HTTPError as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+            record["latency"] = time.perf_counter() - scheduled_at
+            records.append(record)
+
+        if rate > 0:
+            # 开环：按计划时刻发出，最多 concurrency 个在途请求由连接池排队
+            tasks = []
+            i = 0
+            while True:
+                scheduled_at = started + i / rate
+                if scheduled_at >= end:
+                    break
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(request(i, scheduled_at)))
+                i += 1
+            await asyncio.gather(*tasks)
+        else:
+            counter = iter(range(1 << 62))
+
+            async def worker():
+                while time.perf_counter() < end:
+                    await request(next(counter), time.perf_counter())
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return records, time.perf_counter() - started
+
+
+def summarize(records, elapsed: float, upstream_before=None, upstream_after=None):
+    """延迟分位数（毫秒）、吞吐量、错误数、缓存命中率和上游请求数"""
+    def latency_stats(rows):
+        latencies = np.array([row["latency"] for row in rows]) * 1000
+        if not len(latencies):
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {"count": len(rows), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99,
+                "max_ms": float(latencies.max()), "mean_ms": float(latencies.mean())}
+
+    ok = [row for row in records if row["error"] is None]
+    cache = Counter(row["cache"] for row in ok if row["cache"])
+    cached = sum(cache.values())
+    report = {
+        "requests": len(records),
+        "errors": len(records) - len(ok),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed > 0 else 0,
+        "latency": latency_stats(ok),
+        "by_currency": {currency: latency_stats([row for row in ok if row["currency"] == currency])
+                        for currency in sorted({row["currency"] for row in records})},
+        "by_cache": {status: latency_stats([row for row in ok if row["cache"] == status]) for status in sorted(cache)},
+        "cache": dict(cache),
+        "cache_hit_ratio": (cache["HIT"] + cache["STALE"]) / cached if cached else None,
+        "error_samples": sorted({row["error"] for row in records if row["error"]})[:5],
+    }
+    if upstream_before is not None and upstream_after is not None:
+        upstream = {method: upstream_after.get(method, 0) - upstream_before.get(method, 0) for method in upstream_after}
+        report["upstream_requests"] = {method: count for method, count in upstream.items() if count}
+        report["upstream_total"] = sum(upstream.values())
+    return report
+
+
+def print_report(report):
+    latency = report["latency"]
+    print(f"\nRequests: {report['requests']}  errors: {report['errors']}  "
+          f"throughput: {report['throughput_rps']:.1f} req/s over {report['elapsed_s']:.1f}s")
+    if latency["count"]:
+        print(f"Latency: p50 {latency['p50_ms']:.1f} ms  p95 {latency['p95_ms']:.1f} ms  "
+              f"p99 {latency['p99_ms']:.1f} ms  max {latency['max_ms']:.1f} ms")
+    for name, group in (("currency", report["by_currency"]), ("cache", report["by_cache"])):
+        for key, stats in group.items():
+            if stats["count"]:
+                print(f"  {name} {key:>6}: {stats['count']:6d} req  p50 {stats['p50_ms']:8.1f}  "
+                      f"p95 {stats['p95_ms']:8.1f}  p99 {stats['p99_ms']:8.1f} ms")
+    if report["cache_hit_ratio"] is not None:
+        print(f"Cache: {report['cache']}  hit ratio {report['cache_hit_ratio']:.1%}")
+    if "upstream_total" in report:
+        print(f"Upstream requests: {report['upstream_total']} {report['upstream_requests']}")
+    for error in report["error_samples"]:
+        print(f"  error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /gex")
+    parser.add_argument("--url", help="backend to test (default: start one against a local Deribit stand-in)")
+    parser.add_argument("--deribit-url", help="stand-in used by --url, for upstream request counts")
+    parser.add_argument("--currencies", default="BTC,ETH,SOL,XRP")
+    parser.add_argument("--selections", default="", help="comma-separated expirations values to mix in, e.g. all")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=0, help="requests per second (0 = closed loop)")
+    parser.add_argument("--warmup", type=float, default=0, help="seconds of untimed load before measuring")
+    parser.add_argument("--fixtures", help="fixture file for the stand-in (default: synthetic chains)")
+    parser.add_argument("--stub-latency", type=float, default=50, help="stand-in latency in milliseconds")
+    parser.add_argument("--stub-jitter", type=float, default=20, help="stand-in jitter in milliseconds")
+    parser.add_argument("--stub-error-rate", type=float, default=0)
+    parser.add_argument("--redis-url", default=os.environ.get("REDIS_URL", "redis://localhost:6379"))
+    parser.add_argument("--refresh-seconds", type=float, default=60, help="GEX_REFRESH_SECONDS of the started backend")
+    parser.add_argument("--unscheduled", action="store_true", help="do not pre-compute currencies in the background")
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    currencies = [c for c in args.currencies.upper().split(",") if c]
+    selections = [None] + [s for s in args.selections.split(",") if s]
+    stub = backend = None
+    url, deribit_url = args.url, args.deribit_url
+    try:
+        if url is None:
+            from deribit_stub import StubServer, load_fixtures, synthetic_fixtures
+            entries = load_fixtures(args.fixtures) if args.fixtures else synthetic_fixtures(currencies, expiries=6, strikes=60)
+            stub = StubServer(entries, latency=args.stub_latency / 1000, jitter=args.stub_jitter / 1000,
+                              error_rate=args.stub_error_rate).start()
+            deribit_url = stub.url
+            backend, url = start_backend(deribit_url, args.redis_url, free_port(), args.refresh_seconds,
+                                         not args.unscheduled, currencies)
+            print(f"Backend {url} against stand-in {deribit_url}")
+
+        if args.warmup > 0:
+            asyncio.run(run_load(url, currencies, args.warmup, args.concurrency, args.rate, selections))
+        before = upstream_stats(deribit_url)
+        records, elapsed = asyncio.run(run_load(url, currencies, args.duration, args.concurrency, args.rate, selections))
+        report = summarize(records, elapsed, before, upstream_stats(deribit_url))
+        report["config"] = {key: value for key, value in vars(args).items() if key != "output"}
+    finally:
+        if backend is not None:
+            backend.terminate()
+            backend.wait()
+        if stub is not None:
+            stub.stop()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
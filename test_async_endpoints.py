@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+测试请求路径不阻塞：一个币种的计算很慢（并且有大量并发请求）时，其它币种的
+/gex、/gex/diff、/gex/profile、/gex/scenarios 仍然立即返回
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+os.environ.setdefault("GEX_SHARED_SNAPSHOTS", "0")
+import asyncio
+import threading
+import time
+import httpx
+import numpy as np
+from gex_calculator import gex_from_chain
+from test_gamma_profile import make_chain
+
+def test_slow_currency_does_not_delay_others():
+    print("=== 测试慢币种不阻塞其它币种 ===")
+    import main
+    chain, now_ms = make_chain(200)
+    release = threading.Event()
+
+    def fake_processed_gex_data(currency, expirations=None, previous=None):
+        if currency == "BTC":
+            release.wait(10)
+        gex_details = gex_from_chain(chain, 100000.0, None, now_ts=now_ms)
+        gex_details.update(timestamp=now_ms / 1000, currency=currency, chain_updated_at=now_ms / 1000)
+        main.chains[(currency, expirations)] = (now_ms / 1000, 100000.0, chain)
+        return gex_details
+
+    previous = (main.get_processed_gex_data, main.scheduler.shared, main.scheduler.fallback, main.scheduler.schedule)
+    main.get_processed_gex_data = fake_processed_gex_data
+    main.scheduler.shared = main.scheduler.fallback = None
+    main.scheduler.schedule = {}
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=20) as client:
+            # 远多于共享线程池大小的 BTC 请求都在等待同一次慢计算
+            paths = ["/gex", "/gex/diff", "/gex/profile", "/gex/scenarios"] * 20
+            slow = [asyncio.create_task(client.get(path, params={"currency": "BTC"})) for path in paths]
+            await asyncio.sleep(0.2)
+            latencies = {}
+            for path in ["/gex", "/gex/diff", "/gex/profile", "/gex/scenarios"]:
+                started = time.perf_counter()
+                response = await client.get(path, params={"currency": "ETH"})
+                latencies[path] = time.perf_counter() - started
+                assert response.status_code == 200 and "error" not in response.json(), (path, response.text[:200])
+            assert not any(task.done() for task in slow)
+            release.set()
+            responses = await asyncio.gather(*slow)
+            assert all(response.status_code == 200 and "error" not in response.json() for response in responses)
+            return latencies
+
+    try:
+        latencies = asyncio.run(run())
+    finally:
+        release.set()
+        main.get_processed_gex_data, main.scheduler.shared, main.scheduler.fallback, main.scheduler.schedule = previous
+    print({path: f"{seconds * 1000:.1f} ms" for path, seconds in latencies.items()})
+    assert max(latencies.values()) < 1.0
+
+if __name__ == "__main__":
+    test_slow_currency_does_not_delay_others()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+测试基准测试脚本：小规模运行一次，并检查与基线比较时的回退判断
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import json
+from benchmark_gex import compare, run_benchmarks
+from deribit_stub import synthetic_fixtures
+
+def open_test_redis():
+    """fakeredis，否则本地 Redis 的 15 号库；都不可用时 None"""
+    try:
+        import fakeredis
+        return fakeredis.FakeRedis()
+    except ImportError:
+        pass
+    import redis
+    client = redis.from_url("redis://localhost:6379/15")
+    try:
+        client.ping()
+    except Exception:
+        return None
+    return client
+
+def test_run_and_compare():
+    print("=== 测试基准测试 ===")
+    report = run_benchmarks(synthetic_fixtures(["ETH"], expiries=2, strikes=40), "ETH", sizes=[100, 1000], repeat=1)
+    # 合成链只有约 160 个合约，1000 的规模被跳过
+    assert sorted({row["n"] for row in report["results"].values()}) == [100]
+    assert {"bs_greeks_scalar@100", "gex_from_chain@100", "summarize_gex@100", "json_encode@100"} <= set(report["results"])
+    json.dumps(report)
+
+    slower = json.loads(json.dumps(report))
+    slower["results"]["gex_from_chain@100"]["median_ms"] = report["results"]["gex_from_chain@100"]["median_ms"] * 2 + 1
+    rows = {row["key"]: row for row in compare(slower, report, threshold=0.25)}
+    assert rows["gex_from_chain@100"]["regression"]
+    assert not any(row["regression"] for key, row in rows.items() if key != "gex_from_chain@100")
+    print(f"{len(report['results'])} 项结果，回退: {[key for key, row in rows.items() if row['regression']]}")
+
+def test_redis_stages_keep_real_history():
+    """Redis 阶段只写入并删除 benchmark:<币种> 的键，真实币种的历史保持不变"""
+    print("=== 测试基准测试的 Redis 阶段 ===")
+    client = open_test_redis()
+    if client is None:
+        print("Redis 不可用，跳过")
+        return
+    client.zadd("gex_bars:ETH:15m", {b"real": 1})
+    try:
+        report = run_benchmarks(synthetic_fixtures(["ETH"], expiries=2, strikes=40), "ETH", sizes=[100], repeat=1,
+                                redis_client=client)
+        assert {"history_record@100", "spot_update@100"} <= set(report["results"])
+        keys = sorted(key.decode() for key in client.keys("*"))
+        print(f"剩余的键: {keys}")
+        assert keys == ["gex_bars:ETH:15m"]
+    finally:
+        client.delete("gex_bars:ETH:15m")
+
+if __name__ == "__main__":
+    test_run_and_compare()
+    test_redis_stages_keep_real_history()
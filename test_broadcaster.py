@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+测试快照推送：每次更新只序列化一次，慢订阅者丢弃旧更新后收到完整快照
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import asyncio
+import json
+import threading
+from broadcaster import Broadcaster
+
+def payload(i):
+    return {"version": str(i), "spot_price": 100.0 + i, "data": [{"strike": 100.0, "call_gex": float(i)}]}
+
+def parse(frame):
+    lines = dict(line.split(": ", 1) for line in frame.decode().strip().split("\n"))
+    return lines["event"], json.loads(lines["data"])
+
+def test_fan_out_and_backpressure():
+    print("=== 测试推送和背压 ===")
+
+    async def run():
+        broadcaster = Broadcaster(max_pending=2)
+        broadcaster.publish("BTC", payload(0))
+        fast = broadcaster.subscribe("BTC")
+        slow = broadcaster.subscribe("BTC")
+
+        # 新订阅者先收到最近的完整快照
+        for subscriber in (fast, slow):
+            event, data = parse(await subscriber.next_frame(1))
+            assert event == "snapshot" and data["version"] == "0"
+
+        # 快订阅者逐个收到 diff，与慢订阅者共享同一份字节串
+        publisher = threading.Thread(target=broadcaster.publish, args=("BTC", payload(1)))
+        publisher.start()
+        publisher.join()
+        frame = await fast.next_frame(1)
+        event, data = parse(frame)
+        assert event == "diff" and data["since"] == "0" and data["changed"]["spot_price"] == 101.0
+        assert data["data"] == [{"strike": 100.0, "call_gex": 1.0}]
+
+        # 积压超过队列长度：丢弃最旧的更新，下一帧为完整快照
+        for i in range(2, 6):
+            broadcaster.publish("BTC", payload(i))
+        await asyncio.sleep(0.01)
+        assert slow.dropped == 3
+        event, data = parse(await slow.next_frame(1))
+        assert event == "snapshot" and data["version"] == "4"
+        slow_frame = await slow.next_frame(1)
+        event, data = parse(slow_frame)
+        assert event == "diff" and data["since"] == "4" and data["version"] == "5"
+
+        # 同一次更新的同一种帧只序列化一次，所有订阅者共享
+        await fast.next_frame(1)
+        assert (await fast.next_frame(1)) is slow_frame
+
+        broadcaster.unsubscribe("BTC", fast)
+        broadcaster.unsubscribe("BTC", slow)
+        assert broadcaster.subscriber_count() == 0
+        assert await slow.next_frame(0.01) is None
+        print(f"慢订阅者丢弃 {slow.dropped} 次更新")
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_fan_out_and_backpressure()
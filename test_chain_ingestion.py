@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+用本地 Deribit 替身服务器测试期权链获取：book 与 ticker 两种行情来源一致、
+合约元数据缓存的重新下载，以及到期日选择和按到期日拆分的结果
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import threading
+import time
+from collections import Counter
+import numpy as np
+import deribit_client
+from deribit_client import DeribitClient, fetch_instruments
+from deribit_stub import StubServer, fixture_key, synthetic_fixtures
+from gex_calculator import calculate_gex_data, expiration_date_str, fetch_chain_quotes, instrument_cache, select_expirations
+from instrument_cache import InstrumentCache
+
+class use_stub:
+    """在 with 块内让 deribit_client 的全局客户端指向替身服务器，并清空合约元数据缓存"""
+
+    def __init__(self, stub):
+        self.stub = stub
+
+    def __enter__(self):
+        self.previous = deribit_client._client
+        deribit_client._client = DeribitClient(base_url=self.stub.url)
+        instrument_cache.invalidate()
+        return self.stub
+
+    def __exit__(self, *exc):
+        deribit_client._client.close()
+        deribit_client._client = self.previous
+        instrument_cache.invalidate()
+
+def assert_same_rows(rows, expected):
+    """逐行比较；两次计算的到期时间相差几毫秒，最近到期日不到一天时 GEX 有 ~1e-5 的相对差"""
+    assert [row["strike"] for row in rows] == [row["strike"] for row in expected]
+    for row, other in zip(rows, expected):
+        for field in row:
+            assert np.isclose(row[field], other[field], rtol=1e-4), (row["strike"], field, row[field], other[field])
+
+def test_book_matches_ticker():
+    print("=== 测试 book 与 ticker 行情一致 ===")
+    with StubServer(synthetic_fixtures(["BTC"], expiries=2, strikes=10)) as stub, use_stub(stub):
+        names = [inst["instrument_name"] for inst in fetch_instruments("BTC")]
+        book = fetch_chain_quotes("BTC", names, "book")
+        ticker = fetch_chain_quotes("BTC", names, "ticker")
+        assert len(book) == len(names) and book == ticker
+        # 只请求一部分合约时 ticker 只返回这些合约
+        assert fetch_chain_quotes("BTC", names[:3], "ticker") == {name: book[name] for name in names[:3]}
+
+        from_book = calculate_gex_data("BTC", source="book", expirations="all")
+        from_ticker = calculate_gex_data("BTC", source="ticker", expirations="all")
+        print(f"{len(names)} 个合约，{len(from_book['data'])} 个行权价，请求统计: {dict(stub.requests)}")
+        assert len(from_book["data"]) > 0
+        assert_same_rows(from_ticker["data"], from_book["data"])
+        for field in ("zero_gamma", "call_wall", "put_wall", "spot_price", "expiration_date"):
+            assert from_ticker[field] == from_book[field] or np.isclose(from_ticker[field], from_book[field]), field
+        assert stub.requests["get_book_summary_by_currency"] == 2
+        assert stub.requests["ticker"] >= 2 * len(names)
+        try:
+            fetch_chain_quotes("BTC", names, "websocket")
+            assert False, "unknown source should raise"
+        except ValueError:
+            pass
+
+def test_refetch_after_nearest_expiry():
+    print("\n=== 测试最近到期日过去后重新下载合约元数据 ===")
+    # 最近的到期日（now_ms 之后 0.9 天）在 0.5 秒后到达；不平移时间戳
+    now_ms = int(time.time() * 1000) - int(0.9 * 86400 * 1000) + 500
+    with StubServer(synthetic_fixtures(["ETH"], expiries=2, strikes=3, now_ms=now_ms), rebase_time=False) as stub, use_stub(stub):
+        cache = InstrumentCache(fetch_instruments)
+        metadata = cache.get("ETH")
+        assert cache.get("eth") is metadata
+        assert stub.requests["get_instruments"] == 1
+        time.sleep(max(0, metadata.nearest_expiration / 1000 - time.time()) + 0.05)
+        refreshed = cache.get("ETH")
+        print(f"最近到期日过去后请求统计: {dict(stub.requests)}")
+        assert refreshed is not metadata and stub.requests["get_instruments"] == 2
+        # 缓存超时同样视为过期
+        assert metadata.is_stale(now=metadata.fetched_at + 3600, max_age=3600)
+
+def test_slow_fetch_does_not_block_other_currencies():
+    print("\n=== 测试一个币种下载慢时不阻塞其它币种 ===")
+    release = threading.Event()
+    fetches = Counter()
+
+    def fetch(currency):
+        fetches[currency] += 1
+        if currency == "BTC":
+            release.wait(10)
+        return [{"instrument_name": f"{currency}-1JAN30-100-C", "strike": 100.0, "option_type": "call",
+                 "expiration_timestamp": 1893456000000, "contract_size": 1.0}]
+
+    cache = InstrumentCache(fetch)
+    slow = [threading.Thread(target=cache.get, args=("BTC",)) for _ in range(4)]
+    for thread in slow:
+        thread.start()
+    try:
+        time.sleep(0.1)
+        started = time.perf_counter()
+        assert cache.get("ETH").currency == "ETH"
+        elapsed = time.perf_counter() - started
+    finally:
+        release.set()
+        for thread in slow:
+            thread.join()
+    print(f"BTC 下载期间 ETH 耗时 {elapsed * 1000:.1f} ms，下载次数: {dict(fetches)}")
+    assert elapsed < 1.0
+    # 同一币种的并发调用共享一次下载
+    assert fetches == {"BTC": 1, "ETH": 1}
+    assert cache.get("BTC").currency == "BTC" and fetches["BTC"] == 1
+
+def test_refetch_on_new_listing():
+    print("\n=== 测试 book 中出现新上市合约时重新下载合约元数据 ===")
+    entries = synthetic_fixtures(["BTC"], expiries=1, strikes=5)
+    with StubServer(entries) as stub, use_stub(stub):
+        instruments_key = fixture_key("get_instruments", {"currency": "BTC", "kind": "option", "expired": "false"})
+        listed = stub.responses[instruments_key]
+        # 最后一个合约刚上市：已出现在 book 中，但缓存的合约列表里还没有
+        stub.responses[instruments_key] = listed[:-1]
+        calculate_gex_data("BTC")
+        assert stub.requests["get_instruments"] == 1
+        stub.responses[instruments_key] = listed
+        calculate_gex_data("BTC")
+        assert stub.requests["get_instruments"] == 2
+        assert listed[-1]["instrument_name"] in instrument_cache.get("BTC").index
+        # 新合约已在缓存中，不再重新下载
+        calculate_gex_data("BTC")
+        print(f"请求统计: {dict(stub.requests)}")
+        assert stub.requests["get_instruments"] == 2
+        # 没有新合约时不使缓存失效
+        assert not instrument_cache.check_new_listings("BTC", [inst["instrument_name"] for inst in listed])
+
+def test_select_expirations():
+    print("\n=== 测试到期日选择和按到期日拆分 ===")
+    with StubServer(synthetic_fixtures(["BTC"], expiries=3, strikes=8)) as stub, use_stub(stub):
+        metadata = instrument_cache.get("BTC")
+        timestamps = metadata.expirations
+        dates = [expiration_date_str(ts) for ts in timestamps]
+        assert len(set(dates)) == 3
+        assert select_expirations(metadata) == timestamps[:1]
+        assert select_expirations(metadata, [dates[1]]) == [timestamps[1]]
+        assert select_expirations(metadata, f"{dates[2]}, {dates[0]}") == [timestamps[0], timestamps[2]]
+        assert select_expirations(metadata, [dates[0], dates[0]]) == [timestamps[0]]
+        assert select_expirations(metadata, "all") == timestamps
+        for unknown in (["2000-01-01"], f"{dates[0]},2000-01-01"):
+            try:
+                select_expirations(metadata, unknown)
+                assert False, "unknown expiration should raise"
+            except ValueError as e:
+                assert "2000-01-01" in str(e) and dates[0] not in str(e)
+
+        # 默认只计算最近到期日，没有拆分
+        nearest = calculate_gex_data("BTC")
+        assert nearest["expiration_date"] == dates[0] and "expirations" not in nearest
+
+        # 多个到期日：合并结果 + 每个到期日各自的结果，与单独计算该到期日一致
+        combined = calculate_gex_data("BTC", expirations=[dates[2], dates[0]])
+        assert combined["expiration_date"] == dates[0]
+        assert combined["expiration_dates"] == [dates[0], dates[2]]
+        assert [expiry["expiration_date"] for expiry in combined["expirations"]] == [dates[0], dates[2]]
+        for date, expiry in zip(combined["expiration_dates"], combined["expirations"]):
+            single = calculate_gex_data("BTC", expirations=[date])
+            assert_same_rows(expiry["data"], single["data"])
+            assert expiry["zero_gamma"] == single["zero_gamma"] or np.isclose(expiry["zero_gamma"], single["zero_gamma"])
+            assert expiry["call_wall"] == single["call_wall"] and expiry["put_wall"] == single["put_wall"]
+        # 合并结果的每个行权价等于各到期日之和
+        totals = {}
+        for expiry in combined["expirations"]:
+            for row in expiry["data"]:
+                totals[row["strike"]] = totals.get(row["strike"], 0) + row["call_gex"]
+        assert sorted(totals) == [row["strike"] for row in combined["data"]]
+        assert all(np.isclose(totals[row["strike"]], row["call_gex"]) for row in combined["data"])
+
+        everything = calculate_gex_data("BTC", expirations="all")
+        assert everything["expiration_dates"] == dates and len(everything["expirations"]) == 3
+        try:
+            calculate_gex_data("BTC", expirations="2000-01-01")
+            assert False, "unknown expiration should raise"
+        except ValueError:
+            pass
+        print(f"{len(dates)} 个到期日: {dates}，请求统计: {dict(stub.requests)}")
+
+if __name__ == "__main__":
+    test_book_matches_ticker()
+    test_refetch_after_nearest_expiry()
+    test_slow_fetch_does_not_block_other_currencies()
+    test_refetch_on_new_listing()
+    test_select_expirations()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+测试 Deribit 端点熔断器：连续失败后熔断、熔断时立即失败、半开探测和恢复
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import time
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from deribit_client import DeribitClient, DeribitAPIError
+from deribit_stub import StubServer, synthetic_fixtures
+
+def test_breaker_states():
+    print("=== 测试熔断器状态 ===")
+    breaker = CircuitBreaker("ticker", failure_threshold=3, reset_timeout=0.2)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    try:
+        breaker.before_call()
+        assert False, "open circuit should reject calls"
+    except CircuitOpenError as e:
+        print(f"熔断: {e}")
+
+    time.sleep(0.25)
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    try:
+        breaker.before_call()
+        assert False, "only one probe in half-open state"
+    except CircuitOpenError:
+        pass
+    # 探测失败：重新熔断
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    time.sleep(0.25)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+def test_client_fails_fast():
+    print("=== 测试上游超时时客户端熔断 ===")
+    entries = synthetic_fixtures(["BTC"], expiries=1, strikes=5)
+    with StubServer(entries, latency=0.3) as stub:
+        client = DeribitClient(base_url=stub.url, timeout=0.05, max_retries=1, backoff=0.001, rate_limit=False,
+                               breaker_failures=4, breaker_reset=0.5)
+        try:
+            for _ in range(2):
+                try:
+                    client.run(client.get_spot_price("BTC"))
+                    assert False, "slow upstream should time out"
+                except Exception as e:
+                    assert not isinstance(e, CircuitOpenError)
+            started = time.perf_counter()
+            try:
+                client.run(client.get_spot_price("BTC"))
+                assert False, "open circuit should reject the request"
+            except CircuitOpenError as e:
+                elapsed = time.perf_counter() - started
+                print(f"熔断后立即失败: {elapsed * 1000:.1f} ms")
+                assert elapsed < 0.05
+            requests = stub.requests["ticker"]
+            assert requests == 4
+
+            # 其它端点不受影响；参数错误不计为失败
+            stub.latency = 0
+            try:
+                client.run(client.get_index_price("unknown_index"))
+            except DeribitAPIError as e:
+                assert e.code == 13020
+            assert client.breakers.states() == {("ticker", "spot"): OPEN, ("get_index_price", "bulk"): CLOSED}
+
+            # 上游恢复后，熔断时间过去，探测请求成功即恢复
+            time.sleep(0.6)
+            assert client.run(client.get_spot_price("BTC")) == 100000.0
+            assert client.breakers.states()[("ticker", "spot")] == CLOSED
+        finally:
+            client.close()
+
+def test_spot_has_own_breaker():
+    print("=== 测试批量 ticker 熔断不影响现货价格 ===")
+    entries = synthetic_fixtures(["BTC"], expiries=1, strikes=5)
+    with StubServer(entries, error_rate=1, error_status=503) as stub:
+        client = DeribitClient(base_url=stub.url, max_retries=0, rate_limit=False, breaker_failures=3, breaker_reset=30)
+        try:
+            names = [entry["params"]["instrument_name"] for entry in entries
+                     if entry["method"] == "ticker" and "PERPETUAL" not in entry["params"]["instrument_name"]]
+            for name in names[:3]:
+                try:
+                    client.run(client.get_ticker(name))
+                    assert False, "upstream error should raise"
+                except DeribitAPIError:
+                    pass
+            # 上游恢复，批量请求的熔断器仍在熔断期内，现货请求不受影响
+            stub.error_rate = 0
+            assert client.run(client.get_spot_price("BTC")) == 100000.0
+            try:
+                client.run(client.get_ticker(names[0]))
+                assert False, "bulk circuit should still be open"
+            except CircuitOpenError:
+                pass
+            states = client.breakers.states()
+            print(f"熔断器状态: {states}")
+            assert states == {("ticker", "bulk"): OPEN, ("ticker", "spot"): CLOSED}
+        finally:
+            client.close()
+
+if __name__ == "__main__":
+    test_breaker_states()
+    test_client_fails_fast()
+    test_spot_has_own_breaker()
+    print("\n✅ 所有熔断测试通过")
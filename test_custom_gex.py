@@ -2,7 +2,12 @@
 """
 测试自定义GEX计算器
 """
-from backend.gex_calculator import calculate_gex_data, black_scholes_greeks
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import math
+import numpy as np
+from gex_calculator import calculate_gex_data, black_scholes_greeks, black_scholes_greeks_batch
 
 def test_greeks_calculation():
     """测试Black-Scholes Greeks计算"""
@@ -40,6 +45,98 @@ def test_greeks_calculation():
     # 验证Gamma应该相同
     print(f"\n验证: Call和Put的Gamma应该相同: {call_greeks['gamma'] == put_greeks['gamma']}")
 
+# 原 scipy.stats.norm 实现算出的参考值: (S, K, T, r, sigma, 类型) -> (delta, gamma, vega, theta)
+REFERENCE_GREEKS = [
+    ((100000, 100000, 0.1, 0.0, 0.8, 'call'), (0.5503284057193168, 1.564392492004576e-05, 12515.139936036609, -50060.55974414643)),
+    ((100000, 95000, 0.25, 0.05, 0.7, 'put'), (-0.360446132476979, 1.0693638035189602e-05, 18713.866561581806, -23867.51468418981)),
+    ((2500, 3000, 0.02, 0.05, 0.9, 'call'), (0.08676362624965517, 0.0004966054966566514, 55.86811837387327, -1267.2740608714582)),
+]
+
+def closed_form_greeks(S, K, T, r, sigma, option_type):
+    """只用 math 模块的Black-Scholes闭式解，作为独立的参考实现"""
+    sqrt_T = math.sqrt(T)
+    d1 = (math.log(S / K) + (r + 0.5 * sigma**2) * T) / (sigma * sqrt_T)
+    d2 = d1 - sigma * sqrt_T
+    cdf = lambda x: 0.5 * (1 + math.erf(x / math.sqrt(2)))
+    pdf_d1 = math.exp(-0.5 * d1**2) / math.sqrt(2 * math.pi)
+    decay = -S * pdf_d1 * sigma / (2 * sqrt_T)
+    if option_type == 'call':
+        return cdf(d1), pdf_d1 / (S * sigma * sqrt_T), S * pdf_d1 * sqrt_T, decay - r * K * math.exp(-r * T) * cdf(d2)
+    return cdf(d1) - 1, pdf_d1 / (S * sigma * sqrt_T), S * pdf_d1 * sqrt_T, decay + r * K * math.exp(-r * T) * cdf(-d2)
+
+def test_batch_greeks_calculation():
+    """测试向量化Greeks与原实现的参考值、独立的闭式解一致，无效隐含波动率为 0"""
+    print("\n=== 测试向量化Greeks计算 ===")
+    names = ['delta', 'gamma', 'vega', 'theta']
+    
+    for args, expected in REFERENCE_GREEKS:
+        S, K, T, r, sigma, option_type = args
+        batch = black_scholes_greeks_batch(S, np.array([K]), T, r, np.array([sigma]), np.array([option_type == 'call']))
+        single = black_scholes_greeks(*args)
+        for name, value in zip(names, expected):
+            assert np.isclose(batch[name][0], value, rtol=1e-9), (args, name, batch[name][0], value)
+            assert np.isclose(single[name], value, rtol=1e-9), (args, name, single[name], value)
+    
+    S = 100000
+    strikes = np.array([80000, 95000, 100000, 105000, 120000, 100000])
+    is_call = np.array([True, False, True, False, True, False])
+    sigma = np.array([0.9, 0.7, 0.6, 0.65, 0.8, 0.0])  # 最后一个为无效隐含波动率
+    T, r = 0.1, 0.03
+    
+    batch = black_scholes_greeks_batch(S, strikes, T, r, sigma, is_call)
+    for i in range(len(strikes) - 1):
+        expected = closed_form_greeks(S, strikes[i], T, r, sigma[i], 'call' if is_call[i] else 'put')
+        for name, value in zip(names, expected):
+            assert np.isclose(batch[name][i], value, rtol=1e-9), (i, name, batch[name][i], value)
+    for name in names:
+        assert batch[name][-1] == 0, (name, batch[name][-1])
+    print(f"向量化结果与参考值一致: {len(REFERENCE_GREEKS)} 个参考值, {len(strikes)} 个期权（含 1 个无效隐含波动率）")
+
+def reference_aggregate(strike, is_call, open_interest, volume, gex_oi, gex_vol, group, groups):
+    """逐个合约累加的参考实现，返回每组 {行权价: [oi_call_gex, oi_put_gex, vol_call_gex, vol_put_gex, call_oi, put_oi, call_volume, put_volume]}"""
+    result = [{} for _ in range(groups)]
+    for i in range(len(strike)):
+        row = result[group[i]].setdefault(float(strike[i]), [0.0] * 8)
+        side = 0 if is_call[i] else 1
+        row[side] += gex_oi[i]
+        row[2 + side] += gex_vol[i]
+        row[4 + side] += open_interest[i]
+        row[6 + side] += volume[i]
+    return result
+
+def test_aggregate_by_strike():
+    """按行权价汇总与逐个合约累加的参考实现一致（重复行权价、同一行权价的call/put、按到期日分组）"""
+    print("\n=== 测试按行权价汇总 ===")
+    from gex_calculator import StrikeGex, aggregate_by_strike
+    rng = np.random.default_rng(7)
+    n, groups = 500, 3
+    # 行权价从少量取值中抽取，大量重复；部分分组缺少某些行权价
+    strike = rng.choice(np.arange(80.0, 121.0, 2.5), size=n)
+    is_call = rng.random(n) < 0.5
+    group = rng.integers(0, groups, size=n)
+    group[strike == 80.0] = 0
+    open_interest = rng.integers(0, 1000, size=n).astype(float)
+    volume = rng.integers(0, 100, size=n).astype(float)
+    gex_oi = np.where(is_call, 1.0, -1.0) * rng.random(n) * open_interest
+    gex_vol = np.where(is_call, 1.0, -1.0) * rng.random(n) * volume
+    columns = (strike, is_call, open_interest, volume, gex_oi, gex_vol)
+
+    cases = [(aggregate_by_strike(*columns), reference_aggregate(*columns, np.zeros(n, dtype=int), 1)),
+             (aggregate_by_strike(*columns, group, groups), reference_aggregate(*columns, group, groups))]
+    for result, expected in cases:
+        assert len(result) == len(expected)
+        for strike_gex, reference in zip(result, expected):
+            assert strike_gex.strike.tolist() == sorted(reference)
+            for j, field in enumerate(StrikeGex._fields[1:]):
+                values = getattr(strike_gex, field)
+                reference_values = [reference[s][j] for s in strike_gex.strike.tolist()]
+                assert np.allclose(values, reference_values, rtol=1e-12, atol=1e-9), field
+    assert 80.0 not in cases[1][0][1].strike.tolist()
+    # 空链
+    (empty,) = aggregate_by_strike(*(np.zeros(0) for _ in range(6)))
+    assert all(len(values) == 0 for values in empty)
+    print(f"{n} 个合约, {len(cases[0][0][0].strike)} 个行权价, {groups} 个分组与参考实现一致")
+
 def test_gex_calculation():
     """测试GEX计算"""
     print("\n=== 测试GEX计算 ===")
@@ -84,4 +181,6 @@ def test_gex_calculation():
 
 if __name__ == "__main__":
     test_greeks_calculation()
+    test_batch_greeks_calculation()
+    test_aggregate_by_strike()
     test_gex_calculation() 
\ No newline at end of file
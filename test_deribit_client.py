@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+测试Deribit客户端的重试、超时和并发限制（使用本地模拟transport，不访问真实API）
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import asyncio
+import httpx
+from deribit_client import DeribitClient, DeribitAPIError
+
+def make_client(handler, **kwargs):
+    return DeribitClient(base_url="http://deribit.test/api/v2", transport=httpx.MockTransport(handler), backoff=0.001, **kwargs)
+
+def test_retry_on_server_error():
+    """503和10028错误应重试，最终拿到结果"""
+    print("=== 测试失败重试 ===")
+    attempts = []
+    
+    def handler(request):
+        attempts.append(request.url.path)
+        if len(attempts) == 1:
+            return httpx.Response(503, text="Service Unavailable")
+        if len(attempts) == 2:
+            return httpx.Response(429, json={"error": {"code": 10028, "message": "too_many_requests"}})
+        return httpx.Response(200, json={"result": {"mark_price": 100000.0}})
+    
+    client = make_client(handler, max_retries=3)
+    try:
+        assert client.run(client.get_spot_price("BTC")) == 100000.0
+        assert attempts == ["/api/v2/public/ticker"] * 3
+        print(f"重试后成功，共请求 {len(attempts)} 次")
+    finally:
+        client.close()
+
+def test_api_error_not_retried():
+    """参数错误等非临时性错误直接抛出"""
+    print("\n=== 测试API错误 ===")
+    attempts = []
+    
+    def handler(request):
+        attempts.append(request.url.path)
+        return httpx.Response(400, json={"error": {"code": 13020, "message": "value_error"}})
+    
+    client = make_client(handler, max_retries=3)
+    try:
+        client.run(client.get_instruments("BTC"))
+        assert False, "expected DeribitAPIError"
+    except DeribitAPIError as e:
+        assert e.code == 13020 and len(attempts) == 1
+        print(f"收到错误: {e}")
+    finally:
+        client.close()
+
+def test_timeout():
+    """挂起的请求在超时后失败，而不是无限等待"""
+    print("\n=== 测试请求超时 ===")
+    
+    async def handler(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200, json={"result": {}})
+    
+    client = make_client(handler, timeout=0.05, max_retries=1)
+    try:
+        client.run(client.get_book_summary("BTC"))
+        assert False, "expected timeout"
+    except asyncio.TimeoutError:
+        print("请求按时超时")
+    finally:
+        client.close()
+
+def test_bounded_concurrency():
+    """同时在途的请求数不超过 max_concurrency"""
+    print("\n=== 测试并发限制 ===")
+    in_flight = {"now": 0, "max": 0}
+    
+    async def handler(request):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        return httpx.Response(200, json={"result": {"instrument_name": request.url.params["instrument_name"]}})
+    
+    client = make_client(handler, max_concurrency=4)
+    try:
+        names = [f"BTC-TEST-{i}-C" for i in range(40)]
+        results = client.run(client.get_tickers(names))
+        assert [r["instrument_name"] for r in results] == names
+        assert in_flight["max"] <= 4
+        print(f"最大并发: {in_flight['max']}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    test_retry_on_server_error()
+    test_api_error_not_retried()
+    test_timeout()
+    test_bounded_concurrency()
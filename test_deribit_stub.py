@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+测试本地 Deribit 替身服务器：合成数据、错误注入、录制回放，以及完整的 GEX 计算（不访问真实API）
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import tempfile
+import time
+import deribit_client
+from deribit_client import DeribitClient, DeribitAPIError
+from deribit_stub import StubServer, fixture_key, load_fixtures, synthetic_fixtures
+
+def test_error_injection_and_retry():
+    print("=== 测试错误注入和重试 ===")
+    with StubServer(synthetic_fixtures(["BTC", "SOL"], expiries=2, strikes=5), error_rate=0.3, seed=1) as stub:
+        client = DeribitClient(base_url=stub.url, max_retries=10, backoff=0.001)
+        try:
+            assert client.run(client.get_spot_price("BTC")) == 100000.0
+            assert client.run(client.get_spot_price("SOL")) == 150.0
+            assert len(client.run(client.get_instruments("BTC"))) == 2 * 5 * 2
+            try:
+                client.run(client.get_ticker("BTC-UNKNOWN"))
+                assert False, "missing fixture should raise"
+            except DeribitAPIError as e:
+                assert e.code == 13020
+        finally:
+            client.close()
+        print(f"请求统计: {dict(stub.requests)}")
+        assert stub.requests["ticker"] > 1
+
+def test_record_replay():
+    print("\n=== 测试录制回放 ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fixtures.jsonl")
+        with StubServer(synthetic_fixtures(["ETH"], expiries=1, strikes=3)) as source:
+            client = DeribitClient(base_url=source.url, record_path=path)
+            try:
+                original = client.run(client.get_instruments("ETH"))
+                client.run(client.get_spot_price("ETH"))
+            finally:
+                client.close()
+        entries = load_fixtures(path)
+        assert [entry["method"] for entry in entries] == ["get_instruments", "ticker"]
+        # 模拟一天前的录制，回放时时间戳平移到现在
+        for entry in entries:
+            entry["ts"] -= 86400 * 1000
+
+        with StubServer(entries) as replay:
+            client = DeribitClient(base_url=replay.url)
+            try:
+                replayed = client.run(client.get_instruments("ETH"))
+                assert client.run(client.get_spot_price("ETH")) == 3500.0
+            finally:
+                client.close()
+        shift = replayed[0]["expiration_timestamp"] - original[0]["expiration_timestamp"]
+        assert abs(shift - 86400 * 1000) < 60 * 1000
+        assert [i["instrument_name"] for i in replayed] == [i["instrument_name"] for i in original]
+        print(f"回放 {len(entries)} 个响应，时间戳平移 {shift / 3600000:.2f} 小时")
+
+def test_gex_against_stub():
+    print("\n=== 测试完整GEX计算 ===")
+    from gex_calculator import calculate_gex_data, instrument_cache
+    with StubServer(synthetic_fixtures(["BTC"], expiries=3, strikes=20), latency=0.005, jitter=0.005) as stub:
+        previous = deribit_client._client
+        deribit_client._client = DeribitClient(base_url=stub.url)
+        instrument_cache.invalidate("BTC")
+        try:
+            result = calculate_gex_data("BTC")
+        finally:
+            deribit_client._client.close()
+            deribit_client._client = previous
+            instrument_cache.invalidate("BTC")
+        assert "error" not in result, result
+        assert result["spot_price"] == 100000.0 and len(result["data"]) > 0
+        print(f"{len(result['data'])} 个行权价，请求统计: {dict(stub.requests)}")
+
+def test_refresh_spot_matches_chain():
+    """完整刷新只请求一次现货价格，结果和缓存的期权链使用同一个现货；现货更新用新的现货重新定价"""
+    print("\n=== 测试完整刷新和现货更新的现货价格 ===")
+    os.environ.setdefault("GEX_SHARED_SNAPSHOTS", "0")
+    import main
+    from gex_calculator import instrument_cache
+    from history_store import GexHistoryStore
+    from test_history_store import open_test_redis
+    client = open_test_redis()
+    if client is None:
+        print("Redis 不可用，跳过")
+        return
+    spot_key = fixture_key("ticker", {"instrument_name": "BTC-PERPETUAL"})
+    with StubServer(synthetic_fixtures(["BTC"], expiries=2, strikes=10)) as stub:
+        previous = (deribit_client._client, main.history_store)
+        deribit_client._client = DeribitClient(base_url=stub.url)
+        main.history_store = GexHistoryStore(client)
+        instrument_cache.invalidate("BTC")
+        main.chains.pop(("BTC", None), None)
+        try:
+            full = main.get_processed_gex_data("BTC")
+            assert stub.requests["ticker"] == 1, dict(stub.requests)
+            assert full["spot_price"] == 100000.0
+            assert main.chains[("BTC", None)][1] == 100000.0
+
+            stub.responses[spot_key] = {**stub.responses[spot_key], "mark_price": 101000.0}
+            repriced = main.get_processed_gex_data("BTC", previous=full)
+            print(f"请求统计: {dict(stub.requests)}，零Gamma: {full['zero_gamma']} -> {repriced['zero_gamma']}")
+            assert stub.requests["ticker"] == 2 and stub.requests["get_book_summary_by_currency"] == 1
+            assert repriced["spot_price"] == 101000.0 and main.chains[("BTC", None)][1] == 101000.0
+            assert repriced["net_vol_gex"] != full["net_vol_gex"]
+        finally:
+            deribit_client._client.close()
+            deribit_client._client, main.history_store = previous
+            instrument_cache.invalidate("BTC")
+            main.chains.pop(("BTC", None), None)
+            client.flushall()
+
+if __name__ == "__main__":
+    test_error_injection_and_retry()
+    test_record_replay()
+    test_gex_against_stub()
+    test_refresh_spot_matches_chain()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+测试现货扫描的Gamma曲线和零Gamma求根
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import time
+import numpy as np
+from gex_calculator import ChainArrays, gex_contributions, time_to_expiry, RISK_FREE_RATE
+from gamma_profile import ChainPricer, gamma_profile
+
+def make_chain(n, seed=0):
+    """随机的单一到期日期权链，30天到期"""
+    rng = np.random.default_rng(seed)
+    now_ms = time.time() * 1000
+    chain = ChainArrays(
+        rng.uniform(60000, 140000, n).round(-3),
+        rng.random(n) > 0.5,
+        np.ones(n),
+        rng.uniform(0, 500, n),
+        rng.uniform(0, 100, n),
+        rng.uniform(0.3, 0.9, n),
+        np.full(n, now_ms + 30 * 86400 * 1000)
+    )
+    return chain, now_ms
+
+def test_profile_matches_gex_contributions():
+    """网格中心（当前现货）的净GEX与 gex_contributions 求和一致"""
+    print("=== 测试 gamma profile 与单点计算一致 ===")
+    chain, now_ms = make_chain(300)
+    spot = 100000.0
+    profile = gamma_profile(chain, spot, points=101, now_ts=now_ms)
+    gex_oi, gex_vol = gex_contributions(
+        spot, chain.strike, time_to_expiry(chain.expiration_ts, now_ms), RISK_FREE_RATE,
+        chain.sigma, chain.is_call, chain.contract_size, chain.open_interest, chain.volume
+    )
+    assert profile["spots"][50] == spot
+    assert np.isclose(profile["net_oi_gex"][50], gex_oi.sum(), rtol=1e-9)
+    assert np.isclose(profile["net_vol_gex"][50], gex_vol.sum(), rtol=1e-9)
+    print(f"net_oi_gex: {profile['net_oi_gex'][50]:.4f}, net_vol_gex: {profile['net_vol_gex'][50]:.4f}")
+
+def test_zero_gamma_root():
+    """零Gamma处净GEX为零，且离现货最近"""
+    print("\n=== 测试零Gamma求根 ===")
+    now_ms = time.time() * 1000
+    # 低行权价的看跌、高行权价的看涨：净GEX随现货从负变正
+    chain = ChainArrays(
+        np.array([90000.0, 110000.0]), np.array([False, True]), np.ones(2),
+        np.array([100.0, 100.0]), np.array([50.0, 50.0]), np.array([0.5, 0.5]),
+        np.full(2, now_ms + 30 * 86400 * 1000)
+    )
+    profile = gamma_profile(chain, 100000.0, now_ts=now_ms)
+    zero_gamma = profile["zero_gamma"]
+    assert zero_gamma is not None and 90000 < zero_gamma < 110000
+    pricer = ChainPricer(chain, now_ms)
+    below, above = pricer.net_gex([zero_gamma - 1, zero_gamma + 1], "oi")
+    assert below < 0 < above
+    print(f"零Gamma: {zero_gamma:.2f}")
+
+def test_zero_gamma_without_volume():
+    """没有成交量时 Volume 口径的曲线全为零，零Gamma为 None（与 zero_crossing 一致）"""
+    print("\n=== 测试全零曲线 ===")
+    chain, now_ms = make_chain(100)
+    chain = chain._replace(volume=np.zeros(100))
+    profile = gamma_profile(chain, 100000.0, now_ts=now_ms)
+    assert not any(profile["net_vol_gex"])
+    assert profile["zero_gamma_vol"] is None
+    pricer = ChainPricer(chain, now_ms)
+    # 恰好为零且与非零点相邻的网格点仍是零点
+    spots = np.array([1.0, 2.0, 3.0, 4.0])
+    assert pricer.zero_gamma(spots, np.array([-1.0, 0.0, 0.0, 0.0]), 3.0) == 2.0
+    print(f"零Gamma (OI): {profile['zero_gamma']}, 零Gamma (Volume): {profile['zero_gamma_vol']}")
+
+def test_profile_speed():
+    """200个现货 × 700个合约"""
+    print("\n=== 测试 gamma profile 性能 ===")
+    chain, now_ms = make_chain(700)
+    gamma_profile(chain, 100000.0, now_ts=now_ms)
+    start = time.perf_counter()
+    gamma_profile(chain, 100000.0, points=200, now_ts=now_ms)
+    elapsed = (time.perf_counter() - start) * 1000
+    assert elapsed < 50
+    print(f"耗时: {elapsed:.1f} ms")
+
+if __name__ == "__main__":
+    test_profile_matches_gex_contributions()
+    test_zero_gamma_root()
+    test_zero_gamma_without_volume()
+    test_profile_speed()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+测试WebSocket实时GEX：用本地回放服务器推送录制的ticker消息（不访问真实API）
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import asyncio
+import threading
+import time
+import numpy as np
+from instrument_cache import InstrumentMetadata
+from gex_stream import LiveChain, DeribitStream, STREAM_INTERVAL
+from gex_calculator import StrikeGex, summarize_gex
+from strike_aggregate import StrikeAggregate
+from ws_replay import ReplayServer
+
+EXPIRATION_TS = int((time.time() + 7 * 24 * 3600) * 1000)
+SPOT = 100000.0
+
+def make_metadata(currency="BTC", prefix="BTC", strikes=range(80000, 122000, 2000)):
+    instruments = [
+        {"instrument_name": f"{prefix}-TEST-{strike}-{t[0].upper()}", "strike": float(strike), "option_type": t,
+         "expiration_timestamp": EXPIRATION_TS, "contract_size": 1.0}
+        for strike in strikes for t in ("call", "put")
+    ]
+    return InstrumentMetadata(currency, instruments, time.time())
+
+def make_quotes(metadata, seed):
+    rng = np.random.default_rng(seed)
+    return {
+        name: {"open_interest": float(rng.integers(0, 500)), "volume": float(rng.integers(0, 100)), "mark_iv": float(rng.uniform(30, 90))}
+        for name in metadata.index
+    }
+
+def assert_same_gex(a, b):
+    assert [d["strike"] for d in a["data"]] == [d["strike"] for d in b["data"]]
+    for x, y in zip(a["data"], b["data"]):
+        for field in x:
+            assert np.isclose(x[field], y[field], rtol=1e-6, atol=1e-9), (field, x, y)
+    for field in ["net_oi_gex", "net_vol_gex", "call_wall", "put_wall", "zero_gamma"]:
+        assert (a[field] is None and b[field] is None) or np.isclose(a[field], b[field]), (field, a[field], b[field])
+
+def test_incremental_updates_match_full_recompute():
+    """逐个合约增量更新的结果应与按最终行情全量计算一致"""
+    print("=== 测试增量更新 ===")
+    metadata = make_metadata()
+    initial, final = make_quotes(metadata, 1), make_quotes(metadata, 2)
+    final["BTC-TEST-100000-C"]["mark_iv"] = 0  # 更新后变为无效隐含波动率
+    
+    chain = LiveChain("BTC", metadata, SPOT, initial)
+    for name, quote in final.items():
+        chain.apply_quote(name, **quote)
+    expected = LiveChain("BTC", metadata, SPOT, final)
+    assert_same_gex(chain.snapshot(), expected.snapshot())
+    print(f"{len(final)} 次增量更新后与全量计算一致")
+
+def test_strike_aggregate_matches_summarize_gex():
+    """随机更新单个行权价后，增量维护的指标应与 summarize_gex 全量计算一致"""
+    print("\n=== 测试行权价增量汇总 ===")
+    rng = np.random.default_rng(5)
+    strikes = [float(k) for k in range(80000, 122000, 2000)]
+    aggregate = StrikeAggregate(strikes)
+    rows = {}
+    for step in range(500):
+        strike = strikes[rng.integers(len(strikes))]
+        if rng.random() < 0.2:
+            rows.pop(strike, None)
+            aggregate.set_strike(strike, 0)
+        else:
+            row = {
+                "oi_call_gex": float(rng.uniform(0, 5)), "oi_put_gex": -float(rng.uniform(0, 5)),
+                "vol_call_gex": float(rng.uniform(0, 2)) if rng.random() > 0.1 else 0.0,
+                "vol_put_gex": -float(rng.uniform(0, 2)) if rng.random() > 0.1 else 0.0,
+                "call_oi": int(rng.integers(0, 500)), "put_oi": int(rng.integers(0, 500)),
+                "call_volume": int(rng.integers(0, 100)), "put_volume": int(rng.integers(0, 100))
+            }
+            rows[strike] = row
+            aggregate.set_strike(strike, 2, **row)
+        
+        spot = float(rng.uniform(78000, 124000))
+        present = sorted(rows)
+        strike_gex = StrikeGex(np.array(present, dtype=float), *(
+            np.array([rows[k][field] for k in present], dtype=float) for field in StrikeGex._fields[1:]
+        ))
+        expected = summarize_gex(strike_gex, spot, "2025-01-01")
+        actual = aggregate.summary(spot, "2025-01-01")
+        if not rows:
+            assert actual["data"] == [] and expected["data"] == []
+            continue
+        assert_same_gex(actual, expected)
+        assert np.isclose(actual["total_oi_put_gex"], expected["total_oi_put_gex"])
+    print("500 次随机更新后指标一致")
+
+def ticker_message(name, data):
+    return {"jsonrpc": "2.0", "method": "subscription", "params": {"channel": f"ticker.{name}.{STREAM_INTERVAL}", "data": data}}
+
+def test_linear_usdc_instruments():
+    """线性 USDC 合约（SOL_USDC-...）的 ticker 消息更新 SOL 的期权链"""
+    print("\n=== 测试 USDC 合约消息 ===")
+    metadata = make_metadata("SOL", "SOL_USDC", range(120, 182, 2))
+    initial, final = make_quotes(metadata, 5), make_quotes(metadata, 6)
+    stream = DeribitStream(["SOL"])
+    stream.chains["SOL"] = LiveChain("SOL", metadata, 150.0, initial)
+    for name, q in final.items():
+        stream.handle_message(ticker_message(name, {"open_interest": q["open_interest"], "mark_iv": q["mark_iv"],
+                                                    "stats": {"volume": q["volume"]}}))
+    stream.handle_message({"jsonrpc": "2.0", "method": "subscription", "params": {
+        "channel": "deribit_price_index.sol_usd", "data": {"price": 151.5}}})
+    # 其它币种的合约不影响 SOL
+    stream.handle_message(ticker_message("XRP_USDC-TEST-1-C", {"open_interest": 1.0, "mark_iv": 50.0}))
+    live = stream.chains["SOL"]
+    assert live.spot_price == 151.5
+    live.reprice()
+    assert_same_gex(live.snapshot(), LiveChain("SOL", metadata, 151.5, final).snapshot())
+    print(f"{len(final)} 条 USDC 合约消息已应用")
+
+def test_stream_replay():
+    """DeribitStream 连接本地回放服务器，收到的消息应更新实时状态"""
+    print("\n=== 测试WebSocket回放 ===")
+    metadata = make_metadata()
+    initial, final = make_quotes(metadata, 3), make_quotes(metadata, 4)
+    messages = [
+        (i * 0.01, {"jsonrpc": "2.0", "method": "subscription", "params": {
+            "channel": f"ticker.{name}.{STREAM_INTERVAL}",
+            "data": {"instrument_name": name, "open_interest": q["open_interest"], "mark_iv": q["mark_iv"], "stats": {"volume": q["volume"]}}
+        }})
+        for i, (name, q) in enumerate(final.items())
+    ]
+    messages.append((1.0, {"jsonrpc": "2.0", "method": "subscription", "params": {
+        "channel": f"ticker.BTC-PERPETUAL.{STREAM_INTERVAL}", "data": {"mark_price": SPOT * 1.01}
+    }}))
+    
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(ReplayServer(messages).__aenter__(), loop).result()
+    stream = DeribitStream(["BTC"], url=server.url, bootstrap=lambda c: LiveChain(c, metadata, SPOT, initial))
+    try:
+        stream.start()
+        asyncio.run_coroutine_threadsafe(asyncio.wait_for(server.replayed.wait(), 10), loop).result()
+        deadline = time.time() + 5
+        while stream.chains["BTC"].spot_price != SPOT * 1.01 and time.time() < deadline:
+            time.sleep(0.01)
+        
+        live = stream.chains["BTC"]
+        live.reprice()
+        expected = LiveChain("BTC", metadata, SPOT * 1.01, final)
+        assert_same_gex(live.snapshot(), expected.snapshot())
+        print(f"回放 {len(messages)} 条消息后实时状态正确")
+    finally:
+        stream.stop()
+        asyncio.run_coroutine_threadsafe(server.__aexit__(None, None, None), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+if __name__ == "__main__":
+    test_incremental_updates_match_full_recompute()
+    test_strike_aggregate_matches_summarize_gex()
+    test_linear_usdc_instruments()
+    test_stream_replay()
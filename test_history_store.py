@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+测试 Redis 中的GEX历史：快照和标量指标的读写、max_change_gex、K线降采样、分辨率选择，
+以及多个进程写入同一根K线
+需要 fakeredis 或本地 Redis（15 号库），都不可用时跳过
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import asyncio
+from history_store import GexHistoryStore
+
+TEST_REDIS_URL = "redis://localhost:6379/15"
+
+def open_test_redis():
+    """fakeredis，否则本地 Redis 的 15 号库；都不可用时 None"""
+    try:
+        import fakeredis
+        return fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    except ImportError:
+        pass
+    import redis
+    client = redis.from_url(TEST_REDIS_URL)
+    try:
+        client.ping()
+    except Exception:
+        return None
+    return client
+
+def open_async_redis(client):
+    """与 client 连接同一个服务器的 redis.asyncio 客户端"""
+    server = client.connection_pool.connection_kwargs.get("server")
+    if server is not None:
+        import fakeredis
+        return fakeredis.FakeAsyncRedis(server=server)
+    import redis.asyncio
+    return redis.asyncio.from_url(TEST_REDIS_URL)
+
+def snapshot(ts, net_vol_gex):
+    return {"timestamp": ts, "net_vol_gex": net_vol_gex, "net_oi_gex": 2 * net_vol_gex, "zero_gamma": 100.0,
+            "call_wall": 110.0, "put_wall": 90.0, "spot_price": 100.0, "data": []}
+
+def cleanup(client, store, name):
+    client.delete(store.metrics_key(name), store.snapshots_key(name), *(store.bars_key(name, tier) for tier, _, _ in store.tiers))
+
+def test_record_round_trip():
+    """完整快照和标量指标写入后原样读回，max_change_gex 为各窗口之前最近一条的变化量"""
+    print("=== 测试历史写入和读取 ===")
+    client = open_test_redis()
+    if client is None:
+        print("Redis 不可用，跳过")
+        return
+    name = "test:ETH"
+    store = GexHistoryStore(client)
+    try:
+        now = 1_700_000_000.0
+        row = {"strike": 3000.0, "call_gex": 1.5, "put_gex": -0.5, "open_interest": 40.0, "volume": 4.0,
+               "call_oi": 30.0, "put_oi": 10.0, "call_volume": 3.0, "put_volume": 1.0}
+        first = {**snapshot(now - 600, 10.0), "data": [row], "expiration_date": "2023-11-15",
+                 "expirations": [{"expiration_date": "2023-11-15", "data": [row], "zero_gamma": None}]}
+        changes = store.record(name, first)
+        assert changes == {"1min": None, "5min": None, "10min": None, "15min": None, "30min": None}
+        store.record(name, snapshot(now - 120, 12.0), snapshot=False)
+        changes = store.record(name, {**snapshot(now, 15.0), "data": [row, {**row, "strike": 3100.0}]})
+        print(f"max_change_gex: {changes}")
+        # 1 分钟前最近的一条是 now-120（12），5 和 10 分钟前是 now-600（10），更早没有
+        assert changes == {"1min": 3.0, "5min": 5.0, "10min": 5.0, "15min": None, "30min": None}
+
+        latest = store.latest_snapshot(name)
+        assert latest["timestamp"] == now and [r["strike"] for r in latest["data"]] == [3000.0, 3100.0]
+        assert latest["data"][0] == row
+        # snapshot=False 只写标量指标：完整快照只有两条
+        assert client.zcard(store.snapshots_key(name)) == 2
+        assert store.latest_snapshot("test:none") is None
+
+        points = store.query(name, now - 700, now, "raw")
+        assert [(p["timestamp"], p["net_vol_gex"]) for p in points] == [(now - 600, 10.0), (now - 120, 12.0), (now, 15.0)]
+        assert points[0]["zero_gamma"] == 100.0 and points[0]["spot_price"] == 100.0
+        assert store.query(name, now - 200, now - 100, "raw")[0]["net_vol_gex"] == 12.0
+        try:
+            store.query(name, now - 700, now, "5m")
+            assert False, "unknown resolution should raise"
+        except ValueError:
+            pass
+    finally:
+        cleanup(client, store, name)
+
+def test_bars_across_boundary():
+    """K线的 open/high/low/close 和 count 按区间累积，跨区间时新开一根"""
+    print("=== 测试K线降采样 ===")
+    client = open_test_redis()
+    if client is None:
+        print("Redis 不可用，跳过")
+        return
+    name = "test:SOL"
+    store = GexHistoryStore(client)
+    try:
+        base = 1_700_000_000 - 1_700_000_000 % 900
+        # 第一个 1 分钟区间 4 个点，第二个区间 2 个点，都在同一个 15 分钟区间
+        for offset, value in [(0, 4.0), (10, 8.0), (20, 2.0), (50, 5.0), (60, 7.0), (100, 1.0)]:
+            store.record(name, snapshot(base + offset, value))
+        minute_bars = store.query(name, base, base + 900, "1m")
+        print(f"1m: {[(b['timestamp'] - base, b['open'], b['high'], b['low'], b['close'], b['count']) for b in minute_bars]}")
+        assert [(b["timestamp"], b["open"], b["high"], b["low"], b["close"], b["count"]) for b in minute_bars] == [
+            (base, 4.0, 8.0, 2.0, 5.0, 4), (base + 60, 7.0, 7.0, 1.0, 1.0, 2)]
+        assert minute_bars[1]["net_oi_gex"] == 2.0 and minute_bars[1]["spot_price"] == 100.0
+        (bar,) = store.query(name, base, base + 900, "15m")
+        assert (bar["open"], bar["high"], bar["low"], bar["close"], bar["count"]) == (4.0, 8.0, 1.0, 1.0, 6)
+        # 时间回退的点不改变K线
+        store.record(name, snapshot(base - 900, 100.0))
+        assert store.query(name, base, base + 900, "15m") == [bar]
+
+        # aquery 与 query 结果一致
+        points = asyncio.run(query_async(client, name, base, base + 900))
+        assert points == minute_bars
+    finally:
+        cleanup(client, store, name)
+
+async def query_async(client, name, start, end):
+    """用 aquery 查询 1 分钟K线"""
+    async_client = open_async_redis(client)
+    try:
+        return await GexHistoryStore(client, async_redis=async_client).aquery(name, start, end, "1m")
+    finally:
+        await async_client.aclose()
+
+def test_pick_resolution():
+    """选择能覆盖查询范围且点数不超过上限的最细分辨率"""
+    print("=== 测试分辨率选择 ===")
+    import redis
+    # 不访问 Redis
+    store = GexHistoryStore(redis.from_url(TEST_REDIS_URL))
+    now = 1_700_000_000.0
+    hour, day = 3600, 86400
+    cases = [
+        (now - 30 * 60, now, "raw"),              # 原始指标保留 1 小时
+        (now - 2 * hour, now, "1m"),              # 超出原始保留时间
+        (now - 20 * hour, now, "1m"),             # 1200 根 1 分钟K线
+        (now - 23 * hour, now - 22 * hour, "1m"),
+        (now - 2 * day, now, "15m"),              # 超出 1 分钟K线保留的 1 天
+        (now - 30 * day, now - 29 * day, "15m"),
+        (now - 200 * day, now, "15m"),            # 超出所有保留时间时用最粗的层级
+    ]
+    for start, end, expected in cases:
+        resolution = store.pick_resolution(start, end, now)
+        print(f"{(now - start) / hour:7.1f}h 前 ~ {(now - end) / hour:5.1f}h 前: {resolution}")
+        assert resolution == expected, (start, end, resolution)
+    # 1 分钟K线超过 max_points 时换成 15 分钟
+    assert store.pick_resolution(now - 20 * hour, now, now, max_points=1000) == "15m"
+
+def test_bars_merge_across_processes():
+    """两个进程交替写入（租约转移、或不共享快照的多个 worker），K线包含双方的每一次写入"""
+    print("=== 测试多个进程写入同一根K线 ===")
+    client = open_test_redis()
+    if client is None:
+        print("Redis 不可用，跳过")
+        return
+    name = "test:BTC"
+    first, second = GexHistoryStore(client), GexHistoryStore(client)
+    try:
+        base = 1_700_000_000 - 1_700_000_000 % 900
+        values = [5.0, 9.0, 1.0, 7.0, 3.0, 6.0]
+        for i, value in enumerate(values):
+            store = first if i in (0, 3, 4) else second
+            store.record(name, snapshot(base + 5 * i, value))
+        for tier in ("1m", "15m"):
+            bars = first.query(name, base, base + 60, tier)
+            print(f"{tier}: {bars}")
+            assert len(bars) == 1
+            bar = bars[0]
+            assert bar["count"] == len(values)
+            assert (bar["open"], bar["high"], bar["low"], bar["close"]) == (5.0, 9.0, 1.0, 6.0)
+    finally:
+        cleanup(client, first, name)
+
+if __name__ == "__main__":
+    test_record_round_trip()
+    test_bars_across_boundary()
+    test_pick_resolution()
+    test_bars_merge_across_processes()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+测试压测报告：延迟分位数、缓存命中率和上游请求数的统计
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from loadtest_gex import summarize
+
+def test_summarize():
+    print("=== 测试压测报告 ===")
+    records = [{"currency": "BTC", "selection": None, "latency": (i + 1) / 1000, "status": 200, "cache": "HIT", "error": None}
+               for i in range(95)]
+    records += [{"currency": "ETH", "selection": None, "latency": 1.0, "status": 200, "cache": "MISS", "error": None}
+                for _ in range(4)]
+    records.append({"currency": "ETH", "selection": None, "latency": 0.5, "status": 200, "cache": None, "error": "boom"})
+    report = summarize(records, 10.0, {"ticker": 5}, {"ticker": 9, "get_book_summary_by_currency": 2})
+
+    assert report["requests"] == 100 and report["errors"] == 1
+    assert abs(report["throughput_rps"] - 9.9) < 1e-9
+    assert report["cache"] == {"HIT": 95, "MISS": 4} and abs(report["cache_hit_ratio"] - 95 / 99) < 1e-9
+    assert report["by_cache"]["MISS"]["p50_ms"] == 1000.0
+    assert report["latency"]["p50_ms"] == 50.0 and report["latency"]["p99_ms"] > 900
+    assert report["upstream_requests"] == {"ticker": 4, "get_book_summary_by_currency": 2} and report["upstream_total"] == 6
+    print(f"p50 {report['latency']['p50_ms']:.1f} ms, p99 {report['latency']['p99_ms']:.1f} ms, 命中率 {report['cache_hit_ratio']:.1%}")
+
+if __name__ == "__main__":
+    test_summarize()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+测试指标：Prometheus 文本格式输出，以及 Deribit 客户端的延迟、错误和重试计数
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from metrics import DERIBIT_ERRORS, DERIBIT_REQUEST_SECONDS, DERIBIT_RETRIES, Registry
+from deribit_client import DeribitClient, DeribitAPIError
+from deribit_stub import StubServer, synthetic_fixtures
+
+def test_render():
+    print("=== 测试指标输出 ===")
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.gauge("age_seconds", "Age", lambda: [({"currency": 'B"TC'}, 3.5)])
+    requests.inc(result="hit")
+    requests.inc(2, result="hit")
+    latency.observe(0.05, stage="fetch")
+    latency.observe(0.5, stage="fetch")
+    latency.observe(5, stage="fetch")
+    text = registry.render()
+    print(text)
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'requests_total{result="hit"} 3.0' in text
+    assert 'latency_seconds_bucket{stage="fetch",le="0.1"} 1.0' in text
+    assert 'latency_seconds_bucket{stage="fetch",le="1.0"} 2.0' in text
+    assert 'latency_seconds_bucket{stage="fetch",le="+Inf"} 3.0' in text
+    assert 'latency_seconds_count{stage="fetch"} 3.0' in text
+    assert 'age_seconds{currency="B\\"TC"} 3.5' in text
+    # 同名指标只注册一次
+    assert registry.counter("requests_total", "Requests") is requests
+
+def test_deribit_client_metrics():
+    print("\n=== 测试Deribit请求指标 ===")
+    before = (DERIBIT_REQUEST_SECONDS.count(method="get_index_price"), DERIBIT_RETRIES.value(method="get_index_price"),
+              DERIBIT_ERRORS.value(method="get_index_price", reason="api_10028"),
+              DERIBIT_ERRORS.value(method="ticker", reason="api_13020"))
+    with StubServer(synthetic_fixtures(["SOL"], expiries=1, strikes=2), error_rate=0.5, seed=3) as stub:
+        client = DeribitClient(base_url=stub.url, max_retries=20, backoff=0.001)
+        try:
+            for _ in range(5):
+                client.run(client.get_spot_price("SOL"))
+            stub.error_rate = 0
+            try:
+                client.run(client.get_ticker("SOL-UNKNOWN"))
+            except DeribitAPIError:
+                pass
+        finally:
+            client.close()
+        attempts = stub.requests["get_index_price"]
+    requests, retries, throttled, not_found = (
+        DERIBIT_REQUEST_SECONDS.count(method="get_index_price") - before[0],
+        DERIBIT_RETRIES.value(method="get_index_price") - before[1],
+        DERIBIT_ERRORS.value(method="get_index_price", reason="api_10028") - before[2],
+        DERIBIT_ERRORS.value(method="ticker", reason="api_13020") - before[3],
+    )
+    print(f"请求 {requests} 次，重试 {retries} 次，限流错误 {throttled} 次")
+    assert requests == attempts and retries == throttled == attempts - 5 and not_found == 1
+
+if __name__ == "__main__":
+    test_render()
+    test_deribit_client_metrics()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+测试 /gex 的列式格式、msgpack 编码、压缩和编码缓存
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import gzip
+import json
+import msgpack
+from payload_encoding import (
+    JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, ROW_FIELDS, EncodedCache, choose_encoding, choose_media_type, to_columnar,
+    variant_tag
+)
+from snapshot_diff import etag_matches
+
+def make_payload(n=200):
+    rows = [dict(zip(ROW_FIELDS, [100.0 + i] + [float(i * k) for k in range(1, len(ROW_FIELDS))])) for i in range(n)]
+    return {"version": "1", "spot_price": 150.0, "zero_gamma": 140.0, "data": rows,
+            "expirations": [{"expiration_date": "2025-01-01", "data": rows[:3]}]}
+
+def test_columnar_roundtrip():
+    print("=== 测试列式格式 ===")
+    payload = make_payload()
+    columnar = to_columnar(payload)
+    rows = [dict(zip(ROW_FIELDS, values)) for values in zip(*(columnar["data"][f] for f in ROW_FIELDS))]
+    assert rows == payload["data"] and columnar["spot_price"] == 150.0 and columnar["format"] == "columnar"
+    assert columnar["expirations"][0]["data"]["strike"] == [100.0, 101.0, 102.0]
+    print(f"行式 {len(json.dumps(payload))} 字节，列式 {len(json.dumps(columnar))} 字节")
+
+def test_encoded_cache():
+    print("\n=== 测试编码缓存 ===")
+    payload = make_payload()
+    cache = EncodedCache()
+    body, encoding = cache.get("BTC", "1", payload, "rows", JSON_MEDIA_TYPE, "gzip")
+    assert encoding == "gzip" and json.loads(gzip.decompress(body)) == payload
+    again, _ = cache.get("BTC", "1", payload, "rows", JSON_MEDIA_TYPE, "gzip")
+    assert again is body and cache.hits == 1 and cache.misses == 1
+
+    body, encoding = cache.get("BTC", "1", payload, "columnar", MSGPACK_MEDIA_TYPE, None)
+    assert encoding is None and msgpack.unpackb(body)["data"]["strike"][0] == 100.0
+
+    # 新版本替换旧版本的所有编码
+    cache.get("BTC", "2", payload, "rows", JSON_MEDIA_TYPE, "gzip")
+    cache.get("BTC", "1", payload, "rows", JSON_MEDIA_TYPE, "gzip")
+    assert cache.misses == 4
+
+    # 旧版本的编码（例如比新快照晚完成）照常返回，但不替换新版本已缓存的编码
+    stale_body, _ = cache.get("BTC", "1", {"data": [], "version": "1"}, "columnar", JSON_MEDIA_TYPE, None)
+    assert json.loads(stale_body)["version"] == "1"
+    assert cache.peek("BTC", "2", "rows", JSON_MEDIA_TYPE, "gzip") is not None
+    assert cache.peek("BTC", "1", "columnar", JSON_MEDIA_TYPE, None) is None
+
+    # 太小的响应不压缩
+    _, encoding = cache.get("ETH", "1", {"data": []}, "rows", JSON_MEDIA_TYPE, "gzip")
+    assert encoding is None
+    print(f"命中 {cache.hits} 次，编码 {cache.misses} 次")
+
+def test_variant_etags():
+    print("\n=== 测试每种编码组合的 ETag ===")
+    variants = [(format, media_type, encoding) for format in ("rows", "columnar")
+                for media_type in (JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE) for encoding in (None, "gzip", "br")]
+    tags = [variant_tag("1700000000500-1700000001250", *variant) for variant in variants]
+    assert len(set(tags)) == len(variants)
+    # 只匹配同一版本、同一编码组合
+    assert etag_matches(f'"{tags[1]}"', tags[1])
+    assert not etag_matches(f'"{tags[0]}"', tags[1])
+    assert not etag_matches(f'"{variant_tag("1700000000500", "rows", JSON_MEDIA_TYPE, "gzip")}"', tags[1])
+    print(f"ETag 示例: {tags[:3]}")
+
+def test_negotiation():
+    assert choose_media_type("application/msgpack") == MSGPACK_MEDIA_TYPE
+    assert choose_media_type("application/json, text/plain, */*") == JSON_MEDIA_TYPE
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("identity") is None and choose_encoding(None) is None
+
+if __name__ == "__main__":
+    test_columnar_roundtrip()
+    test_encoded_cache()
+    test_variant_etags()
+    test_negotiation()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+测试 Deribit 请求限流：令牌桶速率、现货请求优先，以及对限流的替身服务器不触发 429
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import asyncio
+import time
+from deribit_client import DeribitClient
+from deribit_stub import StubServer, synthetic_fixtures
+from rate_limiter import PRIORITY_BULK, PRIORITY_SPOT, LocalTokenBucket, RateLimiter
+
+def test_token_bucket_rate():
+    print("=== 测试令牌桶速率 ===")
+    limiter = RateLimiter(LocalTokenBucket(capacity=5, refill_rate=50), cost=1)
+
+    async def run():
+        started = time.perf_counter()
+        await asyncio.gather(*(limiter.acquire() for _ in range(25)))
+        return time.perf_counter() - started
+    elapsed = asyncio.run(run())
+    print(f"25 个请求（突发 5，50/秒）耗时 {elapsed:.3f}s")
+    # 突发之后的 20 个请求按 50/秒放行
+    assert 0.35 < elapsed < 0.8
+
+def test_spot_priority():
+    print("=== 测试现货请求优先 ===")
+    limiter = RateLimiter(LocalTokenBucket(capacity=1, refill_rate=100), cost=1)
+    order = []
+
+    async def request(name, priority):
+        await limiter.acquire(priority)
+        order.append(name)
+
+    async def run():
+        bulk = [asyncio.create_task(request(f"bulk{i}", PRIORITY_BULK)) for i in range(10)]
+        await asyncio.sleep(0.03)
+        await asyncio.gather(request("spot", PRIORITY_SPOT), *bulk)
+    asyncio.run(run())
+    print(f"放行顺序: {order}")
+    # 排队中的批量请求之前最多放行了等待期间的几个
+    assert order.index("spot") <= 5
+    assert order.index("spot") < len(order) - 3
+
+def test_client_stays_under_upstream_limit():
+    print("=== 测试客户端不触发替身服务器的限流 ===")
+    entries = synthetic_fixtures(["BTC"], expiries=2, strikes=20)
+    with StubServer(entries, credits=(4000, 40000, 500)) as stub:
+        # 客户端留 10% 余量，请求到达服务器时的抖动不会超出额度
+        limiter = RateLimiter(LocalTokenBucket(capacity=3500, refill_rate=36000), cost=500)
+        client = DeribitClient(base_url=stub.url, max_retries=0, rate_limiter=limiter)
+        try:
+            names = [instrument["instrument_name"] for instrument in client.run(client.get_instruments("BTC"))]
+            started = time.perf_counter()
+            tickers = client.run(client.get_tickers(names))
+            elapsed = time.perf_counter() - started
+        finally:
+            client.close()
+        print(f"{len(names)} 个 ticker 耗时 {elapsed:.2f}s，被拒绝 {stub.throttled} 次")
+        assert len(tickers) == len(names) == 80
+        assert stub.throttled == 0
+        # 突发之后按 72/秒（上限 80/秒）
+        assert elapsed < len(names) / 72 * 1.5
+
+def test_unlimited_client_is_throttled():
+    print("=== 测试不限流时替身服务器返回 429 ===")
+    entries = synthetic_fixtures(["BTC"], expiries=2, strikes=20)
+    with StubServer(entries, credits=(4000, 40000, 500)) as stub:
+        client = DeribitClient(base_url=stub.url, max_retries=0, rate_limit=False)
+        try:
+            names = [instrument["instrument_name"] for instrument in client.run(client.get_instruments("BTC"))]
+            tickers = client.run(client.get_tickers(names))
+        finally:
+            client.close()
+        print(f"被拒绝 {stub.throttled} 次")
+        assert stub.throttled > 0
+        assert tickers.count(None) == stub.throttled
+
+def test_queue_wait_counts_toward_timeout():
+    print("=== 测试限流排队计入请求超时 ===")
+    entries = synthetic_fixtures(["BTC"], expiries=1, strikes=5)
+    with StubServer(entries) as stub:
+        limiter = RateLimiter(LocalTokenBucket(capacity=1, refill_rate=1), cost=1)
+        client = DeribitClient(base_url=stub.url, timeout=0.2, max_retries=3, backoff=0.001, rate_limiter=limiter,
+                               breaker_failures=1)
+        try:
+            assert client.run(client.get_spot_price("BTC")) == 100000.0
+            # 桶已空，下一个令牌 1 秒后才有：在超时内放弃，请求没有发出，不重试也不计为上游失败
+            started = time.perf_counter()
+            try:
+                client.run(client.get_spot_price("BTC"))
+                assert False, "queued request should time out"
+            except asyncio.TimeoutError:
+                elapsed = time.perf_counter() - started
+            print(f"排队 {elapsed * 1000:.0f} ms 后超时，请求统计: {dict(stub.requests)}")
+            assert 0.15 < elapsed < 0.5
+            assert stub.requests["ticker"] == 1
+            assert client.breakers.states() == {("ticker", "spot"): "closed"}
+            # 超时的请求离开队列，之后的请求正常放行
+            time.sleep(1)
+            assert client.run(client.get_spot_price("BTC")) == 100000.0
+            assert stub.requests["ticker"] == 2
+        finally:
+            client.close()
+
+if __name__ == "__main__":
+    test_token_bucket_rate()
+    test_spot_priority()
+    test_client_stays_under_upstream_limit()
+    test_unlimited_client_is_throttled()
+    test_queue_wait_counts_toward_timeout()
+    print("\n✅ 所有限流测试通过")
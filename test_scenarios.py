@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+测试现货 × 隐含波动率冲击的情景分析与逐个重新计算的结果一致
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import time
+import tracemalloc
+import numpy as np
+from gex_calculator import RISK_FREE_RATE, aggregate_by_strike, gex_contributions, summarize_gex, time_to_expiry
+from scenarios import run_scenarios
+from test_gamma_profile import make_chain
+
+def recompute(chain, spot, vol_shock, now_ms):
+    """按冲击后的现货和隐含波动率逐个合约计算并用 summarize_gex 汇总"""
+    gex_oi, gex_vol = gex_contributions(
+        spot, chain.strike, time_to_expiry(chain.expiration_ts, now_ms), RISK_FREE_RATE,
+        chain.sigma + vol_shock / 100, chain.is_call, chain.contract_size, chain.open_interest, chain.volume
+    )
+    strike_gex = aggregate_by_strike(chain.strike, chain.is_call, chain.open_interest, chain.volume, gex_oi, gex_vol)[0]
+    return summarize_gex(strike_gex, spot, None)
+
+def test_scenarios_match_recompute():
+    """每个情景格与重新计算的结果一致，且与分块大小无关"""
+    print("=== 测试情景分析 ===")
+    chain, now_ms = make_chain(200)
+    spot = 100000.0
+    spot_shocks = [-0.1, -0.02, 0.0, 0.05]
+    vol_shocks = [-40, -10, 0, 15]
+    result = run_scenarios(chain, spot, spot_shocks, vol_shocks, now_ts=now_ms)
+    chunked = run_scenarios(chain, spot, spot_shocks, vol_shocks, now_ts=now_ms, chunk_elements=300)
+    fields = ("net_oi_gex", "net_vol_gex", "call_wall", "put_wall", "zero_gamma")
+    for i, spot_shock in enumerate(spot_shocks):
+        for j, vol_shock in enumerate(vol_shocks):
+            expected = recompute(chain, spot * (1 + spot_shock), vol_shock, now_ms)
+            for field in fields:
+                value = result[field][i][j]
+                assert (value is None) == (expected[field] is None), (field, i, j)
+                if value is not None:
+                    assert np.isclose(value, expected[field], rtol=1e-9), (field, i, j)
+                    assert np.isclose(chunked[field][i][j], value, rtol=1e-12)
+    print(f"{len(spot_shocks) * len(vol_shocks)} 个情景格一致")
+
+def test_scenarios_memory():
+    """每个合约一个行权价时，按行权价汇总的内存不随 合约数 × 行权价数 增长"""
+    print("\n=== 测试情景分析内存 ===")
+    chain, now_ms = make_chain(4000)
+    chain = chain._replace(strike=np.linspace(50000.0, 150000.0, 4000))
+    tracemalloc.start()
+    try:
+        result = run_scenarios(chain, 100000.0, [-0.05, 0.0, 0.05], [-5, 0, 5], now_ts=now_ms)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    print(f"峰值内存: {peak / 1e6:.1f} MB")
+    # (合约 × 行权价) 的稠密矩阵需要 2 × 4000 × 4000 × 8 字节 = 256 MB
+    assert peak < 32e6
+    expected = recompute(chain, 100000.0, 0, now_ms)
+    assert np.isclose(result["net_vol_gex"][1][1], expected["net_vol_gex"], rtol=1e-9)
+    assert result["call_wall"][1][1] == expected["call_wall"] and result["put_wall"][1][1] == expected["put_wall"]
+
+def test_scenarios_speed():
+    """41 × 41 个情景格 × 700 个合约"""
+    print("\n=== 测试情景分析性能 ===")
+    chain, now_ms = make_chain(700)
+    start = time.perf_counter()
+    run_scenarios(chain, 100000.0, np.linspace(-0.1, 0.1, 41), np.linspace(-20, 20, 41), now_ts=now_ms)
+    print(f"耗时: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    test_scenarios_match_recompute()
+    test_scenarios_memory()
+    test_scenarios_speed()
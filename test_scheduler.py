@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+测试后台预计算调度器的 single-flight 和 stale-while-revalidate 行为
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from scheduler import SnapshotScheduler
+
+def test_single_flight():
+    """并发请求同一个 key 时只计算一次"""
+    print("=== 测试 single-flight ===")
+    calls = []
+    
+    def compute(key):
+        calls.append(key)
+        time.sleep(0.2)
+        return f"{key}-{len(calls)}"
+    
+    scheduler = SnapshotScheduler(compute)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        values = list(executor.map(lambda _: scheduler.get("BTC").value, range(16)))
+    assert calls == ["BTC"] and set(values) == {"BTC-1"}
+    print(f"16 个并发请求，计算 {len(calls)} 次")
+
+def test_stale_while_revalidate():
+    """结果过期后立即返回旧结果，并在后台刷新"""
+    print("\n=== 测试 stale-while-revalidate ===")
+    release = threading.Event()
+    calls = []
+    
+    def compute(key):
+        calls.append(key)
+        if len(calls) > 1:
+            release.wait(5)
+        return len(calls)
+    
+    scheduler = SnapshotScheduler(compute, max_age=0.05)
+    assert scheduler.get("ETH").value == 1
+    time.sleep(0.1)
+    started = time.time()
+    assert scheduler.get("ETH").value == 1  # 旧结果，不等待刷新
+    assert time.time() - started < 0.1
+    release.set()
+    deadline = time.time() + 5
+    while scheduler.latest("ETH").value != 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert scheduler.latest("ETH").value == 2
+    print("过期后先返回旧结果，后台刷新完成")
+
+def test_scheduled_refresh():
+    """预定的 key 在后台按间隔刷新，失败时保留上一次结果"""
+    print("\n=== 测试后台定时刷新 ===")
+    calls = []
+    
+    def compute(key):
+        calls.append(key)
+        if len(calls) == 2:
+            raise Exception("upstream error")
+        return len(calls)
+    
+    scheduler = SnapshotScheduler(compute, schedule={"BTC": 0.05})
+    scheduler.start()
+    try:
+        deadline = time.time() + 5
+        while len(calls) < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(calls) >= 4 and scheduler.latest("BTC").value >= 3
+        print(f"后台刷新 {len(calls)} 次")
+    finally:
+        scheduler.stop()
+
+def test_update_between_refreshes():
+    """两次完整计算之间按更短的间隔执行增量更新"""
+    print("\n=== 测试增量更新 ===")
+    full, updates = [], []
+    
+    def compute(key):
+        full.append(key)
+        return {"full": len(full), "updates": 0}
+    
+    def update(key, snapshot):
+        updates.append(key)
+        return {"full": snapshot.value["full"], "updates": snapshot.value["updates"] + 1}
+    
+    scheduler = SnapshotScheduler(compute, schedule={"BTC": 1.0}, update=update, update_interval=0.05)
+    scheduler.start()
+    try:
+        deadline = time.time() + 5
+        while len(updates) < 5 and time.time() < deadline:
+            time.sleep(0.01)
+        value = scheduler.latest("BTC").value
+        assert len(full) == 1 and value["full"] == 1 and value["updates"] >= 5
+        print(f"完整计算 {len(full)} 次，增量更新 {len(updates)} 次")
+    finally:
+        scheduler.stop()
+
+class MemoryShared:
+    """进程内的 SharedSnapshots 替身，多个调度器共用 state 模拟多个 worker"""
+
+    def __init__(self, state, worker_id):
+        self.state = state
+        self.worker_id = worker_id
+
+    def acquire(self, key, lease_seconds):
+        with self.state["lock"]:
+            holder, expires = self.state["leases"].get(key, (None, 0))
+            if holder not in (None, self.worker_id) and expires > time.time():
+                return False
+            self.state["leases"][key] = (self.worker_id, time.time() + lease_seconds)
+            return True
+
+    def release(self, key):
+        with self.state["lock"]:
+            if self.state["leases"].get(key, (None, 0))[0] == self.worker_id:
+                del self.state["leases"][key]
+
+    def publish(self, key, value, created_at):
+        self.state["snapshots"][key] = (created_at, value)
+
+    def created_at(self, key):
+        return self.state["snapshots"].get(key, (None, None))[0]
+
+    def load(self, key):
+        return self.state["snapshots"].get(key)
+
+def test_shared_leader():
+    """多个 worker 共享快照时，每个 key 只有持有租约的 worker 计算，其余采用发布的结果"""
+    print("\n=== 测试共享快照 ===")
+    state = {"lock": threading.Lock(), "leases": {}, "snapshots": {}}
+    calls = []
+
+    def make_worker(name):
+        def compute(key):
+            calls.append((name, key))
+            time.sleep(0.05)
+            return f"{key}-{name}-{len(calls)}"
+        return SnapshotScheduler(compute, schedule={"BTC": 0.1}, shared=MemoryShared(state, name),
+                                 shared_lease=0.3, shared_wait=2)
+
+    workers = [make_worker(name) for name in ("a", "b", "c")]
+    for worker in workers:
+        worker.start()
+    try:
+        time.sleep(0.6)
+        leaders = {name for name, _ in calls}
+        assert len(leaders) == 1
+        # 所有 worker 最终使用同一个发布的结果
+        time.sleep(0.15)
+        values = {worker.latest("BTC").value for worker in workers}
+        assert len(values) <= 2, values
+        print(f"leader {leaders}，计算 {len(calls)} 次")
+
+        # leader 停止后租约过期，由其它 worker 接管
+        leader = workers[["a", "b", "c"].index(leaders.pop())]
+        leader.stop()
+        calls.clear()
+        time.sleep(0.8)
+        assert calls and len({name for name, _ in calls}) == 1
+        print(f"接管后由 {calls[-1][0]} 计算")
+    finally:
+        for worker in workers:
+            worker.stop()
+
+    # 未预定的 key：并发的按需请求只计算一次
+    calls.clear()
+    workers = [make_worker(name) for name in ("a", "b", "c")]
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        values = list(executor.map(lambda worker: worker.get("ETH").value, workers))
+    assert len(calls) == 1 and len(set(values)) == 1
+    print(f"3 个 worker 同时请求 ETH，计算 {len(calls)} 次")
+
+def test_last_good_fallback():
+    """刷新失败时继续提供最近的结果并标记过期；没有结果时使用 fallback"""
+    print("=== 测试刷新失败时的最后一次成功结果 ===")
+    failing = [False]
+    failures = []
+
+    def compute(key):
+        if failing[0]:
+            raise Exception("upstream down")
+        return f"{key}-fresh"
+
+    scheduler = SnapshotScheduler(compute, max_age=60, fallback=lambda key: (time.time() - 120, f"{key}-saved"),
+                                  on_failure=lambda key, error: failures.append((key, str(error))))
+    assert scheduler.get("BTC").value == "BTC-fresh"
+    assert scheduler.stale_reason("BTC") is None
+
+    failing[0] = True
+    try:
+        scheduler.refresh("BTC")
+        assert False, "refresh should raise"
+    except Exception as e:
+        assert str(e) == "upstream down"
+    assert scheduler.get("BTC").value == "BTC-fresh"
+    assert scheduler.stale_reason("BTC") == "upstream down"
+    assert failures == [("BTC", "upstream down")]
+
+    # 没有本地结果：立即得到 fallback 的结果，标记为过期
+    snapshot = scheduler.get("ETH")
+    assert snapshot.value == "ETH-saved" and snapshot.age > 100
+    assert scheduler.stale_reason("ETH") == "upstream down"
+
+    # fallback 也没有结果时抛出原来的错误
+    scheduler.fallback = lambda key: None
+    try:
+        scheduler.get("SOL")
+        assert False, "get should raise without a fallback"
+    except Exception as e:
+        assert str(e) == "upstream down"
+
+    failing[0] = False
+    scheduler.refresh("BTC")
+    assert scheduler.stale_reason("BTC") is None
+    print(f"失败通知: {failures}")
+
+def test_failed_keys_not_retained():
+    """没有结果的未预定 key 失败后不留下状态，淘汰 key 时同时清除它的失败记录并通知 on_evict"""
+    print("=== 测试失败的 key 不会累积 ===")
+    failing = set()
+    evicted = []
+
+    def compute(key):
+        if key in failing:
+            raise ValueError(f"Unknown expiration: {key}")
+        return key
+
+    scheduler = SnapshotScheduler(compute, max_entries=2, on_evict=evicted.append)
+    for i in range(100):
+        failing.add(f"bad-{i}")
+        try:
+            scheduler.get(f"bad-{i}")
+            assert False, "get should raise"
+        except ValueError:
+            pass
+    assert scheduler._failures == {}
+
+    scheduler.get("a")
+    failing.add("a")
+    try:
+        scheduler.refresh("a")
+    except ValueError:
+        pass
+    assert scheduler.stale_reason("a") is not None
+    scheduler.get("b")
+    time.sleep(0.01)
+    scheduler.get("c")
+    # "a" 最旧，被淘汰时失败记录一起删除
+    assert scheduler.latest("a") is None and scheduler._failures == {}
+    assert evicted == ["a"]
+    print("100 个失败的 key 没有留下状态")
+
+if __name__ == "__main__":
+    test_single_flight()
+    test_stale_while_revalidate()
+    test_scheduled_refresh()
+    test_update_between_refreshes()
+    test_shared_leader()
+    test_last_good_fallback()
+    test_failed_keys_not_retained()
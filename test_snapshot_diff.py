@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+测试快照版本、ETag 匹配和增量 diff
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from snapshot_diff import VersionLog, diff_snapshots, etag_matches, snapshot_version, version_order
+
+def merge_changes(old, diff):
+    """合并一个结果（整体或单个到期日）的字段和行权价变化"""
+    new = {k: v for k, v in old.items() if k not in diff["removed"]}
+    new.update(diff["changed"])
+    rows = {row["strike"]: dict(row) for row in old.get("data", []) if row["strike"] not in diff["removed_strikes"]}
+    for row in diff["data"]:
+        rows.setdefault(row["strike"], {}).update(row)
+    new["data"] = [rows[strike] for strike in sorted(rows)]
+    return new
+
+def apply_diff(old, diff):
+    """客户端合并 diff 的参考实现（与前端 applyDiff 相同）"""
+    new = merge_changes(old, diff)
+    expiries = {expiry["expiration_date"]: expiry for expiry in old.get("expirations", [])
+                if expiry["expiration_date"] not in diff["removed_expirations"]}
+    for change in diff["expirations"]:
+        expiries[change["expiration_date"]] = merge_changes(expiries.get(change["expiration_date"], {}), change)
+    if "expirations" not in diff["removed"] and ("expirations" in old or diff["expirations"]):
+        new["expirations"] = [expiries[date] for date in new.get("expiration_dates", expiries)]
+    return new
+
+def expiry(date, zero_gamma, rows):
+    return {"expiration_date": date, "zero_gamma": zero_gamma, "call_wall": max(row[0] for row in rows),
+            "data": [{"strike": strike, "call_gex": call_gex, "put_gex": put_gex} for strike, call_gex, put_gex in rows]}
+
+def test_diff_roundtrip():
+    """只返回变化的字段和行权价，合并后与新快照一致"""
+    print("=== 测试增量 diff ===")
+    old = {
+        "timestamp": 1.0, "spot_price": 100.0, "zero_gamma": 95.0, "call_wall": 110.0,
+        "data": [
+            {"strike": 90.0, "call_gex": 1.0, "put_gex": -2.0, "call_oi": 5},
+            {"strike": 100.0, "call_gex": 3.0, "put_gex": -1.0, "call_oi": 7},
+            {"strike": 110.0, "call_gex": 4.0, "put_gex": 0.0, "call_oi": 9}
+        ]
+    }
+    new = {
+        "timestamp": 2.0, "spot_price": 101.0, "zero_gamma": 95.0, "put_wall": 90.0,
+        "data": [
+            {"strike": 100.0, "call_gex": 3.5, "put_gex": -1.0, "call_oi": 7},
+            {"strike": 110.0, "call_gex": 4.0, "put_gex": 0.0, "call_oi": 9},
+            {"strike": 120.0, "call_gex": 0.5, "put_gex": 0.0, "call_oi": 1}
+        ]
+    }
+    diff = diff_snapshots(old, new)
+    assert diff["changed"] == {"timestamp": 2.0, "spot_price": 101.0, "put_wall": 90.0}
+    assert diff["removed"] == ["call_wall"]
+    assert diff["data"] == [{"strike": 100.0, "call_gex": 3.5}, new["data"][2]]
+    assert diff["removed_strikes"] == [90.0]
+    assert apply_diff(old, diff) == new
+    print(f"变化的行权价: {[row['strike'] for row in diff['data']]}")
+
+def test_diff_expirations():
+    """多个到期日的结果按到期日、行权价分别 diff，而不是整体作为一个标量字段"""
+    print("\n=== 测试多个到期日的增量 diff ===")
+    unchanged = expiry("2026-10-30", 97.0, [(90.0, 1.0, -1.0), (100.0, 2.0, -2.0)])
+    old = {
+        "timestamp": 1.0, "expiration_date": "2026-10-23",
+        "expiration_dates": ["2026-10-23", "2026-10-24", "2026-10-30"],
+        "data": [{"strike": 100.0, "call_gex": 5.0, "put_gex": -4.0}],
+        "expirations": [
+            expiry("2026-10-23", 95.0, [(90.0, 1.0, -1.0), (100.0, 2.0, -2.0)]),
+            expiry("2026-10-24", 96.0, [(100.0, 1.0, -1.0), (110.0, 0.5, 0.0)]),
+            unchanged
+        ]
+    }
+    new = {
+        "timestamp": 2.0, "expiration_date": "2026-10-24",
+        "expiration_dates": ["2026-10-24", "2026-10-30", "2026-11-27"],
+        "data": [{"strike": 100.0, "call_gex": 5.5, "put_gex": -4.0}],
+        "expirations": [
+            expiry("2026-10-24", 96.0, [(100.0, 1.5, -1.0), (120.0, 0.1, 0.0)]),
+            unchanged,
+            expiry("2026-11-27", 99.0, [(100.0, 3.0, -3.0)])
+        ]
+    }
+    diff = diff_snapshots(old, new)
+    assert "expirations" not in diff["changed"]
+    assert diff["changed"] == {"timestamp": 2.0, "expiration_date": "2026-10-24",
+                               "expiration_dates": new["expiration_dates"]}
+    assert diff["removed_expirations"] == ["2026-10-23"]
+    # 没有变化的到期日不出现；到期日内只含变化的字段和行权价
+    assert [change["expiration_date"] for change in diff["expirations"]] == ["2026-10-24", "2026-11-27"]
+    changed_expiry, new_expiry = diff["expirations"]
+    assert changed_expiry["changed"] == {"call_wall": 120.0}
+    assert changed_expiry["data"] == [{"strike": 100.0, "call_gex": 1.5}, new["expirations"][0]["data"][1]]
+    assert changed_expiry["removed_strikes"] == [110.0]
+    assert new_expiry["changed"] == {"expiration_date": "2026-11-27", "zero_gamma": 99.0, "call_wall": 100.0}
+    assert new_expiry["data"] == new["expirations"][2]["data"]
+    assert apply_diff(old, diff) == new
+
+    # 只剩一个到期日时结果不再拆分
+    single = {k: v for k, v in new.items() if k not in ("expirations", "expiration_dates")}
+    diff = diff_snapshots(new, single)
+    assert sorted(diff["removed"]) == ["expiration_dates", "expirations"]
+    assert diff["expirations"] == [] and len(diff["removed_expirations"]) == 3
+    assert apply_diff(new, diff) == single
+    print(f"变化的到期日: {[change['expiration_date'] for change in diff_snapshots(old, new)['expirations']]}")
+
+def test_versions_and_etag():
+    print("\n=== 测试版本和 ETag ===")
+    version = snapshot_version({"timestamp": 1700000000.5})
+    live_version = snapshot_version({"timestamp": 1700000000.5, "stream_updated_at": 1700000001.25})
+    assert version == "1700000000500" and live_version == "1700000000500-1700000001250"
+    assert etag_matches(f'"{version}"', version)
+    assert etag_matches(f'W/"other", W/"{version}"', version)
+    assert etag_matches("*", version)
+    assert not etag_matches('"other"', version) and not etag_matches(None, version)
+
+    # 版本新旧：快照时间戳优先，其次实时数据时间戳，同一快照标记为过期的更新
+    stale_version = snapshot_version({"timestamp": 1700000000.5, "stale": True})
+    later_version = snapshot_version({"timestamp": 1700000060.5})
+    ordered = [later_version, live_version, version, stale_version]
+    assert sorted(ordered, key=version_order) == [version, stale_version, live_version, later_version]
+    assert version_order("10") > version_order("9")
+
+    log = VersionLog(max_versions=2)
+    for i in range(3):
+        log.publish("BTC", str(i), {"i": i})
+    assert log.get("BTC", "0") is None and log.get("BTC", "2") == {"i": 2}
+    print(f"版本: {version}, {live_version}")
+
+if __name__ == "__main__":
+    test_diff_roundtrip()
+    test_diff_expirations()
+    test_versions_and_etag()
@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
+import os
 import requests
 import json
 
+# 指向任意后端实例，例如连接本地 Deribit 替身服务器的后端
+GEX_API_URL = os.environ.get("GEX_API_URL", "http://localhost:8000")
+
 def test_tooltip_data():
     """测试后端API是否返回了新的持仓量和成交量数据字段"""
     try:
         # 测试BTC数据
-        response = requests.get("http://localhost:8000/gex?currency=BTC")
+        response = requests.get(f"{GEX_API_URL}/gex?currency=BTC")
         if response.status_code == 200:
             data = response.json()
             print("✅ API响应成功")